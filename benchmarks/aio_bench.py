@@ -0,0 +1,94 @@
+"""
+Latency of small javascript calls made from an event loop while large scripts are compiled concurrently:
+with `JSEngine.eval` blocking the loop against `aio.AsyncJSEngine` compiling in a thread pool. A ticker also
+measures the lag of the event loop. Half of the clients compile the same script(coalesced into one compile).
+
+usage: python -m benchmarks.aio_bench [clients(default: 16)] [functions(default: 400)]
+"""
+import asyncio
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from jsparser.aio import AsyncJSEngine
+from jsparser.engine import JSEngine, CompileCache
+from . import corpus
+
+
+g_small = "function add(a, b) { return a + b; }"
+
+
+def percentiles(times):
+    """ (p50, p99, max) of `times` in ms """
+    times = sorted(times)
+    return (statistics.median(times) * 1000, times[min(len(times) - 1, int(len(times) * 0.99))] * 1000,
+            times[-1] * 1000)
+
+
+async def ticker(lags, stop, interval=0.001):
+    """ the lag of every `interval` sleep of the event loop """
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - start - interval)
+
+
+async def load(evaluate, call, scripts, calls):
+    """ compile `scripts` concurrently with `calls` small calls, one every 2 ms, returns (call latencies, loop lags, seconds) """
+    lags, latencies, stop = [], [], asyncio.Event()
+    tick = asyncio.ensure_future(ticker(lags, stop))
+
+    async def caller(i):
+        scheduled = start + i * 0.002
+        await asyncio.sleep(i * 0.002)
+        await call("add", i, 1)
+        latencies.append(time.perf_counter() - scheduled)  # a blocked loop delays the call itself
+
+    start = time.perf_counter()
+    await asyncio.gather(*[evaluate(script) for script in scripts], *[caller(i) for i in range(calls)])
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await tick
+    return latencies, lags, elapsed
+
+
+def run(clients, functions, asynchronous):
+    scripts = [corpus.generate(functions, seed=i if i % 2 else 0) for i in range(clients)]
+    cache = CompileCache(maxsize=0)  # every run compiles
+    if asynchronous:
+        executor = ThreadPoolExecutor(8)  # more workers than compiles, the calls don't wait for them
+        engine = AsyncJSEngine({}, executor=executor, max_concurrency=4, cache=cache)
+        evaluate, call = engine.eval, engine.call
+    else:
+        engine = JSEngine({}, cache=cache)
+
+        async def evaluate(script):
+            await asyncio.sleep(0)
+            engine.eval(script)
+
+        async def call(name, *args):
+            return engine.get(name)(*args)
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(evaluate(g_small))
+        return loop.run_until_complete(load(evaluate, call, scripts, clients * 4))
+    finally:
+        loop.close()
+        if asynchronous:
+            executor.shutdown()
+
+
+def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    functions = int(sys.argv[2]) if len(sys.argv) > 2 else 400
+    print("%d clients compiling %d functions each, %d calls" % (clients, functions, clients * 4))
+    for name, asynchronous in (("blocking", False), ("async", True)):
+        latencies, lags, elapsed = run(clients, functions, asynchronous)
+        print("%-8s call p50 %8.2f ms p99 %8.2f ms max %8.2f ms | loop lag p50 %7.2f ms max %8.2f ms | total %7.1f ms"
+              % ((name,) + percentiles(latencies) + percentiles(lags)[::2] + (elapsed * 1000,)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""
+Memory used by the AST of a reference corpus of expression-heavy scripts, measured with tracemalloc.
+
+usage: python -m benchmarks.ast_memory_bench [num_functions]
+"""
+import sys
+import tracemalloc
+
+from jsparser import ast
+from jsparser import parser
+
+
+FUNCTION = """
+function f%(i)d(a, b, c) {
+    var d = a * %(i)d + b / 2.5 - c * (a + b) * (b - c);
+    var e = Math.max(d, a * b) + Math.min(c, d * 2) - (a + 1) * (b + 2) * (c + 3);
+    return d * e + a / (b + c) - (d - e) * %(i)d;
+}
+"""
+
+
+def main():
+    num_functions = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    code = "".join(FUNCTION % {"i": i} for i in range(num_functions))
+
+    tracemalloc.start()
+    ctx = {"globals": [], "functions": [], "externals": {"Math.max": "max", "Math.min": "min"}}
+    parser.parse_code_to_ast(code, ctx, backend="regex")
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    num_nodes = sum(1 for item in ctx['globals'] + ctx['functions'] for _ in ast.walk(item))
+    print("source:  %10d bytes" % len(code))
+    print("nodes:   %10d" % num_nodes)
+    print("AST:     %10d bytes (%.2fx source), %.1f bytes/node" % (current, current / len(code), current / num_nodes))
+    print("peak:    %10d bytes" % peak)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Peak RSS of the CLI transpiling a large generated bundle, the default mode(the whole input and output in
+memory, the output dumped to stdout too) against the large file mode(`--large`: mmap input, streamed output).
+Every run is a fresh process, which reports its own peak RSS.
+
+usage: python -m benchmarks.cli_memory_bench [functions(default: 20000)]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+
+from . import corpus
+
+
+g_run_cli = """
+import resource, sys
+from jsparser import cli
+if len(sys.argv) > 1:
+    sys.argv = ["jsparser"] + sys.argv[1:]
+    cli.main()
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, file=sys.stderr)
+"""
+
+
+def peak_rss_kib(args):
+    """ the peak RSS of the CLI run with `args`(only the imports without), in KiB(the unit of `ru_maxrss` on linux) """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, "-c", g_run_cli] + args, cwd=root, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, check=True)
+    return int(result.stderr.decode("ascii").split()[-1])
+
+
+def main():
+    functions = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_path = os.path.join(tmp_dir, "bundle.js")
+        with open(input_path, "w") as f:
+            for start in range(0, functions, 1000):  # written in pieces, not to hold the whole bundle here either
+                f.write(corpus.CorpusGenerator(min(1000, functions - start), seed=start).generate())
+        size = os.path.getsize(input_path)
+        print("bundle: %d functions, %.1f MiB" % (functions, size / 2 ** 20))
+
+        baseline = peak_rss_kib([])  # the interpreter and the imports
+        for name, args in (("default", []), ("--large", ["--large"])):
+            output_path = os.path.join(tmp_dir, "bundle%s.py" % name.strip("-"))
+            rss = peak_rss_kib([input_path, output_path] + args)
+            print("%-8s peak RSS %8.1f MiB (%6.1f MiB over the interpreter, %.2fx the input), output %.1f MiB"
+                  % (name, rss / 1024, (rss - baseline) / 1024, (rss - baseline) * 1024 / size,
+                     os.path.getsize(output_path) / 2 ** 20))
+
+
+if __name__ == "__main__":
+    main()
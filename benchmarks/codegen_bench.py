@@ -0,0 +1,48 @@
+"""
+Code generation throughput on deeply nested blocks.
+
+Every level of nesting adds the same amount of code, so the bytes/sec should
+stay flat as the depth grows(linear time code generation).
+
+usage: python -m benchmarks.codegen_bench [max_depth(default: 400)]
+"""
+import io
+import sys
+import time
+
+from jsparser import ast
+from jsparser import codegen
+
+
+def nested_function(depth, statements=4):
+    """ function f(a) { if (a > 0) { a = a + 1; ... if (a > 1) { ... } } } """
+    body = ast.BlockExprAST(depth + 1, [ast.ReturnExprAST(ast.VariableExprAST("a"))])
+    for level in range(depth, 0, -1):
+        exprs = [ast.BinaryExprAST(ast.VariableExprAST("a"), "=",
+                                   ast.BinaryExprAST(ast.VariableExprAST("a"), "+", ast.NumberExprAST(float(i))))
+                 for i in range(statements)]
+        cond = ast.BinaryExprAST(ast.VariableExprAST("a"), ">", ast.NumberExprAST(float(level)))
+        body = ast.BlockExprAST(level, exprs + [ast.IfExprAST(cond, body, None)])
+    return ast.FunctionAST(ast.PrototypeAST("f", ["a"]), body)
+
+
+def main():
+    max_depth = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    depth = 100
+    while depth <= max_depth:
+        ctx = {"globals": [], "functions": [nested_function(depth)]}
+        start = time.perf_counter()
+        code = codegen.generate_python_code(ctx)
+        elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        codegen.write_python_code(ctx, io.StringIO())
+        stream_elapsed = time.perf_counter() - start
+
+        print("depth %5d: %10d bytes, %8.2f ms, %6.1f MB/sec (streamed: %8.2f ms)"
+              % (depth, len(code), elapsed * 1000, len(code) / elapsed / 1e6, stream_elapsed * 1000))
+        depth *= 2
+
+
+if __name__ == "__main__":
+    main()
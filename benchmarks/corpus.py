@@ -0,0 +1,85 @@
+"""
+Generator of synthetic javascript programs for the benchmarks.
+
+The programs are reproducible(seeded) and scale along independent axes:
+    functions - number of top-level functions, every function calls the previous one, in chains of 10 calls
+    depth     - nesting depth of the `if` blocks in every function
+    expr_len  - number of operands of every arithmetic expression
+    comments  - number of `//` comment lines before every statement
+
+usage: python -m benchmarks.corpus [functions] [depth] [expr_len] [comments] > corpus.js
+"""
+import random
+import sys
+
+
+g_operators = ("+", "-", "*")
+
+
+class CorpusGenerator(object):
+
+    def __init__(self, functions: int = 200, depth: int = 3, expr_len: int = 8, comments: int = 1, seed: int = 0):
+        self.functions = functions
+        self.depth = depth
+        self.expr_len = expr_len
+        self.comments = comments
+        self._random = random.Random(seed)
+
+    def params(self):
+        return {"functions": self.functions, "depth": self.depth, "expr_len": self.expr_len, "comments": self.comments}
+
+    def expr(self, names):
+        """ a chain of `expr_len` operands, a division only by a constant so it never divides by zero """
+        rnd = self._random
+        parts = [rnd.choice(names)]
+        for _ in range(self.expr_len - 1):
+            if rnd.random() < 0.1:
+                parts.append("/ %d.5" % rnd.randint(1, 9))
+            else:
+                operand = rnd.choice(names) if rnd.random() < 0.6 else "%d.25" % rnd.randint(0, 99)
+                if rnd.random() < 0.2:
+                    operand = "(%s %s %s)" % (operand, rnd.choice(g_operators), rnd.choice(names))
+                parts.append("%s %s" % (rnd.choice(g_operators), operand))
+        return " ".join(parts)
+
+    def comment(self, indent, lines):
+        for i in range(self.comments):
+            lines.append("%s// comment %d of the statement below, with some words to skip" % (indent, i))
+
+    def function(self, index):
+        names = ["a", "b", "c", "d"]
+        lines = []
+        self.comment("", lines)
+        lines.append("function f%d(a, b, c) {" % index)
+        self.comment("    ", lines)
+        if index % 10 > 0:
+            lines.append("    var d = f%d(a, b, c) / 1024.5 + %s;" % (index - 1, self.expr(names[:3])))
+        else:
+            lines.append("    var d = %s;" % self.expr(names[:3]))
+        for level in range(1, self.depth + 1):
+            indent = "    " * level
+            lines.append("%sif (d > %d.5) {" % (indent, level))
+            self.comment(indent + "    ", lines)
+            lines.append("%s    d = Math.min(%s, 1000000);" % (indent, self.expr(names)))
+        for level in range(self.depth, 0, -1):
+            lines.append("%s}" % ("    " * level))
+        self.comment("    ", lines)
+        lines.append("    return Math.max(%s, 0 - 1000000);" % self.expr(names))
+        lines.append("}")
+        return "\n".join(lines) + "\n"
+
+    def generate(self) -> str:
+        return "".join(self.function(i) for i in range(self.functions))
+
+
+def generate(functions: int = 200, depth: int = 3, expr_len: int = 8, comments: int = 1, seed: int = 0) -> str:
+    return CorpusGenerator(functions, depth, expr_len, comments, seed).generate()
+
+
+def main():
+    args = [int(arg) for arg in sys.argv[1:5]]
+    sys.stdout.write(generate(*args))
+
+
+if __name__ == "__main__":
+    main()
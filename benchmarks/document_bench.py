@@ -0,0 +1,44 @@
+"""
+Latency of a one-line edit of a `document.Document`(only the edited function is parsed and executed again)
+against `JSEngine.eval` of the whole edited source, for growing sources: the edit latency should stay flat.
+
+usage: python -m benchmarks.document_bench [edits(default: 50)] [functions...(default: 50 200 800 3200)]
+"""
+import statistics
+import sys
+import time
+
+from jsparser.document import Document
+from jsparser.engine import JSEngine, CompileCache
+from . import corpus
+
+
+def edit_latency(doc, edits):
+    """ median time to edit the number of a line in the middle function, back and forth """
+    target = "function f%d(" % (len(doc) // 2)
+    offset = doc.text.index("1024.5", doc.text.index(target))
+    times = []
+    for i in range(edits):
+        start = time.perf_counter()
+        doc.edit(offset, offset + 6, "2048.5" if i % 2 == 0 else "1024.5")
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main():
+    edits = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    sizes = [int(arg) for arg in sys.argv[2:]] or [50, 200, 800, 3200]
+    for functions in sizes:
+        js_code = corpus.generate(functions)
+        doc = Document(JSEngine({}), js_code)
+        latency = edit_latency(doc, edits)
+        engine = JSEngine({}, cache=CompileCache(maxsize=0))
+        start = time.perf_counter()
+        engine.eval(doc.text)
+        full = time.perf_counter() - start
+        print("%5d functions %9d bytes: edit %8.2f ms, full eval %9.2f ms"
+              % (functions, len(js_code), latency * 1000, full * 1000))
+
+
+if __name__ == "__main__":
+    main()
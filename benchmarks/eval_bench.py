@@ -0,0 +1,41 @@
+"""
+Per-eval latency of a long-lived JSEngine.
+
+Streams many small scripts into one engine and reports the average eval() time for
+each window of scripts, the numbers should stay flat as the history grows.
+
+usage: python -m benchmarks.eval_bench [num_scripts] [window]
+"""
+import sys
+import time
+
+from jsparser.engine import JSEngine
+
+
+SCRIPT = """
+var v%(i)d = %(i)d;
+
+function f%(i)d(a, b) {
+    return a * b + v%(i)d;
+}
+"""
+
+
+def main():
+    num_scripts = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    window = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    engine = JSEngine({})
+    elapsed = 0.0
+    for i in range(num_scripts):
+        script = SCRIPT % {"i": i}
+        start = time.perf_counter()
+        engine.eval(script)
+        elapsed += time.perf_counter() - start
+        if (i + 1) % window == 0:
+            print("evals %6d-%6d: %8.3f ms/eval" % (i + 1 - window, i + 1, elapsed * 1000 / window))
+            elapsed = 0.0
+
+
+if __name__ == "__main__":
+    main()
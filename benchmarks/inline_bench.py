@@ -0,0 +1,53 @@
+"""
+Call overhead saved by inlining small helper functions(opt level 3) against opt level 2.
+
+The host calls `score` which calls the tiny helpers, every inlined call site saves a python call.
+
+usage: python -m benchmarks.inline_bench [calls(default: 200000)]
+"""
+import sys
+import time
+
+from jsparser import optimizer
+from jsparser import parser
+from jsparser.engine import JSEngine
+
+
+JS_CODE = """
+function add(a, b) { return a + b; }
+function mul(a, b) { return a * b; }
+function get_bar() { return bar; }
+
+function score(a, b) {
+    return add(mul(a, 2), mul(b, 3)) - add(a, get_bar()) + mul(add(a, b), get_bar());
+}
+"""
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+
+    ctx = parser.parse_code_to_ast(JS_CODE, {"globals": [], "functions": [], "externals": {}})
+    inliner = optimizer.Inliner(ctx)
+    for function_ast in ctx['functions']:
+        inliner.visit(function_ast)
+    print("inlined call sites: %d" % inliner.inlined)
+
+    results = {}
+    for level in (2, 3):
+        js_runtime = JSEngine({}, opt_level=level)
+        js_runtime.set("bar", 4)
+        js_runtime.eval(JS_CODE)
+        score = js_runtime.get("score")
+        start = time.perf_counter()
+        for i in range(calls):
+            score(i, 2)
+        results[level] = time.perf_counter() - start
+        print("-O%d %8.2f ms, %6.1f ns/call" % (level, results[level] * 1000, results[level] / calls * 1e9))
+    saved = results[2] - results[3]
+    print("saved %6.1f ns/call(%.1f ns per inlined call site), speedup: %.2fx"
+          % (saved / calls * 1e9, saved / calls / inliner.inlined * 1e9, results[2] / results[3]))
+
+
+if __name__ == "__main__":
+    main()
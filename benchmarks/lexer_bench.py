@@ -0,0 +1,58 @@
+"""
+Lexer throughput with the trace disabled(the default) and enabled.
+
+The enabled run writes the trace into os.devnull, which is roughly what the
+unconditional print() calls used to cost.
+
+usage: python -m benchmarks.lexer_bench [num_functions]
+"""
+import logging
+import os
+import sys
+import time
+
+from jsparser import lexer
+from jsparser import log
+
+
+FUNCTION = """
+// helper %(i)d
+function f%(i)d(a, b) {
+    var c = a * %(i)d + b / 2.5;
+    return Math.max(c, a - b);
+}
+"""
+
+
+def count_tokens(code):
+    lex = lexer.Lexer(lexer.StringBuffer(code))
+    count = 0
+    while lex.get_next_token() != lexer.Token.EOF:
+        count += 1
+    return count
+
+
+def measure(code):
+    start = time.perf_counter()
+    count = count_tokens(code)
+    return count, time.perf_counter() - start
+
+
+def main():
+    num_functions = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    code = "".join(FUNCTION % {"i": i} for i in range(num_functions))
+    print("source: %d bytes" % len(code))
+
+    count, disabled = measure(code)
+    print("trace disabled: %10.0f tokens/sec" % (count / disabled))
+
+    with open(os.devnull, "w") as devnull:
+        log.enable("lexer", handler=logging.StreamHandler(devnull))
+        count, enabled = measure(code)
+        log.disable("lexer")
+    print("trace enabled:  %10.0f tokens/sec" % (count / enabled))
+    print("gain: %.1fx" % (enabled / disabled))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+End-to-end JSEngine.eval latency of the two compilers:
+    source - generate python source code, then compile() parses it again
+    ast    - lower the AST straight into python AST nodes
+
+The compile cache is disabled so that every eval goes through the whole pipeline.
+
+usage: python -m benchmarks.lowering_bench [num_functions] [repeat]
+"""
+import sys
+import time
+
+from jsparser import codegen
+from jsparser import lowering
+from jsparser import parser
+from jsparser.engine import JSEngine, CompileCache
+
+
+FUNCTION = """
+function f%(i)d(a, b, c) {
+    var d = a * %(i)d + b / 2.5 - c * (a + b);
+    if (d > c) {
+        return Math.max(d, a * b);
+    }
+    return d - Math.min(c, 2);
+}
+"""
+
+
+def best_of(repeat, func):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    num_functions = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    code = "".join(FUNCTION % {"i": i} for i in range(num_functions))
+
+    results = {}
+    for compiler in ("source", "ast"):
+        engine = JSEngine({}, cache=CompileCache(maxsize=0), compiler=compiler)
+        results[compiler] = best_of(repeat, lambda: engine.eval(code))
+        print("eval %-6s %8.2f ms (best of %d, %d functions)" % (compiler, results[compiler] * 1000, repeat, num_functions))
+    print("eval ast speedup: %.2fx" % (results["source"] / results["ast"]))
+
+    # the backend alone, without the parser which both compilers share
+    ctx = parser.parse_code_to_ast(code, {"globals": [], "functions": [], "externals": {}})
+    source = best_of(repeat, lambda: compile(codegen.generate_python_code(ctx), "<jsparser>", "exec"))
+    ast = best_of(repeat, lambda: lowering.compile_ctx(ctx))
+    print("codegen + compile(source) %8.2f ms" % (source * 1000))
+    print("lower + compile(ast)      %8.2f ms" % (ast * 1000))
+
+
+if __name__ == "__main__":
+    main()
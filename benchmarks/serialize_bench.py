@@ -0,0 +1,31 @@
+"""
+Reload of a parsed corpus from the binary AST format(`jsparser.serialize`) against parsing its source again,
+and the size of the serialized AST against the size of the source.
+
+usage: python -m benchmarks.serialize_bench [functions(default: 300)] [repeat(default: 5)]
+"""
+import sys
+
+from jsparser import serialize
+from .suite import best_of, count_nodes, parse
+from . import corpus
+
+
+def main():
+    functions = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    js_code = corpus.generate(functions)
+    ctx = parse(js_code)
+    print("corpus: %d functions, %d bytes, %d nodes" % (functions, len(js_code), count_nodes(ctx)))
+
+    parse_seconds, _ = best_of(repeat, lambda: parse(js_code))
+    dump_seconds, data = best_of(repeat, lambda: serialize.dumps(ctx))
+    load_seconds, _ = best_of(repeat, lambda: serialize.loads(data))
+    print("%-8s %10.2f ms" % ("parse", parse_seconds * 1000))
+    print("%-8s %10.2f ms" % ("dump", dump_seconds * 1000))
+    print("%-8s %10.2f ms  (%.2fx faster than parse)" % ("load", load_seconds * 1000, parse_seconds / load_seconds))
+    print("%-8s %10d bytes  (%.2fx the source)" % ("size", len(data), len(data) / len(js_code)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Reproducible benchmark suite over a synthetic corpus(see `corpus`), it runs offline.
+
+Measures:
+    lexer    - tokens/sec of every lexer backend
+    parser   - AST nodes/sec
+    codegen  - bytes/sec of generated python code
+    eval     - JSEngine.eval latency of the whole corpus, the compile cache disabled
+    calls    - calls/sec of the transpiled functions
+
+Every measure is the best of `--repeat` runs. The results are written as JSON, a previous result
+file given to `--compare` is printed side by side to spot regressions across commits.
+
+usage: python -m benchmarks.suite [--functions N] [--depth N] [--expr-len N] [--comments N]
+                                  [--repeat N] [--output results.json] [--compare baseline.json]
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+
+from jsparser import __version__
+from jsparser import ast
+from jsparser import codegen
+from jsparser import lexer
+from jsparser import parser
+from jsparser.engine import JSEngine, CompileCache
+from . import corpus
+
+
+def best_of(repeat, func):
+    """ (best time, result of the last run) """
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def count_tokens(lexer_class, code):
+    lex = lexer_class(lexer.StringBuffer(code))
+    count = 0
+    while lex.get_next_token() != lexer.Token.EOF:
+        count += 1
+    return count
+
+
+def count_nodes(ctx):
+    return sum(sum(1 for _ in ast.walk(node)) for key in ("globals", "functions") for node in ctx[key])
+
+
+def parse(code):
+    return parser.parse_code_to_ast(code, {"globals": [], "functions": [], "externals": {"Math.max": "max", "Math.min": "min"}})
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode("ascii").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(generator, repeat):
+    code = generator.generate()
+    results = {}
+
+    for backend, lexer_class in lexer.g_lexer_backends.items():
+        seconds, tokens = best_of(repeat, lambda: count_tokens(lexer_class, code))
+        results["lexer_%s" % backend] = {"seconds": seconds, "tokens": tokens, "tokens_per_sec": tokens / seconds}
+
+    seconds, ctx = best_of(repeat, lambda: parse(code))
+    nodes = count_nodes(ctx)
+    results["parser"] = {"seconds": seconds, "nodes": nodes, "nodes_per_sec": nodes / seconds}
+
+    seconds, py_code = best_of(repeat, lambda: codegen.generate_python_code(ctx))
+    results["codegen"] = {"seconds": seconds, "bytes": len(py_code), "bytes_per_sec": len(py_code) / seconds}
+
+    engine = JSEngine({}, cache=CompileCache(maxsize=0))
+    seconds, _ = best_of(repeat, lambda: engine.eval(code))
+    results["eval"] = {"seconds": seconds}
+
+    functions = [engine.get("f%d" % i) for i in range(generator.functions)]
+    num_calls = max(1, 20000 // len(functions)) * len(functions)
+
+    def call_all():
+        for _ in range(num_calls // len(functions)):
+            for f in functions:
+                f(1.5, 2.5, 3.5)
+
+    seconds, _ = best_of(repeat, call_all)
+    results["calls"] = {"seconds": seconds, "calls": num_calls, "calls_per_sec": num_calls / seconds}
+
+    return {
+        "version": __version__,
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "corpus": dict(generator.params(), bytes=len(code)),
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def print_report(report, baseline=None, out=sys.stdout):
+    print("corpus: %s" % ", ".join("%s=%s" % item for item in report["corpus"].items()), file=out)
+    for name, result in report["results"].items():
+        old = baseline["results"].get(name) if baseline is not None else None
+        line = "%-12s %10.2f ms" % (name, result["seconds"] * 1000)
+        rates = [key for key in result if key.endswith("_per_sec")]
+        if rates:
+            line += "  %14.0f %s" % (result[rates[0]], rates[0])
+        if old is not None:
+            line += "  (%.2fx time of %s)" % (result["seconds"] / old["seconds"], (baseline.get("commit") or "baseline")[:10])
+        print(line, file=out)
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("--functions", type=int, default=200)
+    argparser.add_argument("--depth", type=int, default=3)
+    argparser.add_argument("--expr-len", type=int, default=8)
+    argparser.add_argument("--comments", type=int, default=1)
+    argparser.add_argument("--seed", type=int, default=0)
+    argparser.add_argument("--repeat", type=int, default=5)
+    argparser.add_argument("--output", help="write the results into this JSON file")
+    argparser.add_argument("--compare", help="JSON results of a previous run")
+    args = argparser.parse_args()
+
+    generator = corpus.CorpusGenerator(args.functions, args.depth, args.expr_len, args.comments, args.seed)
+    report = run(generator, args.repeat)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        if baseline.get("corpus") != report["corpus"]:
+            print("warning: the baseline was measured on another corpus", file=sys.stderr)
+    print_report(report, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Startup time and memory of many tenants running the same script with their own bindings:
+one JSEngine per tenant against isolated namespaces of a script compiled once(`JSEngine.instantiate`).
+
+usage: python -m benchmarks.tenants_bench [tenants(default: 50)] [functions(default: 100)]
+"""
+import sys
+import time
+import tracemalloc
+
+from jsparser.engine import JSEngine, shared_builtins
+from . import corpus
+
+
+def measure(name, tenants, create, traced=10):
+    """ the time to create every tenant, the memory of the first `traced` ones(tracing is slow) """
+    start = time.perf_counter()
+    namespaces = [create(i) for i in range(tenants)]
+    elapsed = time.perf_counter() - start
+    del namespaces
+    traced = min(traced, tenants)
+    tracemalloc.start()
+    namespaces = [create(i) for i in range(traced)]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print("%-20s %10.2f ms, per tenant: %10.1f us %8.1f KiB"
+          % (name, elapsed * 1000, elapsed / tenants * 1e6, size / traced / 1024))
+    return namespaces
+
+
+def main():
+    tenants = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    functions = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    js_code = corpus.generate(functions)
+    print("script: %d functions, %d bytes" % (functions, len(js_code)))
+
+    def engine_per_tenant(i):
+        js_runtime = JSEngine({"tenant": i})
+        js_runtime.eval(js_code)
+        return js_runtime
+
+    measure("engine per tenant", tenants, engine_per_tenant)
+
+    js_runtime = JSEngine({})
+    js_runtime.compile(js_code)
+    shared = shared_builtins({"scale": 1.5})
+    measure("instantiate", tenants, lambda i: js_runtime.instantiate(js_code, {"tenant": i}, shared))
+
+
+if __name__ == "__main__":
+    main()
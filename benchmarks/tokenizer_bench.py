@@ -0,0 +1,47 @@
+"""
+Throughput of the lexer backends("char" and "regex") on large generated inputs.
+
+usage: python -m benchmarks.tokenizer_bench [num_functions]
+"""
+import sys
+import time
+
+from jsparser import lexer
+
+
+FUNCTION = """
+// helper %(i)d
+// a second comment line
+function f%(i)d(alpha, beta) {
+    var gamma = alpha * %(i)d.25 + beta / 2.5;
+    return Math.max(gamma, alpha - beta);
+}
+"""
+
+
+def count_tokens(lexer_class, code):
+    lex = lexer_class(lexer.StringBuffer(code))
+    count = 0
+    while lex.get_next_token() != lexer.Token.EOF:
+        count += 1
+    return count
+
+
+def main():
+    num_functions = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    code = "".join(FUNCTION % {"i": i} for i in range(num_functions))
+    print("source: %d bytes" % len(code))
+
+    results = {}
+    for backend, lexer_class in lexer.g_lexer_backends.items():
+        start = time.perf_counter()
+        count = count_tokens(lexer_class, code)
+        elapsed = time.perf_counter() - start
+        results[backend] = elapsed
+        print("%-6s %8d tokens, %8.3f s, %10.0f tokens/sec, %6.1f MB/sec"
+              % (backend, count, elapsed, count / elapsed, len(code) / elapsed / 1e6))
+    print("regex speedup: %.1fx" % (results["char"] / results["regex"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+asyncio front of JSEngine: the parse, compile and calls run in an executor, so a large script doesn't block
+the event loop.
+
+    js_runtime = AsyncJSEngine({}, max_concurrency=4)
+    await js_runtime.eval(js_code)
+    result = await js_runtime.call("add", 1, 2)
+"""
+import asyncio
+from .engine import JSEngine, CompiledScript
+
+
+class _InFlight(object):
+    """ a compile shared by the coroutines waiting for the same source """
+
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class AsyncJSEngine(object):
+    """
+    Javascript runtime for asyncio code, over a JSEngine(`engine`).
+
+        executor        - the `concurrent.futures` executor running the compiles, the executions and the calls,
+                          a thread pool since they share the engine. None(default) is the loop's default executor,
+                          it should have more workers than `max_concurrency` so the calls don't wait for the compiles
+        max_concurrency - the number of compiles and executions running at the same time in the executor,
+                          the other ones wait without holding a worker(default 4). The calls are not limited
+        the other keyword arguments are the options of JSEngine
+
+    Concurrent compiles of the same source are coalesced into one in-flight compile. Cancelling a coroutine
+    cancels its work unless it already runs in the executor(a thread can't be interrupted, its result is then
+    dropped), a coalesced compile is cancelled with its last waiter.
+    """
+
+    def __init__(self, g: dict = None, executor=None, max_concurrency: int = 4, **options):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.engine = JSEngine(g, **options)
+        self._executor = executor
+        self._max_concurrency = max_concurrency
+        self._semaphore = None  # created in the running loop, on first use
+        self._loop = None  # the loop of `_semaphore`
+        self._compiling = {}  # js_code -> _InFlight
+
+    async def _run(self, func, *args):
+        """ `func(*args)` in the executor """
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def _run_bounded(self, func, *args):
+        """
+        `func(*args)` in the executor, once a slot of `max_concurrency` is free. The slots belong to one event
+        loop, the engine moves to another loop only once the previous one is closed.
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            if self._loop is not None and not self._loop.is_closed():
+                raise RuntimeError("AsyncJSEngine is bound to another event loop, which is still open")
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+            self._loop = loop
+        async with self._semaphore:
+            return await self._run(func, *args)
+
+    async def compile(self, js_code) -> CompiledScript:
+        """ `JSEngine.compile` in the executor, shared with the concurrent compiles of the same `js_code` """
+        in_flight = self._compiling.get(js_code)
+        if in_flight is None:
+            in_flight = self._compiling[js_code] = _InFlight(
+                asyncio.ensure_future(self._run_bounded(self.engine.compile, js_code)))
+            in_flight.task.add_done_callback(lambda _: self._forget(js_code, in_flight))
+        in_flight.waiters += 1
+        try:
+            return await asyncio.shield(in_flight.task)  # a cancelled waiter doesn't cancel the others' compile
+        except asyncio.CancelledError:
+            if in_flight.waiters == 1:
+                in_flight.task.cancel()
+                self._forget(js_code, in_flight)  # a new eval of the source starts its own compile
+            raise
+        finally:
+            in_flight.waiters -= 1
+
+    def _forget(self, js_code, in_flight: _InFlight):
+        """ remove the compile `in_flight` of `js_code`, unless a newer compile replaced it """
+        if self._compiling.get(js_code) is in_flight:
+            del self._compiling[js_code]
+
+    async def eval(self, js_code):
+        """ compile and execute `js_code`, like `JSEngine.eval` """
+        script = await self.compile(js_code)
+        await self._run_bounded(self.engine.execute, script, js_code)
+
+    async def call(self, name, *args):
+        """ call the javascript function `name` in the executor """
+        func = self.engine.get(name)
+        if func is None:
+            raise KeyError("%s is not defined" % name)
+        return await self._run(func, *args)
+
+    def in_flight(self) -> int:
+        """ the number of the distinct sources being compiled """
+        return len(self._compiling)
+
+    def set(self, key, val):
+        self.engine.set(key, val)
+
+    def set_all(self, values):
+        self.engine.set_all(values)
+
+    def get(self, key):
+        return self.engine.get(key)
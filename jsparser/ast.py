@@ -1,8 +1,16 @@
-from typing import List
+from typing import List, Optional, Tuple
+from . import codegen
+
+
+Span = Optional[Tuple[int, int]]  # (start, end) offsets of a statement in the javascript source, None for the nodes of
+# an expression and for a generated node
 
 
 class ExprAST(object):
-    pass
+    __slots__ = ("span",)  # no per-instance __dict__, the AST of large scripts is mostly made of small nodes
+
+    def __str__(self):
+        return codegen.to_source(self)
 
 
 class NumberExprAST(ExprAST):
@@ -12,11 +20,11 @@ class NumberExprAST(ExprAST):
              ^
            value
     """
-    def __init__(self, value: float):
-        self.value = value
+    __slots__ = ("value",)
 
-    def __str__(self):
-        return "%s" % (self.value,)
+    def __init__(self, value: float, span: Span = None):
+        self.span = span
+        self.value = value
 
 
 class VariableExprAST(ExprAST):
@@ -26,11 +34,11 @@ class VariableExprAST(ExprAST):
         ^
        name
     """
-    def __init__(self, name: str):
-        self.name = name
+    __slots__ = ("name",)
 
-    def __str__(self):
-        return "%s" % (self.name,)
+    def __init__(self, name: str, span: Span = None):
+        self.span = span
+        self.name = name
 
 
 class BinaryExprAST(ExprAST):
@@ -41,17 +49,14 @@ class BinaryExprAST(ExprAST):
        lhs | rhs
            op
     """
-    def __init__(self, lhs: ExprAST, op: str, rhs: ExprAST):
+    __slots__ = ("lhs", "op", "rhs")
+
+    def __init__(self, lhs: ExprAST, op: str, rhs: ExprAST, span: Span = None):
+        self.span = span
         self.lhs = lhs
         self.op = op
         self.rhs = rhs
 
-    def __str__(self):
-        if self.op != "=":  # TODO: remove unnecessary paren
-            return "(%s %s %s)" % (str(self.lhs), self.op, str(self.rhs))
-        else:
-            return "%s %s %s" % (str(self.lhs), self.op, str(self.rhs))
-
 
 class VariableDeclarationExprAST(BinaryExprAST):
     """
@@ -61,8 +66,10 @@ class VariableDeclarationExprAST(BinaryExprAST):
             |   rhs
         variable_expr
     """
-    def __init__(self, variable_expr: VariableExprAST, rhs: ExprAST):
-        BinaryExprAST.__init__(self, variable_expr, "=", rhs)
+    __slots__ = ()
+
+    def __init__(self, variable_expr: VariableExprAST, rhs: ExprAST, span: Span = None):
+        BinaryExprAST.__init__(self, variable_expr, "=", rhs, span)
 
 
 class ReturnExprAST(ExprAST):
@@ -72,11 +79,11 @@ class ReturnExprAST(ExprAST):
                 ^
                rhs
     """
-    def __init__(self, rhs: ExprAST):
-        self.rhs = rhs
+    __slots__ = ("rhs",)
 
-    def __str__(self):
-        return "return %s" % (str(self.rhs),)
+    def __init__(self, rhs: ExprAST, span: Span = None):
+        self.span = span
+        self.rhs = rhs
 
 
 class CallExprAST(ExprAST):
@@ -87,18 +94,13 @@ class CallExprAST(ExprAST):
          |    |- args -|
       callee
     """
-    def __init__(self, callee: str, args: List[ExprAST]):
+    __slots__ = ("callee", "args")
+
+    def __init__(self, callee: str, args: List[ExprAST], span: Span = None):
+        self.span = span
         self.callee = callee
         self.args = args
 
-    def __str__(self):
-        args_str = ""
-        for index, arg in enumerate(self.args):
-            args_str += str(arg)
-            if index < len(self.args) - 1:
-                args_str += ", "
-        return "%s(%s)" % (self.callee, args_str)
-
 
 class PrototypeAST(ExprAST):
     """
@@ -108,7 +110,10 @@ class PrototypeAST(ExprAST):
                   |    |- args -|
                  name
     """
-    def __init__(self, name: str, args: List[str]):
+    __slots__ = ("name", "args")
+
+    def __init__(self, name: str, args: List[str], span: Span = None):
+        self.span = span
         self.name = name
         self.args = args
 
@@ -123,14 +128,13 @@ class FunctionAST(ExprAST):
             var a = arg0 + arg1;            // <- body
         }
     """
-    def __init__(self, proto: PrototypeAST, body: ExprAST):
+    __slots__ = ("proto", "body")
+
+    def __init__(self, proto: PrototypeAST, body: ExprAST, span: Span = None):
+        self.span = span
         self.proto = proto
         self.body = body
 
-    def __str__(self):
-        print("self.body", self.body)
-        return "def %s(%s):\n%s\n\n" % (self.proto.name, ",".join(self.proto.args), str(self.body))
-
 
 class IfExprAST(ExprAST):
     """
@@ -141,17 +145,14 @@ class IfExprAST(ExprAST):
             b = 1.0;      // <- else_expr
         }
     """
-    def __init__(self, cond_expr: ExprAST, then_expr: ExprAST, else_expr: ExprAST):
+    __slots__ = ("cond_expr", "then_expr", "else_expr")
+
+    def __init__(self, cond_expr: ExprAST, then_expr: ExprAST, else_expr: ExprAST, span: Span = None):
+        self.span = span
         self.cond_expr = cond_expr
         self.then_expr = then_expr
         self.else_expr = else_expr
 
-    def __str__(self):
-        s = "if (%s):\n%s\n" % (str(self.cond_expr), str(self.then_expr))
-        if self.else_expr is not None:
-            s += "else:\n%s\n" % (str(self.else_expr))
-        return s
-
 
 class BlockExprAST(ExprAST):
     """
@@ -162,13 +163,33 @@ class BlockExprAST(ExprAST):
       indent
         }
     """
-    def __init__(self, indent: int, body_expr: List[ExprAST]):
+    __slots__ = ("indent", "body_expr")
+
+    def __init__(self, indent: int, body_expr: List[ExprAST], span: Span = None):
+        self.span = span
         self.indent = indent
         self.body_expr = body_expr
 
-    def __str__(self):
-        indent = "".join(map(lambda i: " ", range(0, self.indent * 4)))
-        s = ""
-        for expr in self.body_expr:
-            s += indent + str(expr) + "\n"
-        return s
+
+def iter_child_nodes(node: ExprAST):
+    """ yield the direct child nodes of `node` """
+    for cls in type(node).__mro__:
+        for name in getattr(cls, "__slots__", ()):
+            value = getattr(node, name)
+            if isinstance(value, ExprAST):
+                yield value
+            elif isinstance(value, list):
+                for item in value:
+                    if isinstance(item, ExprAST):
+                        yield item
+
+
+def walk(node: ExprAST):
+    """ yield `node` and all its descendants in pre-order, without recursion """
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        yield node
+        children = list(iter_child_nodes(node))
+        children.reverse()
+        stack.extend(children)
@@ -1,31 +1,312 @@
 import argparse
+import contextlib
+import glob
+import mmap
 import os
+import shutil
+import sys
+import tempfile
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from . import parser
 from . import codegen
+from . import log
+from . import optimizer
+from . import profiler
+from .diskcache import DiskCache
+from .errors import JSSyntaxError
+from .engine import cache_key
+
+
+g_externals = {
+    "Math.max": "max",
+    "Math.min": "min",
+}
+
+
+class Tee(object):
+    """ file-like object writing into several streams """
+
+    def __init__(self, *streams):
+        self._streams = streams
+
+    def write(self, s):
+        for stream in self._streams:
+            stream.write(s)
+
+
+@contextlib.contextmanager
+def replace_on_success(output_path):
+    """
+    Open a temporary file next to `output_path`, it replaces `output_path` when the block succeeds and is removed
+    when it raises(e.g. a syntax error), so a failed transpilation never leaves an empty or partial output.
+    """
+    tmp_path = "%s.%d.tmp" % (output_path, os.getpid())
+    try:
+        with open(tmp_path, "w") as f:
+            yield f
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def parse(js_code, opt_level=0, exports=None, stats=None, prof=None):
+    """
+    Parse and optimize `js_code`, with `exports` the unreachable functions are dropped(tree shaking).
+    `stats` is filled with the number of functions before and after tree shaking.
+    `prof` is a `profiler.Profiler` recording the phases.
+    """
+    ctx = { "globals": [], "functions": [], "externals": g_externals}
+    parser.parse_code_to_ast(js_code, ctx, profiler=prof)
+    with prof.phase("optimize") if prof is not None else profiler.g_null_phase:
+        optimizer.optimize(ctx, opt_level)
+    if stats is not None:
+        stats["functions"] = len(ctx['functions'])
+    if exports is not None:
+        optimizer.shake(ctx, exports)
+    if stats is not None:
+        stats["kept"] = len(ctx['functions'])
+    return ctx
+
+
+def transpile(js_code, opt_level=0, exports=None, stats=None):
+    return codegen.generate_python_code(parse(js_code, opt_level, exports, stats), minimal_parens=opt_level >= 1)
+
+
+def transpile_cached(js_code, cache_dir, opt_level=0, exports=None):
+    """ transpile through the disk cache in `cache_dir` """
+    disk_cache = DiskCache(cache_dir)
+    key = cache_key(js_code, g_externals, ("source", opt_level, tuple(sorted(exports)) if exports is not None else None))
+    py_code = disk_cache.load_source(key)
+    if py_code is None:
+        py_code = transpile(js_code, opt_level, exports)
+        disk_cache.store_source(key, py_code)
+    return py_code
+
+
+def transpile_large(input_path, output_path, opt_level=0):
+    """
+    Transpile a very large file in bounded memory: the input is mapped(`mmap`) and tokenized as bytes, every
+    definition is written as soon as it is parsed. The functions are spooled into a temporary file, then
+    appended after the global statements, so the output is the same as `transpile`.
+    The optimizations run per definition: up to `opt_level` 2, neither inlining nor tree shaking.
+    Returns the size of the output, which is only written if the whole input is parsed.
+    """
+    with open(input_path, "rb") as f, replace_on_success(output_path) as out, tempfile.TemporaryFile("w+") as spool:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+        try:
+            minimal_parens = opt_level >= 1
+            globals_emitter = codegen.PythonEmitter(out, minimal_parens=minimal_parens)
+            functions_emitter = codegen.PythonEmitter(spool, minimal_parens=minimal_parens)
+            for key, node in parser.parse_bytes(data, g_externals):
+                ctx = {"globals": [], "functions": [], key: [node]}
+                optimizer.optimize(ctx, opt_level)
+                if key == "functions":
+                    functions_emitter.emit_function(node)
+                else:
+                    globals_emitter.emit_statement(node.body)
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+        out.write("\n")  # the end of the global statements, see `codegen.PythonEmitter.emit_ctx`
+        spool.seek(0)
+        shutil.copyfileobj(spool, out)
+        return out.tell()
+
+
+def transpile_file(input_path, output_path, cache_dir=None, opt_level=0, exports=None):
+    """
+    Transpile one file, used as the unit of work of the batch mode.
+    Never raises, returns (input_path, output_path, seconds, error).
+    """
+    start = time.perf_counter()
+    try:
+        with open(input_path, "r") as f:
+            js_code = f.read()
+        output_dir = os.path.dirname(output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        with replace_on_success(output_path) as f:
+            if cache_dir is not None:
+                f.write(transpile_cached(js_code, cache_dir, opt_level, exports))
+            else:
+                codegen.write_python_code(parse(js_code, opt_level, exports), f, minimal_parens=opt_level >= 1)
+        error = None
+    except Exception as e:
+        if isinstance(e, JSSyntaxError):
+            e.filename = input_path
+        error = "%s: %s" % (type(e).__name__, e)
+    return input_path, output_path, time.perf_counter() - start, error
+
+
+def _glob_base(pattern):
+    """ the static directory prefix of a glob pattern, e.g.: `src/lib/**/*.js` -> `src/lib` """
+    parts = []
+    for part in pattern.split(os.sep):
+        if glob.has_magic(part):
+            break
+        parts.append(part)
+    return os.sep.join(parts)
+
+
+def _output_path(input_path, base_dir, out_dir):
+    if out_dir is None:
+        return os.path.splitext(input_path)[0] + ".py"
+    rel_path = os.path.relpath(input_path, base_dir or ".")
+    return os.path.join(out_dir, os.path.splitext(rel_path)[0] + ".py")
+
+
+def collect_jobs(inputs, manifest=None, out_dir=None):
+    """
+    Expand directories, glob patterns and the manifest file into a list of (input, output) pairs.
+
+    A manifest contains one `input.js [output.py]` entry per line, blank lines and lines
+    starting with `#` are ignored.
+    """
+    jobs = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, _, files in os.walk(item):
+                for name in sorted(files):
+                    if name.endswith(".js"):
+                        path = os.path.join(root, name)
+                        jobs.append((path, _output_path(path, item, out_dir)))
+        elif glob.has_magic(item):
+            base_dir = _glob_base(item)
+            for path in sorted(glob.glob(item, recursive=True)):
+                if os.path.isfile(path):
+                    jobs.append((path, _output_path(path, base_dir, out_dir)))
+        else:
+            jobs.append((item, _output_path(item, os.path.dirname(item), out_dir)))
+
+    if manifest is not None:
+        manifest_dir = os.path.dirname(manifest)
+        with open(manifest, "r") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                fields = line.split()
+                path = os.path.join(manifest_dir, fields[0])
+                if len(fields) > 1:
+                    jobs.append((path, os.path.join(out_dir or manifest_dir, fields[1])))
+                else:
+                    jobs.append((path, _output_path(path, manifest_dir, out_dir)))
+    return jobs
+
+
+def run_batch(jobs, workers=None, report=None, cache_dir=None, opt_level=0, exports=None):
+    """
+    Transpile all the (input, output) pairs with a process pool.
+    A failing file is reported and does not abort the batch, returns the list of results.
+    """
+    report = report or sys.stdout
+    results = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(transpile_file, input_path, output_path, cache_dir, opt_level, exports): (input_path, output_path)
+                   for input_path, output_path in jobs}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:  # e.g.: the worker process died
+                input_path, output_path = futures[future]
+                result = (input_path, output_path, 0.0, "%s: %s" % (type(e).__name__, e))
+            input_path, output_path, seconds, error = result
+            if error is None:
+                print("ok    %s -> %s (%.1f ms, %d bytes)"
+                      % (input_path, output_path, seconds * 1000, os.path.getsize(output_path)), file=report)
+            else:
+                print("FAIL  %s (%.1f ms): %s" % (input_path, seconds * 1000, error), file=report)
+            results.append(result)
+
+    failed = sum(1 for result in results if result[3] is not None)
+    print("%d files, %d failed, %.2f s" % (len(results), failed, time.perf_counter() - start), file=report)
+    return results
 
 
 def main():
     argparser = argparse.ArgumentParser()
-    argparser.add_argument("input", help="input file(*.js)")
-    argparser.add_argument("output", help="output file(*.py)")
+    argparser.add_argument("input", nargs="?", help="input file(*.js)")
+    argparser.add_argument("output", nargs="?", help="output file(*.py)")
+    argparser.add_argument("-b", "--batch", nargs="+", metavar="PATH",
+                           help="batch mode, transpile every *.js in these directories, glob patterns or files")
+    argparser.add_argument("-m", "--manifest", help="batch mode, file listing `input.js [output.py]` per line")
+    argparser.add_argument("-o", "--out-dir", help="batch mode, output directory(default: next to the input)")
+    argparser.add_argument("-j", "--jobs", type=int, default=None, help="batch mode, number of worker processes")
+    argparser.add_argument("--cache-dir", help="reuse the transpiled code cached in this directory")
+    argparser.add_argument("-O", "--opt-level", type=int, default=0, choices=(0, 1, 2, 3),
+                           help="optimization level: 0 none, 1 constant folding, 2 algebraic simplification, "
+                                "3 inlining of small functions")
+    argparser.add_argument("-e", "--export", action="append", metavar="NAME",
+                           help="tree shaking, only keep the functions reachable from this name or the globals")
+    argparser.add_argument("--large", action="store_true",
+                           help="large file mode: map the input(mmap) and write the output as it is generated, "
+                                "nothing is printed to stdout. Up to -O 2, without --export nor --cache-dir")
+    argparser.add_argument("--profile", action="store_true",
+                           help="print the time of every phase, the number of tokens and AST nodes to stderr")
+    argparser.add_argument("--trace", action="append", choices=log.SUBSYSTEMS, help="print the trace of a subsystem to stderr")
     args = argparser.parse_args()
 
+    if args.trace:
+        log.enable(*args.trace)
+
+    if args.batch or args.manifest:
+        jobs = collect_jobs(args.batch or [], args.manifest, args.out_dir)
+        results = run_batch(jobs, args.jobs, cache_dir=args.cache_dir, opt_level=args.opt_level,
+                            exports=args.export)
+        if any(result[3] is not None for result in results):
+            sys.exit(1)
+        return
+
+    if args.input is None or args.output is None:
+        argparser.error("the following arguments are required: input, output")
+
     if not os.path.exists(args.input):
         print("input file %s is not exists!" % args.input)
+        sys.exit(1)
 
-    externals = {
-        "Math.max": "max",
-        "Math.min": "min",
-    }
-    ctx = { "globals": [], "functions": [], "externals": externals}
-    with open(args.input, "r") as f:
-        parser.parse_code_to_ast(f.read(), ctx)
+    if args.large:
+        if args.opt_level >= 3 or args.export is not None or args.cache_dir is not None or args.profile:
+            argparser.error("--large supports up to -O 2, without --export, --cache-dir nor --profile")
+        try:
+            size = transpile_large(args.input, args.output, args.opt_level)
+        except JSSyntaxError as e:
+            e.filename = args.input
+            sys.stderr.write("".join(traceback.format_exception_only(type(e), e)))
+            sys.exit(1)
+        print("Success write code into output file %s(%d bytes)" % (args.output, size))
+        return
 
-    code = codegen.generate_python_code(ctx)
-    print(code)
-    with open(args.output, "w") as f:
-        f.write(code)
+    with open(args.input, "r") as f:
+        js_code = f.read()
+    start = time.perf_counter()
+    stats = {}
+    prof = profiler.Profiler() if args.profile else None
+    try:
+        with replace_on_success(args.output) as f:
+            out = Tee(f, sys.stdout)
+            if args.cache_dir is not None:
+                out.write(transpile_cached(js_code, args.cache_dir, args.opt_level, args.export))
+            else:
+                ctx = parse(js_code, args.opt_level, args.export, stats, prof)
+                with prof.phase("codegen") if prof is not None else profiler.g_null_phase:
+                    codegen.write_python_code(ctx, out, minimal_parens=args.opt_level >= 1)
+            size = f.tell()
+    except JSSyntaxError as e:
+        e.filename = args.input
+        sys.stderr.write("".join(traceback.format_exception_only(type(e), e)))  # the line of the error and a caret
+        sys.exit(1)
+    if prof is not None:
+        prof.count("code_size", size)
+        print(prof.format(), file=sys.stderr)
     print("Success write code into output file %s" % args.output)
+    if args.export is not None:
+        kept = "kept %d of %d functions, " % (stats["kept"], stats["functions"]) if stats else ""
+        print("tree shaking: %s%d bytes, %.2f ms" % (kept, size, (time.perf_counter() - start) * 1000), file=sys.stderr)
 
 
 if __name__ == "__main__":
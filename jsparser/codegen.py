@@ -1,10 +1,240 @@
+from . import log
+from . import split
 
-def generate_python_code(ctx):
-    code = ""
-    for g in ctx['globals']:
-        code += str(g.body) + "\n"
 
-    code += "\n"
-    for function_ast in ctx['functions']:
-        code += str(function_ast)
-    return code
+logger = log.get_logger("codegen")
+
+# python precedence of the binary operators, comparisons chain in python so they never nest without parentheses
+g_py_precedence = {
+    "<": 1,
+    ">": 1,
+    "+": 2,
+    "-": 2,
+    "*": 3,
+    "/": 3,
+}
+
+class PythonEmitter(object):
+    """
+    Visitor which translates the AST into python code.
+
+    The code is written as small fragments, either into a list which is joined once (`getvalue`),
+    or straight into a file-like object `out`. The indentation is tracked by the emitter itself.
+
+    Binary expressions are always wrapped in parentheses, unless `minimal_parens` is set, then
+    only the parentheses required by the operator precedence are emitted.
+
+    A statement whose expression is deeper than `split.g_max_expr_depth` nodes is split into statements assigning
+    its deep subexpressions to temporary variables, see `split.split_deep`.
+
+    Given the `lexer.LineIndex` of the javascript source(`ctx["lines"]`), `line_map` lists the javascript
+    line of every generated python line(None for the lines which are not generated from a node), to map
+    the line of a runtime error back to the javascript source.
+    """
+
+    def __init__(self, out=None, indent_width: int = 4, minimal_parens: bool = False, lines=None):
+        self._fragments = []
+        self._out = out
+        self._write = out.write if out is not None else self._fragments.append
+        self._indent_unit = " " * indent_width
+        self._indent = ""
+        self._trace = log.is_enabled(logger)
+        self._minimal_parens = minimal_parens
+        self._lines = lines
+        self.line_map = [] if lines is not None else None
+        self._new_temp = split.TempNames()
+
+    def getvalue(self) -> str:
+        return "".join(self._fragments)
+
+    def _end_line(self, node=None):
+        """ end the current python line, generated from `node` """
+        self._write("\n")
+        if self.line_map is not None:
+            span = node.span if node is not None else None
+            self.line_map.append(self._lines.position(span[0])[0] if span is not None else None)
+
+    def emit_ctx(self, ctx):
+        for g in ctx['globals']:
+            self.emit_statement(g.body)
+
+        self._end_line()
+        for function_ast in ctx['functions']:
+            if self._trace:
+                logger.debug("emit function %s", function_ast.proto.name)
+            self.emit_function(function_ast)
+
+    def emit_function(self, node):
+        self._emit([node])
+
+    def emit_suite(self, node):
+        """ emit the indented body of a `def`, `if` or `else` """
+        self._emit([("suite", node)])
+
+    def emit_statement(self, node):
+        self._emit([node])
+
+    def _emit(self, stack):
+        """
+        emit the statements on `stack`, last first, with an explicit stack so deeply nested blocks and `if`s
+        don't hit the recursion limit. Besides the nodes, the stack holds markers (action, node):
+        "suite" emits an indented suite, "dedent" restores the indentation `node`, "else" writes the `else:`
+        of the if statement `node` and "end" ends a function.
+        """
+        push = stack.append
+        pop = stack.pop
+        while stack:
+            node = pop()
+            if type(node) is tuple:
+                action, node = node
+                if action == "suite":
+                    push(("dedent", self._indent))
+                    self._indent += self._indent_unit
+                    if _node_type(node) != "BlockExprAST":
+                        push(node)
+                    elif node.body_expr:
+                        stack.extend(reversed(node.body_expr))
+                    else:
+                        self._write(self._indent + "pass")
+                        self._end_line(node)
+                elif action == "dedent":
+                    self._indent = node
+                elif action == "else":
+                    self._write(self._indent + "else:")
+                    self._end_line(node.else_expr)
+                else:
+                    self._end_line()
+                    self._end_line()
+                continue
+
+            node_type = _node_type(node)
+            if node_type == "BlockExprAST":  # python has no block scope, flatten it
+                stack.extend(reversed(node.body_expr))
+            elif node_type == "FunctionAST":
+                self._write("%sdef %s(%s):" % (self._indent, node.proto.name, ", ".join(node.proto.args)))
+                self._end_line(node)
+                push(("end", node))
+                push(("suite", node.body))
+            else:
+                # a statement too deep is dropped and split, it is written into the fragments or a buffer first
+                buffer = self._fragments if self._out is None else []
+                mark = len(buffer)
+                write = buffer.append
+                try:
+                    if node_type == "IfExprAST":
+                        write(self._indent + "if ")
+                        self._write_expr(write, node.cond_expr, 0, False, split.g_max_expr_depth)
+                        write(":")
+                    elif node_type == "ReturnExprAST":
+                        write(self._indent + "return ")
+                        self._write_expr(write, node.rhs, 0, False, split.g_max_expr_depth)
+                    else:
+                        write(self._indent)
+                        self._write_expr(write, node, 0, False, split.g_max_expr_depth)
+                except split.TooDeep:
+                    del buffer[mark:]
+                    stack.extend(reversed(split.split_deep(node, split.g_max_expr_depth, self._new_temp)))
+                    continue
+                if buffer is not self._fragments:
+                    self._write("".join(buffer))
+                self._end_line(node)
+                if node_type == "IfExprAST":
+                    if node.else_expr is not None:
+                        push(("suite", node.else_expr))
+                        push(("else", node))
+                    push(("suite", node.then_expr))
+
+    def emit_expr(self, node, parent_prec: int = 0, is_rhs: bool = False):
+        """ `parent_prec` and `is_rhs` tell where a binary expression is nested, for `minimal_parens` """
+        self._write_expr(self._write, node, parent_prec, is_rhs, float("inf"))
+
+    def _write_expr(self, write, node, parent_prec: int, is_rhs: bool, max_depth):
+        """
+        write the python code of an expression with an explicit stack of the fragments and right operands left
+        to write, so deep expressions don't hit the recursion limit: the loop goes down the left operands,
+        writing them as it goes. Raises split.TooDeep past `max_depth` nested nodes.
+        """
+        stack = [(node, parent_prec, is_rhs, 1)]
+        push = stack.append
+        pop = stack.pop
+        minimal_parens = self._minimal_parens
+        while stack:
+            item = pop()
+            if type(item) is str:
+                write(item)
+                continue
+            node, parent_prec, is_rhs, depth = item
+            while True:
+                if depth > max_depth:
+                    raise split.TooDeep()
+                node_type = type(node).__name__
+                if node_type == "VariableExprAST":
+                    write(node.name)
+                    break
+                if node_type == "NumberExprAST":
+                    write("%s" % (node.value,))
+                    break
+                depth += 1
+                if node_type == "BinaryExprAST" or node_type == "VariableDeclarationExprAST":
+                    op = node.op
+                    if op != "=":
+                        prec = g_py_precedence.get(op, 0)
+                        if minimal_parens:
+                            # operators are left-associative, so an equal precedence needs parentheses on the right side
+                            paren = parent_prec > prec or (is_rhs and parent_prec == prec) or (prec == 1 and parent_prec == 1)
+                        else:
+                            paren = True
+                    else:
+                        prec = 0
+                        paren = False
+                    if paren:
+                        write("(")
+                    rhs = node.rhs
+                    rhs_type = type(rhs).__name__
+                    if rhs_type == "VariableExprAST":  # the usual leaf is written with the operator, in one fragment
+                        push(" %s %s)" % (op, rhs.name) if paren else " %s %s" % (op, rhs.name))
+                    elif rhs_type == "NumberExprAST":
+                        push(" %s %s)" % (op, rhs.value) if paren else " %s %s" % (op, rhs.value))
+                    else:
+                        if paren:
+                            push(")")
+                        push((rhs, prec, True, depth))
+                        push(" %s " % op)
+                    node, parent_prec, is_rhs = node.lhs, prec, False
+                elif node_type == "CallExprAST":
+                    write(node.callee + "(")
+                    push(")")
+                    args = node.args
+                    for index in range(len(args) - 1, 0, -1):
+                        push((args[index], 0, False, depth))
+                        push(", ")
+                    if not args:
+                        break
+                    node, parent_prec, is_rhs = args[0], 0, False
+                else:
+                    raise TypeError("can not emit %s as a python expression" % node_type)
+
+
+def _node_type(node) -> str:
+    return type(node).__name__
+
+
+def to_source(node, minimal_parens: bool = False) -> str:
+    """ python code of a single node, without the trailing new line """
+    emitter = PythonEmitter(minimal_parens=minimal_parens)
+    if _node_type(node) in ("BlockExprAST", "FunctionAST", "IfExprAST", "ReturnExprAST"):
+        emitter.emit_statement(node)
+    else:
+        emitter.emit_expr(node)
+    return emitter.getvalue().rstrip("\n")
+
+
+def generate_python_code(ctx, minimal_parens: bool = False) -> str:
+    emitter = PythonEmitter(minimal_parens=minimal_parens)
+    emitter.emit_ctx(ctx)
+    return emitter.getvalue()
+
+
+def write_python_code(ctx, out, minimal_parens: bool = False):
+    """ stream the generated code into the file-like object `out` """
+    PythonEmitter(out, minimal_parens=minimal_parens).emit_ctx(ctx)
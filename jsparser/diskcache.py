@@ -0,0 +1,85 @@
+"""
+Persistent on-disk cache of transpiled scripts, similar to `__pycache__`.
+
+For every entry the cache directory holds:
+    <name>.py   - the generated python code
+    <name>.jsc  - the python magic number followed by the marshalled (symbols, code object, line map, dropped)
+
+`name` is derived from the cache key (hash of the javascript source and externals), the
+JSParser version and `g_format_version`, so upgrading JSParser never reuses stale entries.
+A .jsc written by another python version is ignored because of the magic number. Files are written
+to a temporary file and renamed into place, concurrent writers from several processes never expose
+partial files.
+"""
+import hashlib
+import importlib.util
+import marshal
+import os
+import tempfile
+from . import __version__
+
+# bump it whenever the generated code or the layout of the entries changes, even within a JSParser version:
+# 2 minimal parentheses, 3 `_jstmp` split statements, 4 line maps, 5 the dropped functions in the .jsc
+g_format_version = 5
+
+
+class DiskCache(object):
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: bytes, ext: str) -> str:
+        h = hashlib.sha256()
+        h.update(__version__.encode("utf-8"))
+        h.update(b"\0%d\0" % g_format_version)
+        h.update(key)
+        return os.path.join(self.directory, h.hexdigest() + ext)
+
+    def _read(self, path):
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write(self, path, data: bytes):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)  # atomic, the last writer wins with a complete file
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def load_source(self, key: bytes):
+        """ the generated python code, or None on a miss """
+        data = self._read(self._path(key, ".py"))
+        return data.decode("utf-8") if data is not None else None
+
+    def load_code(self, key: bytes):
+        """ (symbols, code object, line map, dropped), or None on a miss """
+        data = self._read(self._path(key, ".jsc"))
+        magic = importlib.util.MAGIC_NUMBER
+        if data is None or data[:len(magic)] != magic:
+            return None
+        try:
+            symbols, code, line_map, dropped = marshal.loads(data[len(magic):])
+        except (EOFError, ValueError, TypeError):  # corrupted entry
+            return None
+        return symbols, code, line_map, dropped
+
+    def store_source(self, key: bytes, py_code: str):
+        self._write(self._path(key, ".py"), py_code.encode("utf-8"))
+
+    def store_code(self, key: bytes, symbols, code, line_map=None, dropped=()):
+        """
+        `line_map` is the javascript line of every line of the code, see `codegen.PythonEmitter`,
+        `dropped` the names of the functions dropped by the tree shaking
+        """
+        self._write(self._path(key, ".jsc"),
+                    importlib.util.MAGIC_NUMBER + marshal.dumps((symbols, code, line_map, tuple(dropped))))
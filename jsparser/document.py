@@ -0,0 +1,134 @@
+"""
+Incremental reparse of a javascript source executed by a JSEngine, for hot reload: after an edit only the
+top-level definitions(functions and global statements) touched by the edit are parsed and executed again.
+
+    doc = Document(JSEngine({}), js_code)
+    doc.edit(start, end, "new text")  # replaces js_code[start:end]
+"""
+import bisect
+from . import ast
+from . import lexer
+from . import parser
+
+
+class Document(object):
+    """
+    A javascript source, parsed into its top-level definitions and executed by `engine`.
+
+    Every definition owns the source from where the parser resumed after the previous one to where it resumes
+    after this one, i.e. to the start of the next token it didn't consume(which may be inside the definition,
+    e.g. the `}` of a block in an expression). An edit is reparsed from the definition before the first touched
+    one(its end may depend on the tokens after it, e.g. an `else`), until the parser resumes where it resumed
+    after an old definition, past the edit: the source from that point didn't change, so neither do the
+    definitions parsed from it. Only the reparsed definitions are executed again, the function objects of the
+    other ones are kept.
+
+    The spans of the kept definitions are shifted lazily, `ctx` returns the AST of the whole source with the
+    spans up to date, equal to a full parse of `text`.
+
+    A definition removed from the source stays defined in the engine namespace, as with `JSEngine.eval`.
+    With inlining(opt_level 3), the functions calling a reparsed function are compiled again from their AST.
+    """
+
+    def __init__(self, engine, text: str = ""):
+        self.engine = engine
+        self.text = ""
+        self._externals = engine.externals()
+        self._keys = []  # "globals" | "functions" of every definition, in source order
+        self._nodes = []  # the FunctionAST of every definition
+        self._resumes = []  # where the parser resumes after every definition, in the current source
+        self._parsed_resumes = []  # the same when the definition was parsed, the spans of its nodes lag behind
+        self._line_ends = []  # the number of line ends in the source of every definition
+        if text:
+            self.edit(0, 0, text)
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def edit(self, start: int, end: int, text: str):
+        """
+        Replace the source [start, end) by `text`, reparse and execute again the touched definitions,
+        returns their new FunctionAST. A syntax error raises `errors.JSSyntaxError` and leaves the document as it was.
+        """
+        if not 0 <= start <= end <= len(self.text):
+            raise ValueError("edit [%d, %d) out of the source of %d chars" % (start, end, len(self.text)))
+        new_text = self.text[:start] + text + self.text[end:]
+        delta = len(text) - (end - start)
+        resumes = self._resumes
+        lo = max(bisect.bisect_left(resumes, start) - 1, 0)
+        reparse_start = resumes[lo - 1] if lo > 0 else 0
+
+        ctx = {"globals": [], "functions": [], "externals": self._externals}
+        lex = lexer.Lexer(lexer.StringBuffer(new_text, reparse_start))
+        keys, nodes, new_resumes = [], [], []
+        hi = len(resumes)
+        j = bisect.bisect_left(resumes, end)  # the old definitions resuming after the edit
+        for key, node in parser.Parser(lex, ctx).iter_parse():
+            keys.append(key)
+            nodes.append(node)
+            new_resumes.append(lex.token_start)
+            old_resume = lex.token_start - delta
+            while j < len(resumes) and resumes[j] < old_resume:
+                j += 1
+            if j < len(resumes) and resumes[j] == old_resume and lex.token_start >= start + len(text):
+                hi = j + 1  # in sync with the old definitions again
+                break
+
+        while nodes and lo < hi and new_resumes[0] == resumes[lo] <= start:
+            del keys[0], nodes[0], new_resumes[0]  # the definition before the edit didn't change, keep it
+            lo += 1
+        reparse_start = resumes[lo - 1] if lo > 0 else 0
+        old_names = {node.proto.name for key, node in zip(self._keys[lo:hi], self._nodes[lo:hi]) if key == "functions"}
+        self.text = new_text
+        self._keys[lo:hi] = keys
+        self._nodes[lo:hi] = nodes
+        self._resumes = resumes[:lo] + new_resumes + [resume + delta for resume in resumes[hi:]]
+        self._parsed_resumes[lo:hi] = new_resumes
+        self._line_ends[lo:hi] = [_count_line_ends(new_text, region_start, region_end) for region_start, region_end
+                                  in zip([reparse_start] + new_resumes, new_resumes)]
+
+        for key, node in zip(keys, nodes):
+            ctx[key].append(node)
+        if nodes:
+            line_start = max(new_text.rfind("\n", 0, reparse_start), new_text.rfind("\r", 0, reparse_start)) + 1
+            first_line = sum(self._line_ends[:lo]) + 1  # the line of reparse_start
+            ctx["lines"] = lexer.LineIndex(new_text[line_start:nodes[-1].span[1]], line_start, first_line)
+            self.engine.eval_ctx(ctx, new_text[reparse_start:nodes[-1].span[1]])
+        if self.engine.opt_level >= 3:
+            self._compile_callers(old_names | {node.proto.name for node in ctx['functions']}, lo, lo + len(nodes))
+        return nodes
+
+    def _compile_callers(self, names, lo: int, hi: int):
+        """ compile again the functions out of [lo, hi) which call one of `names`, they may have inlined it """
+        callers = []
+        for i, (key, node) in enumerate(zip(self._keys, self._nodes)):
+            if key == "functions" and not lo <= i < hi and any(
+                    type(child) is ast.CallExprAST and child.callee in names for child in ast.walk(node.body)):
+                self._shift_spans(i)
+                callers.append(node)
+        if callers:
+            ctx = {"globals": [], "functions": callers, "externals": self._externals,
+                   "lines": lexer.LineIndex(self.text)}
+            self.engine.eval_ctx(ctx, self.text)
+
+    def _shift_spans(self, index: int):
+        """ bring the spans of the definition `index` up to date """
+        shift = self._resumes[index] - self._parsed_resumes[index]
+        if shift:
+            for child in ast.walk(self._nodes[index]):
+                if child.span is not None:
+                    child.span = (child.span[0] + shift, child.span[1] + shift)
+            self._parsed_resumes[index] = self._resumes[index]
+
+    def ctx(self):
+        """ the AST of the whole source, as `parser.parse_code_to_ast` would parse `text` """
+        ctx = {"globals": [], "functions": [], "externals": self._externals, "lines": lexer.LineIndex(self.text)}
+        for index, (key, node) in enumerate(zip(self._keys, self._nodes)):
+            self._shift_spans(index)
+            ctx[key].append(node)
+        return ctx
+
+
+def _count_line_ends(text: str, start: int, end: int) -> int:
+    """ the number of line ends(CRLF, CR or LF) in text[start:end] """
+    return text.count("\n", start, end) + text.count("\r", start, end) - text.count("\r\n", start, end)
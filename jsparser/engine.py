@@ -1,28 +1,414 @@
-
+import builtins
+import collections
+import copy
+import hashlib
+import threading
+import types
+from . import ast
 from . import parser
 from . import codegen
+from . import lowering
+from . import optimizer
+from . import profiler
+from . import vectorize as vectorize_backend
+from .diskcache import DiskCache
+
+
+class CompiledScript(object):
+    """
+    A piece of javascript compiled into a python code object.
+
+        code    - the code object, ready to be `exec`ed
+        symbols - names defined by the script, name -> "function" | "var"
+        ctx     - the parsed AST ({"globals": [...], "functions": [...]}),
+                  None when the script was loaded from the disk cache
+        line_map - the javascript line of every line of the generated python code, see `codegen.PythonEmitter`,
+                  None when the python line numbers are the javascript ones(the "ast" compiler)
+        dropped - the names of the functions dropped by the tree shaking, see `JSEngine(exports=...)`
+    """
+
+    def __init__(self, code, symbols, ctx, line_map=None, dropped=()):
+        self.code = code
+        self.symbols = symbols
+        self.ctx = ctx
+        self.line_map = line_map
+        self.dropped = dropped
+
+    def instantiate(self, bindings: dict = None, shared: dict = None) -> "Namespace":
+        """
+        Execute the script in a new isolated namespace, the script is not parsed nor compiled again and the
+        functions of every namespace share the code objects, so a namespace costs its bindings and one function
+        object per javascript function.
+
+            bindings - the global variables of this namespace, the dict becomes the namespace itself(not copied)
+            shared   - the values shared by many namespaces, see `shared_builtins`, looked up when the namespace
+                       doesn't define a name
+        """
+        g = bindings if bindings is not None else {}
+        if shared is not None:
+            g["__builtins__"] = shared
+        exec(self.code, g)
+        return Namespace(g)
+
+
+class Namespace(object):
+    """
+    An isolated global namespace of a CompiledScript, with the same accessors as JSEngine.
+    `globals` is a plain dict so the global lookups of the functions keep their fast path.
+    """
+
+    __slots__ = ("globals",)
+
+    def __init__(self, g: dict):
+        self.globals = g
+
+    def set(self, key, val):
+        self.globals[key] = val
+
+    def set_all(self, values):
+        self.globals.update(values)
+
+    def get(self, key):
+        return self.globals.get(key)
+
+
+def shared_builtins(values) -> dict:
+    """
+    The python builtins extended with `values`, to share them between the namespaces of
+    `CompiledScript.instantiate`: python looks a name up in the namespace, then in its builtins,
+    so the shared values are neither copied into every namespace nor slower to look up.
+    """
+    shared = dict(builtins.__dict__)
+    shared.update(values)
+    return shared
+
+
+class CompileCache(object):
+    """
+    Thread-safe LRU cache of CompiledScript, keyed by `cache_key(js_code, externals)`.
+    The same cache can be shared by several engines.
+    """
+
+    def __init__(self, maxsize: int = 128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            script = self._entries.get(key)
+            if script is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return script
+
+    def put(self, key, script):
+        with self._lock:
+            if self.maxsize <= 0:
+                return
+            self._entries[key] = script
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries), "maxsize": self.maxsize}
+
+
+def cache_key(js_code, externals, options=()):
+    """ `options` are the compile options which change the generated code """
+    h = hashlib.sha256()
+    h.update(repr(sorted(externals.items())).encode("utf-8"))
+    h.update(b"\0")
+    h.update(repr(tuple(options)).encode("utf-8"))
+    h.update(b"\0")
+    h.update(js_code.encode("utf-8"))
+    return h.digest()
 
 
 class JSEngine(object):
+    """
+    Javascript runtime.
 
-    def __init__(self, g = {}):
-        self._g = g
-        externals = {
+        compiler - "source": generate python source code and compile it(default)
+                   "ast": lower the AST straight into python AST nodes, see `lowering`
+        opt_level - optimization level of the AST before compiling, see `optimizer`(default 0, none)
+        exports   - names the host calls through `get`, only the functions reachable from them or from
+                    the global statements are compiled(tree shaking). None(default) keeps every function.
+                    A function dropped from a script is compiled once the code of a later `eval` reaches it
+        profile   - record the time of every phase and the counters, see `stats`
+        profile_calls - also count the calls and the time of every javascript function,
+                    the functions are wrapped when they are defined
+    """
+
+    def __init__(self, g: dict = None, cache: CompileCache = None, cache_dir: str = None, compiler: str = "source",
+                 opt_level: int = 0, exports=None, profile: bool = False, profile_calls: bool = False):
+        if compiler not in ("source", "ast"):
+            raise ValueError("unknown compiler %s" % compiler)
+        self._g = g if g is not None else {}
+        self._externals = {
             "Math.max": "max",
             "Math.min": "min",
         }
-        self._ctx = {"globals": [], "functions": [], "externals": externals}
+        self._symbols = {}  # name -> "function" | "var", everything defined by eval() so far
+        self._function_sources = {}  # function name -> javascript code of the script which defined it
+        self._line_maps = {}  # code filename -> line map, of the scripts executed by eval(), see `js_traceback`
+        self._vectorized = {}  # function name -> (javascript code, vectorized function)
+        self._dropped = {}  # function name -> javascript code of the script which defined it, dropped by the tree shaking
+        self._referenced = set()  # the global names read by the code executed so far, with `exports`
+        self._cache = cache if cache is not None else CompileCache()
+        self._disk_cache = DiskCache(cache_dir) if cache_dir is not None else None
+        self._compiler = compiler
+        self._opt_level = opt_level
+        self._exports = tuple(sorted(exports)) if exports is not None else None
+        self._profiler = profiler.Profiler() if profile or profile_calls else None
+        self._profile_calls = profile_calls
+
+    def compile(self, js_code) -> CompiledScript:
+        """
+        Compile `js_code` into a CompiledScript, a cache hit skips the lexer, parser and codegen.
+        The in-memory cache is looked up first, then the disk cache if the engine has a `cache_dir`.
+        """
+        key = cache_key(js_code, self._externals, (self._compiler, self._opt_level, self._exports))
+        script = self._cache.get(key)
+        if script is not None:
+            if self._profiler is not None:
+                self._profiler.count("cache_hits")
+            return script
+
+        if self._disk_cache is not None:
+            with self._phase("disk_cache"):
+                entry = self._disk_cache.load_code(key)
+            if entry is not None:
+                script = CompiledScript(entry[1], entry[0], None, entry[2], entry[3])
+
+        if script is None:
+            ctx = {"globals": [], "functions": [], "externals": self._externals}
+            parser.parse_code_to_ast(js_code, ctx, profiler=self._profiler)
+            dropped = ()
+            with self._phase("optimize"):
+                optimizer.optimize(ctx, self._opt_level)
+                if self._exports is not None:
+                    names = {function_ast.proto.name for function_ast in ctx['functions']}
+                    optimizer.shake(ctx, self._exports)
+                    dropped = tuple(sorted(names - {function_ast.proto.name for function_ast in ctx['functions']}))
+            filename = "<jsparser:%s>" % key.hex()[:16]  # tells the frames of every script apart, see `js_traceback`
+            code, py_code, line_map = self._compile_ctx(ctx, filename)
+            script = CompiledScript(code, _collect_symbols(ctx), ctx, line_map, dropped)
+            if self._disk_cache is not None:
+                if py_code is not None:
+                    self._disk_cache.store_source(key, py_code)
+                self._disk_cache.store_code(key, script.symbols, script.code, script.line_map, script.dropped)
+
+        self._cache.put(key, script)
+        return script
+
+    def _compile_ctx(self, ctx, filename):
+        """ (code object, python source or None, line map) of the optimized `ctx` """
+        if self._compiler == "ast":
+            with self._phase("lower"):
+                return lowering.compile_ctx(ctx, filename), None, None
+        with self._phase("codegen"):
+            emitter = codegen.PythonEmitter(minimal_parens=self._opt_level >= 1, lines=ctx.get("lines"))
+            emitter.emit_ctx(ctx)
+            py_code = emitter.getvalue()
+        with self._phase("compile"):
+            code = compile(py_code, filename, "exec")
+        if self._profiler is not None:
+            self._profiler.count("code_size", len(py_code))
+        return code, py_code, emitter.line_map
 
     def eval(self, js_code):
-        parser.parse_code_to_ast(js_code, self._ctx)
-        py_code = codegen.generate_python_code(self._ctx)
-        exec(py_code, self._g)
+        """
+        Incrementally compile and execute `js_code`.
+
+        Only the definitions parsed from this call (the delta) are compiled and executed,
+        symbols defined by previous calls stay alive in the global namespace.
+        """
+        self.execute(self.compile(js_code), js_code)
+
+    def execute(self, script: CompiledScript, js_code):
+        """ execute `script`, compiled from `js_code` by `compile`, in the global namespace like `eval` """
+        self._define(script.code, script.symbols, script.line_map, js_code)
+        if self._exports is not None:
+            for name in script.dropped:
+                self._dropped[name] = js_code
+            self._define_reached(script.code)
+
+    def eval_ctx(self, ctx, js_code: str):
+        """
+        Compile and execute the definitions of `ctx`, already parsed from `js_code`, like `eval`.
+        e.g. the definitions reparsed after an edit of a `document.Document`.
+        The compile caches and the tree shaking of `exports` are skipped, the AST of `ctx` is optimized on a copy
+        so it stays as parsed.
+        """
+        if self._opt_level > 0:
+            ctx = dict(ctx, globals=copy.deepcopy(ctx['globals']), functions=copy.deepcopy(ctx['functions']))
+            with self._phase("optimize"):
+                optimizer.optimize(ctx, self._opt_level)
+        nodes = ctx['globals'] + ctx['functions']
+        first_line = ctx["lines"].position(nodes[0].span[0])[0] if nodes and ctx.get("lines") and nodes[0].span else 1
+        key = cache_key(js_code, self._externals, (self._compiler, self._opt_level, first_line))
+        code, _, line_map = self._compile_ctx(ctx, "<jsparser:%s>" % key.hex()[:16])
+        self._define(code, _collect_symbols(ctx), line_map, js_code)
+        if self._exports is not None:
+            self._define_reached(code)
+
+    def _define(self, code, symbols, line_map, js_code):
+        """ execute the compiled `code` of `js_code` in the global namespace, record what it defines """
+        self._line_maps[code.co_filename] = line_map
+        with self._phase("exec"):
+            exec(code, self._g)
+        self._symbols.update(symbols)
+        if self._profile_calls:
+            for name, kind in symbols.items():
+                if kind == "function":
+                    self._g[name] = self._profiler.wrap_function(name, self._g[name])
+        for name, kind in symbols.items():
+            if kind == "function":
+                self._function_sources[name] = js_code
+                self._dropped.pop(name, None)
+            else:
+                self._function_sources.pop(name, None)
+
+    def _define_reached(self, code):
+        """
+        With `exports`, the tree shaking of a script only sees that script: after `code` is executed, compile and
+        define the functions dropped from the earlier scripts(or from this one) which the executed code reads.
+        """
+        self._referenced.update(_global_names(code))
+        while True:
+            reached = collections.defaultdict(set)  # javascript code -> names of its dropped functions
+            for name, js_code in self._dropped.items():
+                if name in self._referenced:
+                    reached[js_code].add(name)
+            if not reached:
+                return
+            for js_code, names in reached.items():
+                for name in names:
+                    del self._dropped[name]
+                ctx = {"globals": [], "functions": [], "externals": self._externals}
+                parser.parse_code_to_ast(js_code, ctx, profiler=self._profiler)
+                with self._phase("optimize"):
+                    optimizer.optimize(ctx, self._opt_level)
+                ctx['globals'] = []  # they already ran
+                ctx['functions'] = [function_ast for function_ast in ctx['functions'] if function_ast.proto.name in names]
+                key = cache_key(js_code, self._externals, (self._compiler, self._opt_level, tuple(sorted(names))))
+                code, _, line_map = self._compile_ctx(ctx, "<jsparser:%s>" % key.hex()[:16])
+                self._define(code, _collect_symbols(ctx), line_map, js_code)
+                self._referenced.update(_global_names(code))
+
+    def vectorize(self, name):
+        """
+        The javascript function `name` compiled into numpy expressions, it is called with whole arrays
+        instead of once per row, see `vectorize`. Raises VectorizeError when the function can not be vectorized.
+        """
+        js_code = self._function_sources.get(name)
+        if js_code is None:
+            raise KeyError("%s is not a javascript function" % name)
+        entry = self._vectorized.get(name)
+        if entry is not None and entry[0] is js_code:
+            return entry[1]
+
+        ctx = self.compile(js_code).ctx
+        if ctx is None or all(function_ast.proto.name != name for function_ast in ctx['functions']):
+            # loaded from the disk cache, which keeps no AST, or dropped by the tree shaking and reached later
+            ctx = {"globals": [], "functions": [], "externals": self._externals}
+            parser.parse_code_to_ast(js_code, ctx)
+            optimizer.optimize(ctx, self._opt_level)
+        function_ast = [function_ast for function_ast in ctx['functions'] if function_ast.proto.name == name][-1]
+        func = vectorize_backend.vectorize_function(function_ast, self._g)
+        self._vectorized[name] = (js_code, func)
+        return func
+
+    def js_traceback(self, exc: BaseException):
+        """
+        The javascript frames of the traceback of `exc`, raised by the code of `eval` or by a javascript function,
+        outermost first: [(function name, javascript line)], the global statements are in "<module>".
+        The lines are mapped from the generated python code, the javascript source is not parsed again.
+        """
+        frames = []
+        tb = exc.__traceback__
+        while tb is not None:
+            code = tb.tb_frame.f_code
+            if code.co_filename in self._line_maps:
+                line_map = self._line_maps[code.co_filename]
+                lineno = tb.tb_lineno
+                if line_map is not None:
+                    lineno = line_map[lineno - 1] if 0 < lineno <= len(line_map) else None
+                frames.append((code.co_name, lineno))
+            tb = tb.tb_next
+        return frames
+
+    def instantiate(self, js_code, bindings: dict = None, shared: dict = None) -> Namespace:
+        """
+        Compile `js_code`(through the compile cache) and execute it in a new isolated namespace instead of the
+        engine's own, see `CompiledScript.instantiate`. e.g.: one namespace per tenant running the same script.
+        """
+        return self.compile(js_code).instantiate(bindings, shared)
+
+    def symbols(self):
+        return dict(self._symbols)
+
+    def externals(self):
+        """ the javascript names mapped to python ones by the parser, e.g. "Math.max" -> "max" """
+        return dict(self._externals)
+
+    @property
+    def opt_level(self) -> int:
+        return self._opt_level
+
+    def _phase(self, name):
+        return self._profiler.phase(name) if self._profiler is not None else profiler.g_null_phase
+
+    def stats(self):
+        """
+        The profile of the engine, None unless it was created with `profile` or `profile_calls`:
+            {"phases": {name: {"runs", "seconds"}}, "counters": {"tokens", "nodes", "code_size", ...},
+             "functions": {name: {"calls", "seconds"}}}
+        """
+        return self._profiler.stats() if self._profiler is not None else None
+
+    def cache_info(self):
+        return self._cache.info()
 
     def set(self, key, val):
         self._g[key] = val
 
     def set_all(self, values):
-        self._g = { **self._g, **values }
+        self._g.update(values)  # in place, the functions defined so far keep seeing the global namespace
 
     def get(self, key):
         return self._g[key] if key in self._g else None
+
+
+def _collect_symbols(ctx):
+    symbols = {}
+    for g in ctx['globals']:
+        if isinstance(g.body, ast.VariableDeclarationExprAST):
+            symbols[g.body.lhs.name] = "var"
+    for function_ast in ctx['functions']:
+        symbols[function_ast.proto.name] = "function"
+    return symbols
+
+
+def _global_names(code) -> set:
+    """ the names read or written by `code` and the functions it defines, a superset of the globals they use """
+    names = set()
+    stack = [code]
+    while stack:
+        code = stack.pop()
+        names.update(code.co_names)
+        stack.extend(const for const in code.co_consts if isinstance(const, types.CodeType))
+    return names
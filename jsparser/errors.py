@@ -0,0 +1,27 @@
+"""
+Errors of the javascript source, raised by the lexer and the parser with the position of the offending token.
+"""
+
+
+class JSSyntaxError(SyntaxError):
+    """
+    A javascript syntax error, with the fields of a python SyntaxError so it is reported the same way:
+        msg      - the message
+        filename - "<js>" unless the source has a name
+        lineno   - line of the error, 1-based
+        offset   - column of the error, 1-based
+        text     - the source line of the error
+    and
+        span     - (start, end) offsets of the offending token in the source
+    """
+
+    def __init__(self, msg: str, lineno: int = None, offset: int = None, text: str = None, span=None,
+                 filename: str = "<js>"):
+        SyntaxError.__init__(self, msg, (filename, lineno, offset, text))
+        self.span = span
+
+
+def syntax_error(msg: str, code, start: int, end: int = None) -> JSSyntaxError:
+    """ a JSSyntaxError of the token at the offsets [start, end) of the source buffer `code` """
+    lineno, column = code.position(start)
+    return JSSyntaxError(msg, lineno, column + 1, code.line_at(start), (start, end if end is not None else start))
@@ -1,17 +1,12 @@
+import bisect
 import enum
+import re
+from array import array
+from . import log
+from .errors import syntax_error
 
-g_last_char: str = ' '
-g_identifier_str: str = None
-g_number_val: float = 0
-g_cur_token = None
 
-
-def reset():
-    global g_last_char, g_identifier_str, g_number_val, g_cur_token
-    g_last_char = ' '
-    g_identifier_str = None
-    g_number_val = 0
-    g_cur_token = None
+logger = log.get_logger("lexer")
 
 
 class Token(enum.IntEnum):
@@ -39,12 +34,92 @@ g_keywords = {
 }
 
 
+g_line_end_pattern = re.compile(r"\r\n?|\n")
+
+
+class LineIndex(object):
+    """
+    Maps an offset of the source to its (line, column), line is 1-based and column 0-based.
+    The start offsets of the lines are found once, with a single scan of the source on the first lookup,
+    then every lookup is a bisect, so reporting many positions on a long(e.g. minified) line stays cheap.
+    `text` may be a piece of the source, starting a line: at the offset `base` and the line `first_line`.
+    """
+
+    def __init__(self, text: str = "", base: int = 0, first_line: int = 1):
+        self._text = text
+        self._base = base
+        self._first_line = first_line
+        self._starts = None
+        self._ends_with_cr = False
+
+    @classmethod
+    def from_line_starts(cls, starts):
+        """ an index of known line start offsets, without the text(e.g. a deserialized AST) """
+        index = cls()
+        index._starts = list(starts)
+        return index
+
+    def line_starts(self):
+        """ the start offsets of the lines """
+        return list(self._line_starts())
+
+    def _line_starts(self):
+        if self._starts is None:
+            self._starts = [self._base]
+            self._add_lines(self._text, self._base)
+        return self._starts
+
+    def _add_lines(self, text, base):
+        starts = self._starts
+        pos = 0
+        if self._ends_with_cr and text[:1] == "\n":  # a "\r\n" split across two pieces is a single line end
+            starts[-1] += 1
+            pos = 1
+        starts.extend(base + m.end() for m in g_line_end_pattern.finditer(text, pos))
+        self._ends_with_cr = text[-1:] == "\r"
+
+    def extend(self, text: str, base: int):
+        """ index the piece `text` of the source starting at the offset `base`, for sources read in chunks """
+        self._line_starts()
+        self._add_lines(text, base)
+
+    def forget(self, offset: int):
+        """
+        drop the start offsets of the lines before the line of `offset`, for sources read in chunks:
+        the offsets before it are not looked up any more
+        """
+        starts = self._line_starts()
+        index = bisect.bisect_right(starts, offset) - 1
+        if index > 0:
+            del starts[:index]
+            self._first_line += index
+
+    def position(self, offset: int):
+        """ (line, column) of `offset` """
+        starts = self._line_starts()
+        lineno = bisect.bisect_right(starts, offset)
+        return lineno + self._first_line - 1, offset - starts[lineno - 1]
+
+    def line_range(self, lineno: int):
+        """ (start, end) offsets of the line `lineno` of an indexed text, without the line end """
+        starts = self._line_starts()
+        lineno -= self._first_line - 1
+        base = self._base
+        if lineno >= len(starts):  # the last line
+            return starts[-1], base + len(self._text)
+        end = starts[lineno]
+        return starts[lineno - 1], end - 2 if self._text[end - 2 - base:end - base] == "\r\n" else end - 1
+
+
 class StringBuffer(object):
 
-    def __init__(self, value):
+    _base = 0  # offset of `_value` in the source, always 0 as the whole source is in memory
+
+    def __init__(self, value, start: int = 0):
         self._value = value
-        self._index = 0
+        self._index = start  # lex from the offset `start`, e.g. to reparse a part of the source
         self._length = len(value)
+        self._line_index = None
 
     def getchar(self, peek = False):
         if self._index < self._length:
@@ -57,85 +132,557 @@ class StringBuffer(object):
     def eof(self):
         return self._index == self._length - 1
 
+    @property
+    def line_index(self) -> LineIndex:
+        if self._line_index is None:
+            self._line_index = LineIndex(self._value)
+        return self._line_index
+
+    def position(self, offset: int):
+        """ (line, column) of the source offset `offset`, line is 1-based and column 0-based """
+        return self.line_index.position(offset)
+
+    def line_at(self, offset: int) -> str:
+        """ the source line at `offset`, without its line end """
+        start, end = self.line_index.line_range(self.position(offset)[0])
+        return self._value[start:end]
+
     def curline(self):
-        start_index = self._index
-        c = self._value[start_index]
-        while c != "\r" and c != "\n" and start_index > 0:
-            c = self._value[start_index]
-            start_index -= 1
-        if start_index > 0:
-            start_index += 1  # skip the nl
-        end_index = self._index
-        c = self._value[end_index]
-        while c != "\r" and c != "\n" and end_index < self._length:
-            c = self._value[end_index]
-            end_index += 1
+        return self.line_at(self._index)
+
+
+class StreamBuffer(object):
+    """
+    Same interface as StringBuffer, but reads the source from a file-like object(text mode)
+    or an iterable of str chunks, keeping only the current chunk in memory.
+    The lines are indexed as the chunks are read, the positions are available from the offset given to
+    `forget_lines`, e.g. the start of the definition being parsed, the lines before it are dropped.
+    """
+
+    def __init__(self, source, chunk_size: int = 65536):
+        if hasattr(source, "read"):
+            self._chunks = _read_chunks(source, chunk_size)
+        else:
+            self._chunks = iter(source)
+        self._value = ""
+        self._index = 0
+        self._length = 0
+        self._base = 0  # offset of the current chunk in the source
+        self.line_index = LineIndex()
+
+    def _next_chunk(self):
+        for chunk in self._chunks:
+            if chunk:
+                self._base += self._length
+                self._value = chunk
+                self._index = 0
+                self._length = len(chunk)
+                self.line_index.extend(chunk, self._base)
+                return True
+        return False
+
+    def getchar(self, peek = False):
+        if self._index >= self._length and not self._next_chunk():
+            return None  # EOF
+        c = self._value[self._index]
+        if not peek:
+            self._index += 1
+        return c
+
+    def forget_lines(self, offset: int):
+        """ the offsets before `offset` are not looked up any more """
+        self.line_index.forget(offset)
+
+    def position(self, offset: int):
+        """ (line, column) of the source offset `offset`, line is 1-based and column 0-based """
+        return self.line_index.position(offset)
+
+    def line_at(self, offset: int) -> str:
+        """ the source line at `offset`, as far as it is in the current chunk """
+        index = min(max(offset - self._base, 0), self._length)
+        start_index = max(self._value.rfind("\n", 0, index), self._value.rfind("\r", 0, index)) + 1
+        end_index = len(self._value)
+        for nl in ("\n", "\r"):
+            found = self._value.find(nl, index)
+            if found != -1:
+                end_index = min(end_index, found)
         return self._value[start_index:end_index]
 
+    def curline(self):
+        """ the current line, as far as it is in the current chunk """
+        return self.line_at(self._base + self._index)
+
+
+def _read_chunks(f, chunk_size):
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+class Lexer(object):
+    """
+    Tokenizer over a StringBuffer, every instance keeps its own state so that
+    several lexers can run at the same time (e.g. from a thread pool).
+
+    After each `get_next_token` call:
+        cur_token       - the current token, a `Token` or a single char
+        identifier_str  - the last identifier(or keyword) read
+        number_val      - the last number read
+        token_start, token_end - offsets of the current token in the source
+        prev_token_end  - end offset of the previous token, i.e. of the last token consumed by the parser
+
+    `peek_token` reads the next token ahead, it is kept until `get_next_token`.
+    """
+
+    def __init__(self, code: StringBuffer):
+        self.code = code
+        self.last_char: str = ' '
+        self.identifier_str: str = None
+        self.number_val: float = 0
+        self.cur_token = None
+        self.token_start = 0
+        self.token_end = 0
+        self.prev_token_end = 0
+        self._peeked = None  # (token, identifier_str, number_val, token_start, token_end) read ahead
+        self.trace = log.is_enabled(logger)  # checked before every trace, so nothing is formatted when disabled
+
+    def curline(self):
+        return self.code.curline()
+
+    def get_token(self):
+        code = self.code
+
+        # skip the whitespace and comments, iteratively so that a long run of comment lines can't overflow the stack
+        while True:
+            while self.last_char and self.last_char.isspace():
+                self.last_char = code.getchar()
+            if self.last_char != "/" or code.getchar(peek=True) != "/":
+                break
+            code.getchar() # eat '//', comment util end of line
+            self.last_char = code.getchar()
+            while self.last_char and self.last_char != "\n" and self.last_char != "\r":
+                self.last_char = code.getchar()
+
+        if self.last_char is None:  # EOF
+            self.token_start = self.token_end = code._base + code._index
+            return Token.EOF
+
+        # last_char was read already, it is the first char of the token
+        self.token_start = code._base + code._index - 1
+
+        if self.last_char.isalpha() or self.last_char == "_":  # identifier: [a-zA-Z][a-zA-Z0-9]*
+            self.identifier_str = self.last_char
+            self.last_char = code.getchar()
+            while self.last_char and (self.last_char.isalnum() or self.last_char == "_"):
+                self.identifier_str += self.last_char
+                self.last_char = code.getchar()
+            self.token_end = code._base + code._index - (self.last_char is not None)
+            if self.identifier_str in g_keywords:
+                return g_keywords[self.identifier_str]
+            return Token.IDENTIFIER
+
+        if self.last_char.isdigit():  # Number: [0-9.]
+            num_str = self.last_char
+            self.last_char = code.getchar()
+            while self.last_char and (self.last_char.isdigit() or self.last_char == "."):
+                num_str += self.last_char
+                self.last_char = code.getchar()
+            self.token_end = code._base + code._index - (self.last_char is not None)
+            try:
+                self.number_val = float(num_str)
+            except ValueError:  # e.g.: `1.2.3`
+                raise syntax_error("invalid number %s" % num_str, code, self.token_start, self.token_end) from None
+            return Token.NUMBER
+
+        if self.last_char == "\r" or self.last_char == "\n" or self.last_char == ";":
+            if self.trace:
+                logger.debug("eat nl %r", self.last_char)
+            self.last_char = code.getchar()  # eat nl
+            self.token_end = self.token_start + 1
+            #while self.last_char == "\r" or self.last_char == "\n" or self.last_char == ";":
+            #    print("eat nl2", self.last_char)
+            #    self.last_char = code.getchar()
+            return Token.NEW_LINE
+
+        #if self.last_char == "{":
+        #    self.last_char = code.getchar()  # eat `{`
+        #    return Token.BLOCK
+
+        #if self.last_char == "(":
+        #    self.last_char = code.getchar()  # eat `(`
+        #    return Token.PAREN
+
+        this_char = self.last_char
+        self.last_char = code.getchar()
+        self.token_end = self.token_start + 1
+        return this_char
+
+    def get_next_token(self):
+        self.prev_token_end = self.token_end
+        if self._peeked is not None:
+            self.cur_token, self.identifier_str, self.number_val, self.token_start, self.token_end = self._peeked
+            self._peeked = None
+            return self.cur_token
+        self.cur_token = self.get_token()
+        if self.trace:
+            logger.debug("get_next_token, cur_token=%s, last_char=%r, identifier_str=%s, number_val=%d",
+                         self.cur_token, self.last_char, self.identifier_str, self.number_val)
+        return self.cur_token
+
+    def peek_token(self):
+        """ the token after the current one, without consuming it """
+        if self._peeked is None:
+            current = (self.cur_token, self.identifier_str, self.number_val, self.token_start, self.token_end,
+                       self.prev_token_end)
+            self.get_next_token()
+            self._peeked = (self.cur_token, self.identifier_str, self.number_val, self.token_start, self.token_end)
+            (self.cur_token, self.identifier_str, self.number_val, self.token_start, self.token_end,
+             self.prev_token_end) = current
+        return self._peeked[0]
+
 
-def get_token(code: StringBuffer):
-    global g_last_char, g_identifier_str, g_number_val
-
-    # skip the whitespace
-    while g_last_char and g_last_char.isspace():
-        g_last_char = code.getchar()
-
-    if g_last_char is None:  # EOF
-        return Token.EOF
-
-    if g_last_char.isalpha() or g_last_char == "_":  # identifier: [a-zA-Z][a-zA-Z0-9]*
-        g_identifier_str = g_last_char
-        g_last_char = code.getchar()
-        while g_last_char.isalnum() or g_last_char == "_":
-            g_identifier_str += g_last_char
-            g_last_char = code.getchar()
-        if g_identifier_str in g_keywords:
-            return g_keywords[g_identifier_str]
-        return Token.IDENTIFIER
-
-    if g_last_char.isdigit():  # Number: [0-9.]
-        num_str = g_last_char
-        g_last_char = code.getchar()
-        while g_last_char.isdigit() or g_last_char == ".":
-            num_str += g_last_char
-            g_last_char = code.getchar()
-        g_number_val = float(num_str)
+g_token_pattern = re.compile(r"""
+    (?:\s|//[^\r\n]*(?![^\r\n]))*  # whitespace and comments, the lookahead stops backtracking into a comment
+    (?:
+        (?P<identifier>[^\W\d]\w*)
+      | (?P<number>\d[\d.]*)
+      | (?P<new_line>;)
+      | (?P<char>(?!//)\S)
+    )
+""", re.VERBOSE)
+
+
+class RegexLexer(Lexer):
+    """
+    Drop-in replacement of `Lexer` which scans the source in bulk with a single compiled
+    master regex, instead of reading it char by char. Emits the same token stream.
+    """
+
+    def __init__(self, code: StringBuffer):
+        self.code = code
+        self.identifier_str: str = None
+        self.number_val: float = 0
+        self.cur_token = None
+        self.token_start = 0
+        self.token_end = 0
+        self.prev_token_end = 0
+        self._peeked = None
+        self.trace = log.is_enabled(logger)
+        self._match = g_token_pattern.match
+
+    @property
+    def last_char(self):
+        return self.code.getchar(peek=True)
+
+    def get_token(self):
+        code = self.code
+        m = self._match(code._value, code._index)
+        if m is None:  # only whitespace and comments left
+            code._index = self.token_start = self.token_end = code._length
+            return Token.EOF
+        code._index = self.token_end = m.end()
+
+        kind = m.lastgroup
+        self.token_start = m.start(kind)
+        if kind == "identifier":
+            self.identifier_str = m.group(kind)
+            return g_keywords.get(self.identifier_str, Token.IDENTIFIER)
+        if kind == "number":
+            try:
+                self.number_val = float(m.group(kind))
+            except ValueError:
+                raise syntax_error("invalid number %s" % m.group(kind), code, self.token_start, self.token_end) from None
+            return Token.NUMBER
+        if kind == "new_line":
+            return Token.NEW_LINE
+        return m.group(kind)
+
+
+g_bytes_token_pattern = re.compile(rb"""
+    (?:[\s\x1c-\x1f]|//[^\r\n]*(?![^\r\n]))*  # the ASCII whitespace(as str.isspace) and comments
+    (?:
+        (?P<identifier>[A-Za-z_]\w*)
+      | (?P<number>\d[\d.]*)
+      | (?P<new_line>;)
+      | (?P<char>(?!//)[^\s\x1c-\x1f\x80-\xff])
+      | (?P<unicode>[\x80-\xff])  # the first byte of a non-ASCII char
+    )
+""", re.VERBOSE)
+g_bytes_word_pattern = re.compile(rb"[\w.\x80-\xff]*")  # the bytes a token with non-ASCII chars may span
+g_bytes_line_end_pattern = re.compile(rb"\r\n?|\n")
+
+
+class BytesBuffer(object):
+    """
+    Same interface as StringBuffer over the utf-8 bytes of the source, e.g. an `mmap` of a large file, for
+    `BytesLexer`. Nothing is decoded up front: the offsets are byte offsets, the lines of the errors are decoded
+    on demand.
+    """
+
+    _base = 0
+
+    def __init__(self, data):
+        self._value = data
+        self._index = 0
+        self._length = len(data)
+
+    def getchar(self, peek = False):
+        if self._index < self._length:
+            c = chr(self._value[self._index])
+            if not peek:
+                self._index += 1
+            return c
+        return None  # EOF
+
+    def _line_start(self, offset: int) -> int:
+        return max(self._value.rfind(b"\n", 0, offset), self._value.rfind(b"\r", 0, offset)) + 1
+
+    def position(self, offset: int):
+        """ (line, column) of the byte offset `offset`, the column counts the chars, scans the source up to `offset` """
+        start = self._line_start(offset)
+        lineno = sum(1 for _ in g_bytes_line_end_pattern.finditer(self._value, 0, start)) + 1
+        return lineno, len(self._value[start:offset].decode("utf-8", "replace"))
+
+    def line_at(self, offset: int) -> str:
+        m = g_bytes_line_end_pattern.search(self._value, offset)
+        return self._value[self._line_start(offset):m.start() if m is not None else self._length].decode("utf-8", "replace")
+
+    def curline(self):
+        return self.line_at(self._index)
+
+
+class BytesLexer(RegexLexer):
+    """
+    RegexLexer over a BytesBuffer: the ASCII tokens are matched on the bytes, a token next to a non-ASCII char
+    is decoded alone and matched by the str pattern, so the tokens are the same as RegexLexer's.
+    `token_start` and `token_end` are byte offsets.
+    """
+
+    def __init__(self, code: BytesBuffer):
+        RegexLexer.__init__(self, code)
+        self._match = g_bytes_token_pattern.match
+
+    def get_token(self):
+        code = self.code
+        data = code._value
+        while True:
+            m = self._match(data, code._index)
+            if m is None:  # only whitespace and comments left
+                code._index = self.token_start = self.token_end = code._length
+                return Token.EOF
+            kind = m.lastgroup
+            end = m.end()
+            if kind == "unicode" or (end < code._length and data[end] >= 0x80 and kind in ("identifier", "number")):
+                token = self._unicode_token(m.start(kind))
+                if token is None:  # non-ASCII whitespace
+                    continue
+                return token
+            code._index = self.token_end = end
+            self.token_start = m.start(kind)
+            if kind == "identifier":
+                self.identifier_str = m.group(kind).decode("ascii")
+                return g_keywords.get(self.identifier_str, Token.IDENTIFIER)
+            if kind == "number":
+                return self._number(m.group(kind).decode("ascii"))
+            if kind == "new_line":
+                return Token.NEW_LINE
+            return m.group(kind).decode("ascii")
+
+    def _unicode_token(self, start: int):
+        """ the token at the byte offset `start`, which has non-ASCII chars, None if they are whitespace """
+        code = self.code
+        end = g_bytes_word_pattern.match(code._value, start).end()
+        try:
+            text = code._value[start:end].decode("utf-8")
+        except UnicodeDecodeError as e:
+            raise syntax_error("invalid utf-8", code, start + e.start, start + e.end) from None
+        m = g_token_pattern.match(text)
+        if m is None:
+            code._index = end
+            return None
+        kind = m.lastgroup
+        self.token_start = start + len(text[:m.start(kind)].encode("utf-8"))
+        code._index = self.token_end = start + len(text[:m.end()].encode("utf-8"))
+        if kind == "identifier":
+            self.identifier_str = m.group(kind)
+            return g_keywords.get(self.identifier_str, Token.IDENTIFIER)
+        if kind == "number":
+            return self._number(m.group(kind))
+        return m.group(kind)
+
+    def _number(self, num_str: str):
+        try:
+            self.number_val = float(num_str)
+        except ValueError:  # e.g.: `1.2.3`
+            raise syntax_error("invalid number %s" % num_str, self.code, self.token_start, self.token_end) from None
         return Token.NUMBER
 
-    if g_last_char == "/":
-        next_char = code.getchar(peek=True)
-        if next_char == "/": # // comment util end of line
-            code.getchar() # eat '//'
-            g_last_char = code.getchar()
-            while g_last_char and g_last_char != "\n" and g_last_char != "\r":
-                g_last_char = code.getchar()
-
-            if g_last_char:
-                return get_token(code)
-
-    if g_last_char == "\r" or g_last_char == "\n" or g_last_char == ";":
-        print("eat nl", g_last_char)
-        g_last_char = code.getchar()  # eat nl
-        #while g_last_char == "\r" or g_last_char == "\n" or g_last_char == ";":
-        #    print("eat nl2", g_last_char)
-        #    g_last_char = code.getchar()
-        return Token.NEW_LINE
-
-    #if g_last_char == "{":
-    #    g_last_char = code.getchar()  # eat `{`
-    #    return Token.BLOCK
-
-    #if g_last_char == "(":
-    #    g_last_char = code.getchar()  # eat `(`
-    #    return Token.PAREN
-
-    this_char = g_last_char
-    g_last_char = code.getchar()
-    return this_char
-
-
-def get_next_token(code: StringBuffer):
-    global g_cur_token
-    g_cur_token = get_token(code)
-    print("[Token] get_next_token, g_cur_token=%s, g_last_char=%s, g_identifier_str=%s, g_number_val=%d" % (g_cur_token, g_last_char, g_identifier_str, g_number_val))
-    return g_cur_token
+
+# kind code of a token in a TokenBuffer -> the token, the Token members are their (negative) values,
+# a single ASCII char is its code point, any other char is 0 and is kept in the table
+g_kind_tokens = [chr(code) for code in range(128)] + [None] * 128
+for _token in Token:
+    g_kind_tokens[_token.value] = _token
+del _token
+g_number_kind = Token.NUMBER.value
+
+
+class TokenBuffer(object):
+    """
+    The tokens of a whole source, tokenized once, as a struct of arrays rather than an object per token:
+        kinds  - array('b'), the kind code of every token, see `g_kind_tokens`
+        starts, ends - array('i'), the offsets of every token in the source
+        values - array('i'), the index in `table` of the identifier, keyword, number or char of every token, -1 for none
+        table  - the values, interned: an identifier used 1000 times is stored once
+    The last token is always EOF. The buffer is never modified by the parser, several passes can walk it.
+    """
+
+    def __init__(self, code: StringBuffer):
+        self.code = code  # for the positions of the tokens
+        self.kinds = array("b")
+        self.starts = array("i")
+        self.ends = array("i")
+        self.values = array("i")
+        self.table = []
+        self._interned = {}
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def append(self, token, start: int, end: int, value=None):
+        """ append a token, `value` is the identifier, keyword or number of the token """
+        if type(token) is str:
+            kind = ord(token) if ord(token) < 128 else 0
+            if kind == 0:
+                value = token
+        else:
+            kind = token.value
+        self.kinds.append(kind)
+        self.starts.append(start)
+        self.ends.append(end)
+        self.values.append(self.intern(value) if value is not None else -1)
+
+    def intern(self, value) -> int:
+        """ the index of `value` in the table, identifiers, keywords, numbers and chars never compare equal """
+        index = self._interned.get(value)
+        if index is None:
+            index = self._interned[value] = len(self.table)
+            self.table.append(value)
+        return index
+
+    def token(self, index: int):
+        """ the token at `index`, a `Token` or a single char like `Lexer.cur_token` """
+        kind = self.kinds[index]
+        return g_kind_tokens[kind] if kind else self.table[self.values[index]]
+
+
+def tokenize(code: StringBuffer) -> TokenBuffer:
+    """ all the tokens of `code` into a TokenBuffer, with the master regex of RegexLexer """
+    tokens = TokenBuffer(code)
+    add_kind = tokens.kinds.append
+    add_start = tokens.starts.append
+    add_end = tokens.ends.append
+    add_value = tokens.values.append
+    interned = tokens._interned
+    table = tokens.table
+    keywords = {keyword: token.value for keyword, token in g_keywords.items()}
+    identifier, number, new_line = Token.IDENTIFIER.value, Token.NUMBER.value, Token.NEW_LINE.value
+    end = code._index
+    for m in g_token_pattern.finditer(code._value, end):
+        if m.start() != end:  # only whitespace and comments were left, finditer searched further
+            break
+        group = m.lastgroup
+        start, end = m.span(group)
+        add_start(start)
+        add_end(end)
+        if group == "new_line":
+            add_kind(new_line)
+            add_value(-1)
+            continue
+        text = m.group(group)
+        if group == "identifier":
+            add_kind(keywords.get(text, identifier))
+            value = text
+        elif group == "number":
+            add_kind(number)
+            try:
+                value = float(text)
+            except ValueError:
+                raise syntax_error("invalid number %s" % text, code, start, end) from None
+        else:
+            char = ord(text)
+            if char < 128:
+                add_kind(char)
+                add_value(-1)
+                continue
+            add_kind(0)
+            value = text
+        index = interned.get(value)
+        if index is None:
+            index = interned[value] = len(table)
+            table.append(value)
+        add_value(index)
+    tokens.append(Token.EOF, code._length, code._length)
+    return tokens
+
+
+class TokenBufferLexer(object):
+    """
+    Same interface as `Lexer`, walking a TokenBuffer by index: the source is tokenized once when the lexer is
+    created, unless a TokenBuffer is given(e.g. the one of a previous pass), and `peek_token(k)` looks
+    k tokens ahead in O(1). After the EOF token, `get_next_token` keeps returning EOF.
+    """
+
+    def __init__(self, code: StringBuffer, tokens: TokenBuffer = None):
+        self.tokens = tokens if tokens is not None else tokenize(code)
+        self.code = self.tokens.code
+        self.identifier_str: str = None
+        self.number_val: float = 0
+        self.cur_token = None
+        self.token_start = 0
+        self.token_end = 0
+        self.prev_token_end = 0
+        self.trace = log.is_enabled(logger)
+        self._index = -1
+        self._last = len(self.tokens) - 1
+
+    def curline(self):
+        return self.code.line_at(self.token_start)
+
+    def get_next_token(self):
+        tokens = self.tokens
+        index = self._index
+        if index < self._last:
+            index = self._index = index + 1
+        self.prev_token_end = self.token_end
+        self.token_start = tokens.starts[index]
+        self.token_end = tokens.ends[index]
+        kind = tokens.kinds[index]
+        value_index = tokens.values[index]
+        if value_index < 0:
+            token = g_kind_tokens[kind]
+        elif kind == g_number_kind:
+            token = Token.NUMBER
+            self.number_val = tokens.table[value_index]
+        elif kind:
+            token = g_kind_tokens[kind]
+            self.identifier_str = tokens.table[value_index]
+        else:
+            token = tokens.table[value_index]
+        self.cur_token = token
+        if self.trace:
+            logger.debug("get_next_token, cur_token=%s, index=%d", token, index)
+        return token
+
+    def peek_token(self, k: int = 1):
+        """ the k-th token after the current one, without consuming it """
+        return self.tokens.token(min(self._index + k, self._last))
+
+
+g_lexer_backends = {
+    "char": Lexer,
+    "regex": RegexLexer,
+    "buffer": TokenBufferLexer,
+}
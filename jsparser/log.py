@@ -0,0 +1,43 @@
+"""
+Trace facility of the lexer, parser and codegen, based on `logging`.
+
+Every subsystem logs into its own logger(`jsparser.lexer`, `jsparser.parser`, `jsparser.codegen`),
+trace is disabled by default. The hot paths check a flag that is computed once per Lexer/Parser,
+so nothing is formatted when the trace is disabled.
+
+e.g.:
+    from jsparser import log
+    log.enable("lexer", "parser")
+"""
+import logging
+
+SUBSYSTEMS = ("lexer", "parser", "codegen")
+
+
+def get_logger(subsystem: str) -> logging.Logger:
+    return logging.getLogger("jsparser." + subsystem)
+
+
+def is_enabled(logger: logging.Logger) -> bool:
+    return logger.isEnabledFor(logging.DEBUG)
+
+
+def enable(*subsystems, handler: logging.Handler = None):
+    """
+    Enable the trace of the given subsystems(all of them if none is given).
+    A stderr handler is installed on the `jsparser` logger unless one is provided or already exists.
+    """
+    root = logging.getLogger("jsparser")
+    if handler is not None:
+        root.addHandler(handler)
+    elif not root.handlers:
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(logging.Formatter("[%(name)s] %(message)s"))
+        root.addHandler(stream_handler)
+    for subsystem in subsystems or SUBSYSTEMS:
+        get_logger(subsystem).setLevel(logging.DEBUG)
+
+
+def disable(*subsystems):
+    for subsystem in subsystems or SUBSYSTEMS:
+        get_logger(subsystem).setLevel(logging.NOTSET)
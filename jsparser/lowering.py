@@ -0,0 +1,217 @@
+"""
+Lower the javascript AST straight into a python `ast.Module` and compile it,
+without generating python source code which CPython would have to tokenize and parse again.
+"""
+import ast as py_ast
+from . import ast
+from . import split
+
+
+# operator and context nodes have no state, they are shared like CPython's own parser does
+g_bin_ops = {
+    "+": py_ast.Add(),
+    "-": py_ast.Sub(),
+    "*": py_ast.Mult(),
+    "/": py_ast.Div(),
+}
+g_cmp_ops = {
+    "<": py_ast.Lt(),
+    ">": py_ast.Gt(),
+}
+g_load = py_ast.Load()
+g_store = py_ast.Store()
+
+
+class Lowering(object):
+    """
+    Visitor which translates the javascript AST into python AST nodes.
+    Given the `lexer.LineIndex` of the javascript source(`ctx["lines"]`), every statement gets the line number
+    of its javascript source, so the line of a runtime error is the javascript line. Otherwise every statement
+    gets its own line number, in the order of the statements.
+    Locations are set on every node as it is created, `ast.fix_missing_locations` would walk the tree once more.
+    A statement whose expression is deeper than `split.g_max_expr_depth` nodes is split, see `split.split_deep`.
+    """
+
+    def __init__(self, lines=None):
+        self._lineno = 0
+        self._lines = lines
+        self._new_temp = split.TempNames()
+
+    def _next_lineno(self, node) -> int:
+        if self._lines is None:
+            self._lineno += 1
+        elif node.span is not None:
+            self._lineno = self._lines.position(node.span[0])[0]
+        return max(self._lineno, 1)  # a generated node is on the line of the previous statement
+
+    def _located(self, stmt, lineno: int):
+        """ the end positions are optional, leaving them out saves time on large modules """
+        stmt.lineno = lineno
+        stmt.col_offset = 0
+        return stmt
+
+    def lower_ctx(self, ctx) -> py_ast.Module:
+        body = []
+        for g in ctx['globals']:
+            body.extend(self.lower_statement(g.body))
+        for function_ast in ctx['functions']:
+            body.append(self.lower_function(function_ast))
+        return py_ast.Module(body=body, type_ignores=[])
+
+    def lower_function(self, node: ast.FunctionAST) -> py_ast.FunctionDef:
+        return self.lower_statement(node)[0]
+
+    def lower_suite(self, node: ast.ExprAST):
+        """ the body of a `def`, `if` or `else`, never empty """
+        body = []
+        self._lower([("suite", node, body)])
+        return body
+
+    def lower_statement(self, node: ast.ExprAST):
+        """ a list of python statements, python has no block scope so blocks are flattened """
+        body = []
+        self._lower([("statement", node, body)])
+        return body
+
+    def _lower(self, stack):
+        """
+        lower the items (action, node, body) on `stack`, last first, appending the python statements to `body`,
+        with an explicit stack so deeply nested blocks and `if`s don't hit the recursion limit. The actions:
+        "statement" lowers a statement, "suite" the body of a `def`, `if` or `else` and "pass" appends a `pass`
+        to an empty suite. The nested suites fill the bodies of the python nodes after they are created.
+        """
+        push = stack.append
+        pop = stack.pop
+        while stack:
+            action, node, body = pop()
+            if action == "suite":
+                push(("pass", node, body))
+                push(("statement", node, body))
+                continue
+            if action == "pass":
+                if not body:
+                    body.append(self._located(py_ast.Pass(), self._next_lineno(node)))
+                continue
+
+            if isinstance(node, ast.BlockExprAST):
+                stack.extend([("statement", expr, body) for expr in reversed(node.body_expr)])
+                continue
+            lineno = self._next_lineno(node)
+            if isinstance(node, ast.FunctionAST):
+                args = [py_ast.arg(arg=arg, lineno=lineno, col_offset=0) for arg in node.proto.args]
+                arguments = py_ast.arguments(posonlyargs=[], args=args,
+                                             vararg=None, kwonlyargs=[], kw_defaults=[], kwarg=None, defaults=[])
+                fields = {}
+                if "type_params" in py_ast.FunctionDef._fields:  # python 3.12+
+                    fields["type_params"] = []
+                function_def = py_ast.FunctionDef(name=node.proto.name, args=arguments, body=[],
+                                                  decorator_list=[], returns=None, **fields)
+                body.append(self._located(function_def, lineno))
+                push(("suite", node.body, function_def.body))
+                continue
+
+            try:
+                if isinstance(node, ast.IfExprAST):
+                    test = self.lower_expr(node.cond_expr, lineno, split.g_max_expr_depth)
+                elif isinstance(node, ast.ReturnExprAST):
+                    value = self.lower_expr(node.rhs, lineno, split.g_max_expr_depth)
+                elif isinstance(node, ast.BinaryExprAST) and node.op == "=":
+                    value = self.lower_expr(node.rhs, lineno, split.g_max_expr_depth - 1)
+                else:
+                    value = self.lower_expr(node, lineno, split.g_max_expr_depth)
+            except split.TooDeep:
+                statements = split.split_deep(node, split.g_max_expr_depth, self._new_temp)
+                stack.extend([("statement", statement, body) for statement in reversed(statements)])
+                continue
+            if isinstance(node, ast.IfExprAST):
+                if_stmt = self._located(py_ast.If(test=test, body=[], orelse=[]), lineno)
+                body.append(if_stmt)
+                if node.else_expr is not None:
+                    push(("suite", node.else_expr, if_stmt.orelse))
+                push(("suite", node.then_expr, if_stmt.body))
+            elif isinstance(node, ast.ReturnExprAST):
+                body.append(self._located(py_ast.Return(value=value), lineno))
+            elif isinstance(node, ast.BinaryExprAST) and node.op == "=":
+                target = self._store_target(node.lhs, lineno)
+                body.append(self._located(py_ast.Assign(targets=[target], value=value), lineno))
+            else:
+                body.append(self._located(py_ast.Expr(value=value), lineno))
+
+    def lower_expr(self, node: ast.ExprAST, lineno: int, max_depth: int = None) -> py_ast.expr:
+        """
+        lower an expression of the statement at `lineno`, with an explicit stack so deep expressions don't hit
+        the recursion limit. Raises split.TooDeep past `max_depth` nested nodes.
+        """
+        results = []
+        push_result = results.append
+        stack = [(node, False, 1)]
+        push = stack.append
+        pop = stack.pop
+        if max_depth is None:
+            max_depth = float("inf")
+        while stack:
+            node, lowered_operands, depth = pop()
+            node_type = type(node)
+            if node_type is ast.NumberExprAST:  # the leaves first, they are the most frequent
+                push_result(py_ast.Constant(value=node.value, lineno=lineno, col_offset=0))
+            elif node_type is ast.VariableExprAST:
+                push_result(_load_name(node.name, lineno))
+            elif lowered_operands:
+                if node_type is ast.CallExprAST:
+                    start = len(results) - len(node.args)
+                    args = results[start:]
+                    del results[start:]
+                    push_result(py_ast.Call(func=_load_name(node.callee, lineno), args=args, keywords=[],
+                                            lineno=lineno, col_offset=0))
+                elif node.op == "=":  # assignment used as an expression
+                    value = results.pop()
+                    push_result(py_ast.NamedExpr(target=self._store_target(node.lhs, lineno), value=value,
+                                                 lineno=lineno, col_offset=0))
+                else:
+                    right = results.pop()
+                    left = results.pop()
+                    if node.op in g_bin_ops:
+                        push_result(py_ast.BinOp(left=left, op=g_bin_ops[node.op], right=right,
+                                                 lineno=lineno, col_offset=0))
+                    else:
+                        push_result(py_ast.Compare(left=left, ops=[g_cmp_ops[node.op]], comparators=[right],
+                                                   lineno=lineno, col_offset=0))
+            elif depth > max_depth:
+                raise split.TooDeep()
+            elif isinstance(node, ast.BinaryExprAST):
+                if node.op not in g_bin_ops and node.op not in g_cmp_ops and node.op != "=":
+                    raise TypeError("unsupported binary operator %s" % node.op)
+                push((node, True, depth))
+                push((node.rhs, False, depth + 1))
+                if node.op != "=":
+                    push((node.lhs, False, depth + 1))
+            elif isinstance(node, ast.CallExprAST):
+                push((node, True, depth))
+                for index in range(len(node.args) - 1, -1, -1):
+                    push((node.args[index], False, depth + 1))
+            else:
+                raise TypeError("can not lower %s as a python expression" % type(node).__name__)
+        return results[0]
+
+    def _store_target(self, node: ast.ExprAST, lineno: int) -> py_ast.Name:
+        if not isinstance(node, ast.VariableExprAST) or "." in node.name:
+            raise TypeError("can not assign to %s" % type(node).__name__)
+        return py_ast.Name(id=node.name, ctx=g_store, lineno=lineno, col_offset=0)
+
+
+def _load_name(name: str, lineno: int) -> py_ast.expr:
+    """ `a` or a member expression like `Math.max` """
+    parts = name.split(".")
+    expr = py_ast.Name(id=parts[0], ctx=g_load, lineno=lineno, col_offset=0)
+    for attr in parts[1:]:
+        expr = py_ast.Attribute(value=expr, attr=attr, ctx=g_load, lineno=lineno, col_offset=0)
+    return expr
+
+
+def lower_ctx(ctx) -> py_ast.Module:
+    return Lowering(ctx.get("lines")).lower_ctx(ctx)
+
+
+def compile_ctx(ctx, filename: str = "<jsparser>"):
+    """ compile the parsed `ctx` into a python code object """
+    return compile(lower_ctx(ctx), filename, "exec")
@@ -0,0 +1,320 @@
+"""
+Optimization passes over the parsed AST, run between the parser and codegen.
+
+Optimization levels:
+    0 - no optimization
+    1 - constant folding of number literals, e.g.: `2 * 3.5 + 1` -> `8.0`,
+        and codegen only emits the parentheses required by the operator precedence
+    2 - algebraic simplification, e.g.: `x * 1` -> `x`, `x + 0` -> `x`.
+        It assumes number operands, as javascript arithmetic does(`x + 0` with x = -0.0 gives x)
+    3 - inlining of small leaf functions at their call sites, see `Inliner`
+"""
+import collections
+import math
+import operator
+from . import ast
+
+
+g_fold_ops = {
+    "+": operator.add,
+    "-": operator.sub,
+    "*": operator.mul,
+    "/": operator.truediv,
+}
+
+
+class NodeTransformer(object):
+    """
+    Rewrite the expressions in place, bottom-up, `visit` returns the replacement of every node
+    given by `leave`. `enter` is called on every node before its children. The tree is walked
+    with an explicit stack, deep expressions don't hit the recursion limit.
+    """
+
+    def visit(self, node):
+        enter = self.enter
+        leave = self.leave
+        results = []
+        push_result = results.append
+        stack = [node]
+        push = stack.append
+        pop = stack.pop
+        while stack:
+            node = pop()
+            if type(node) is tuple:  # the children of the node are visited
+                node, num_children = node
+                start = len(results) - num_children
+                _set_children(node, results[start:])
+                del results[start:]
+                push_result(leave(node))
+                continue
+            enter(node)
+            node_type = type(node)
+            children = None if node_type is ast.NumberExprAST or node_type is ast.VariableExprAST else _children(node)
+            if not children:
+                push_result(leave(node))
+                continue
+            push((node, len(children)))
+            for index in range(len(children) - 1, -1, -1):
+                push(children[index])
+        return results[0]
+
+    def enter(self, node):
+        pass
+
+    def leave(self, node):
+        return node
+
+
+def _children(node):
+    """ the child nodes rewritten by NodeTransformer """
+    if isinstance(node, ast.BinaryExprAST):
+        return [node.lhs, node.rhs]
+    if isinstance(node, ast.FunctionAST):
+        return [node.body]
+    if isinstance(node, ast.BlockExprAST):
+        return node.body_expr
+    if isinstance(node, ast.ReturnExprAST):
+        return [node.rhs]
+    if isinstance(node, ast.CallExprAST):
+        return node.args
+    if isinstance(node, ast.IfExprAST):
+        if node.else_expr is not None:
+            return [node.cond_expr, node.then_expr, node.else_expr]
+        return [node.cond_expr, node.then_expr]
+    return []
+
+
+def _set_children(node, children):
+    if isinstance(node, ast.BinaryExprAST):
+        node.lhs, node.rhs = children
+    elif isinstance(node, ast.FunctionAST):
+        node.body, = children
+    elif isinstance(node, ast.BlockExprAST):
+        node.body_expr = children
+    elif isinstance(node, ast.ReturnExprAST):
+        node.rhs, = children
+    elif isinstance(node, ast.CallExprAST):
+        node.args = children
+    elif len(children) == 3:
+        node.cond_expr, node.then_expr, node.else_expr = children
+    else:
+        node.cond_expr, node.then_expr = children
+
+
+class ConstantFolder(NodeTransformer):
+
+    def __init__(self, level: int):
+        self.level = level
+
+    def leave(self, node):
+        if isinstance(node, ast.BinaryExprAST):
+            return self.fold_binary(node)
+        return node
+
+    def fold_binary(self, node: ast.BinaryExprAST) -> ast.ExprAST:
+        if node.op not in g_fold_ops:
+            return node
+        lhs, rhs = node.lhs, node.rhs
+        if isinstance(lhs, ast.NumberExprAST) and isinstance(rhs, ast.NumberExprAST):
+            if node.op == "/" and rhs.value == 0:
+                return node  # keep the ZeroDivisionError for the runtime
+            value = g_fold_ops[node.op](lhs.value, rhs.value)
+            if not math.isfinite(value):
+                return node  # python has no literal for inf and nan
+            return ast.NumberExprAST(value)
+
+        if self.level >= 2:
+            if node.op == "*" and _is_number(rhs, 1) or node.op == "/" and _is_number(rhs, 1):
+                return lhs
+            if node.op == "*" and _is_number(lhs, 1):
+                return rhs
+            if (node.op == "+" or node.op == "-") and _is_number(rhs, 0):
+                return lhs
+            if node.op == "+" and _is_number(lhs, 0):
+                return rhs
+        return node
+
+
+class Inliner(NodeTransformer):
+    """
+    Substitute the calls of small leaf functions with their return expression, e.g.:
+        function add(a, b) { return a + b; }
+        function f(x) { return add(x, 2) * 3; }  ->  return (x + 2.0) * 3.0
+
+    A function is inlined when its body is a single `return` of at most `max_nodes` nodes,
+    without calls(it can not be recursive) or assignments. A call site is inlined when:
+        - it is inside a function, globals run before the functions of the script are defined
+        - every argument is free of calls and assignments, and an argument which is not a
+          number or a variable is used exactly once, so nothing is evaluated twice or dropped
+        - no local variable of the caller hides a global variable read by the inlined body
+
+    The functions are still emitted, the host can call them. Rebinding an inlined function
+    afterwards(`JSEngine.set`, or a later script) does not change the call sites inlined before.
+    """
+
+    def __init__(self, ctx, max_nodes: int = 32):
+        self.inlined = 0  # number of inlined call sites
+        self._local_names = None
+        self._outer_local_names = []  # of the functions around a nested one
+        self._functions = {}
+        defined = collections.Counter(function_ast.proto.name for function_ast in ctx['functions'])
+        assigned = set()
+        for g in ctx['globals']:
+            assigned.update(_assigned_names(g.body))
+        for function_ast in ctx['functions']:
+            name = function_ast.proto.name
+            if defined[name] > 1 or name in assigned:
+                continue
+            expr = _single_return(function_ast.body)
+            if expr is not None and _is_pure(expr) and _count_nodes(expr) <= max_nodes:
+                self._functions[name] = (function_ast.proto.args, expr, _free_names(expr, function_ast.proto.args))
+
+    def enter(self, node):
+        if isinstance(node, ast.FunctionAST):
+            self._outer_local_names.append(self._local_names)
+            self._local_names = set(node.proto.args) | _assigned_names(node.body)
+
+    def leave(self, node):
+        if isinstance(node, ast.FunctionAST):
+            self._local_names = self._outer_local_names.pop()
+        elif isinstance(node, ast.CallExprAST) and self._local_names is not None:
+            return self.inline_call(node)
+        return node
+
+    def inline_call(self, node: ast.CallExprAST) -> ast.ExprAST:
+        function = self._functions.get(node.callee)
+        if function is None or node.callee in self._local_names:
+            return node
+        params, expr, free_names = function
+        if len(params) != len(node.args) or not free_names.isdisjoint(self._local_names):
+            return node
+        uses = _count_uses(expr)
+        for param, arg in zip(params, node.args):
+            if not _is_pure(arg):
+                return node
+            if uses.get(param, 0) != 1 and not isinstance(arg, (ast.NumberExprAST, ast.VariableExprAST)):
+                return node
+        self.inlined += 1
+        return _substitute(expr, dict(zip(params, node.args)))
+
+
+def _is_number(node, value) -> bool:
+    return isinstance(node, ast.NumberExprAST) and node.value == value
+
+
+def _single_return(body):
+    """ the expression of a body made of a single `return`, or None """
+    while isinstance(body, ast.BlockExprAST) and len(body.body_expr) == 1:
+        body = body.body_expr[0]
+    return body.rhs if isinstance(body, ast.ReturnExprAST) else None
+
+
+def _is_pure(node) -> bool:
+    """ an expression of numbers, variables and operators, without calls or assignments """
+    for child in ast.walk(node):
+        if isinstance(child, ast.CallExprAST) or isinstance(child, ast.BinaryExprAST) and child.op == "=":
+            return False
+    return True
+
+
+def _count_nodes(node) -> int:
+    return sum(1 for _ in ast.walk(node))
+
+
+def _count_uses(node):
+    return collections.Counter(child.name for child in ast.walk(node) if isinstance(child, ast.VariableExprAST))
+
+
+def _free_names(node, params):
+    """ the global names read by an expression, `Math` for `Math.PI` """
+    return {child.name.split(".")[0] for child in ast.walk(node)
+            if isinstance(child, ast.VariableExprAST) and child.name not in params}
+
+
+def _assigned_names(node):
+    """ names assigned in a body, they are the local variables of a python function """
+    return {child.lhs.name for child in ast.walk(node)
+            if isinstance(child, ast.BinaryExprAST) and child.op == "=" and isinstance(child.lhs, ast.VariableExprAST)}
+
+
+def _substitute(node, args):
+    """ copy of `node` with the parameters replaced by a copy of their argument """
+    results = []
+    stack = [(node, args, False)]
+    while stack:
+        node, args, copied_operands = stack.pop()
+        if copied_operands:
+            rhs = results.pop()
+            lhs = results.pop()
+            results.append(ast.BinaryExprAST(lhs, node.op, rhs))
+        elif isinstance(node, ast.VariableExprAST):
+            if node.name in args:
+                stack.append((args[node.name], {}, False))
+            else:
+                results.append(ast.VariableExprAST(node.name))
+        elif isinstance(node, ast.NumberExprAST):
+            results.append(ast.NumberExprAST(node.value))
+        elif isinstance(node, ast.BinaryExprAST):
+            stack.append((node, args, True))
+            stack.append((node.rhs, args, False))
+            stack.append((node.lhs, args, False))
+        else:
+            raise TypeError("can not inline %s" % type(node).__name__)
+    return results[0]
+
+
+def _referenced_names(node):
+    """ names of the called functions and of the variables, `Math` for `Math.max` """
+    names = set()
+    for child in ast.walk(node):
+        if isinstance(child, ast.CallExprAST):
+            names.add(child.callee.split(".")[0])
+        elif isinstance(child, ast.VariableExprAST):
+            names.add(child.name.split(".")[0])
+    return names
+
+
+def shake(ctx, roots):
+    """
+    Tree shaking, drop the functions of `ctx` which are not reachable from the `roots`
+    (e.g.: the names the host calls through `JSEngine.get`) or from the global statements,
+    which always run. Returns `ctx`.
+
+    A function is reachable when a reachable body calls it or reads its name. Parameters are
+    not told apart from the functions they hide, the analysis keeps a function rather than drop
+    a used one.
+    """
+    functions = collections.defaultdict(list)
+    for function_ast in ctx['functions']:
+        functions[function_ast.proto.name].append(function_ast)
+
+    pending = list(roots)
+    for g in ctx['globals']:
+        pending.extend(_referenced_names(g.body))
+    reachable = set()
+    while pending:
+        name = pending.pop()
+        if name in reachable or name not in functions:
+            continue
+        reachable.add(name)
+        for function_ast in functions[name]:
+            pending.extend(_referenced_names(function_ast.body))
+
+    ctx['functions'] = [function_ast for function_ast in ctx['functions'] if function_ast.proto.name in reachable]
+    return ctx
+
+
+def optimize(ctx, level: int = 1):
+    """ optimize the globals and functions of `ctx` in place, returns `ctx` """
+    if level <= 0:
+        return ctx
+    if level >= 3:
+        inliner = Inliner(ctx)
+        for function_ast in ctx['functions']:
+            inliner.visit(function_ast)
+    folder = ConstantFolder(level)
+    for g in ctx['globals']:
+        folder.visit(g)
+    for function_ast in ctx['functions']:
+        folder.visit(function_ast)
+    return ctx
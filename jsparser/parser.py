@@ -1,9 +1,13 @@
-from typing import Optional
+import time
+from concurrent.futures import ThreadPoolExecutor
 from . import ast
 from . import lexer
+from . import log
+from .errors import syntax_error
 
 
-g_top_level_function_proto = None
+logger = log.get_logger("parser")
+
 g_bin_op_precedence = {
     "=": 2,
     "<": 10,
@@ -13,325 +17,460 @@ g_bin_op_precedence = {
     "*": 40,
     "/": 40 # highest
 }
-g_block_level = 0
-
-
-def reset():
-    global g_top_level_function_proto, g_block_level
-    g_top_level_function_proto = None
-    g_block_level = 0
-
-
-def parse_identifier_expr(code, ctx) -> Optional[ast.ExprAST]:
-    print("parse_identifier_expr")
-    id_name = lexer.g_identifier_str
-    lexer.get_next_token(code) # eat identifier
-
-    is_call = False
-    if lexer.g_cur_token == ".":
-        # MemberExpression
-        lexer.get_next_token(code) # eat '.'
-        id_name += "." + lexer.g_identifier_str # join MemberExpression, e.g.: class_name="Math", method_name="max", id_name="Math.max"
-        print("is_call, id_name=%s" % id_name)
-        lexer.get_next_token(code) # eat identifier after  after `.`
-        is_call = True
-
-    id_name = map_symbol(id_name, ctx)
+g_expression_tokens = (lexer.Token.NUMBER, lexer.Token.IDENTIFIER, lexer.Token.RETURN,
+                       lexer.Token.VAR, lexer.Token.IF, lexer.Token.ELSE)
+g_primary_prec = 41  # higher than every operator, an expression of this precedence is a single operand
+
+
+class Parser(object):
+    """
+    Recursive descent parser, all the parsing state lives in the instance,
+    so a parser can be used from any thread as long as it is not shared.
+
+    The expressions and the statements nested in them(parentheses, calls, `return`, `var`, `if`
+    and blocks) are parsed by one loop with an explicit stack instead of the python stack, see
+    `_expression`, so the nesting depth is not bounded by the recursion limit.
+
+    Every statement(and function, prototype and block) gets the `span` of its source, the nodes of the expressions
+    have none, their spans would take more memory than the nodes. A syntax error raises `errors.JSSyntaxError`
+    with the position of the offending token.
+    """
+
+    def __init__(self, lex: lexer.Lexer, ctx):
+        self.lexer = lex
+        self.ctx = ctx
+        self.block_level = 0
+        self.top_level_function_proto = None
+        self.trace = log.is_enabled(logger)  # checked before every trace, so nothing is formatted when disabled
+
+    def _error(self, msg: str):
+        """ a JSSyntaxError at the current token """
+        lex = self.lexer
+        return syntax_error(msg, lex.code, lex.token_start, lex.token_end)
+
+    def _identifier(self):
+        """ eat an identifier or a member expression, returns (mapped name, is_call) """
+        id_name = self.lexer.identifier_str
+        self.lexer.get_next_token() # eat identifier
+
+        is_call = False
+        if self.lexer.cur_token == ".":
+            # MemberExpression
+            self.lexer.get_next_token() # eat '.'
+            id_name += "." + self.lexer.identifier_str # join MemberExpression, e.g.: class_name="Math", method_name="max", id_name="Math.max"
+            if self.trace:
+                logger.debug("is_call, id_name=%s", id_name)
+            self.lexer.get_next_token() # eat identifier after  after `.`
+            is_call = True
+
+        return self.map_symbol(id_name), is_call or self.lexer.cur_token == "("
+
+    def map_symbol(self, symbol_name):
+        if "externals" in self.ctx and symbol_name in self.ctx['externals']:
+            return self.ctx['externals'][symbol_name]
+        return symbol_name
+
+    def parse_number_expr(self) -> ast.NumberExprAST:
+        number_expr = ast.NumberExprAST(self.lexer.number_val)
+        self.lexer.get_next_token()  # consume the number
+        return number_expr
+
+    def parse_primary(self) -> ast.ExprAST:
+        """ a single operand: identifier, call, number, parenthesized expression, `return`, `var`, `if` or block """
+        return self._expression(g_primary_prec)
+
+    def get_token_precedence(self) -> int:
+        if type(self.lexer.cur_token) is not str:
+            return -1
+
+        if self.lexer.cur_token in g_bin_op_precedence:
+            token_prec = g_bin_op_precedence[self.lexer.cur_token]
+        else:
+            token_prec = -1
+        return token_prec
+
+    def parse_bin_op_rhs(self, expr_prec: int, lhs: ast.ExprAST) -> ast.ExprAST:
+        """ `lhs` followed by the binary operators of a precedence >= `expr_prec` """
+        return self._expression(expr_prec, lhs)
+
+    def parse_expression(self) -> ast.ExprAST:
+        return self._expression()
+
+    def parse_block_expr(self) -> ast.BlockExprAST:
+        return self._expression(g_primary_prec)
+
+    def _expression(self, expr_prec: int = 0, lhs: ast.ExprAST = None) -> ast.ExprAST:
+        """
+        Iterative precedence climbing: `lhs`(parsed when None) followed by the binary operators of a
+        precedence >= `expr_prec`, all the operators are left-associative. An operator first reduces the
+        operators of the stack with a precedence >= its own, then it is pushed.
+
+        A nested expression(in parentheses, a call argument, the expression of a `return` or `var`,
+        the condition or a branch of an `if`, a statement of a block) saves the enclosing expression
+        on `frames` with the kind of construct it belongs to. When the nested expression ends, the
+        construct either expects another nested expression(the next argument, the next statement of
+        the block, ...) or is complete and becomes an operand of the enclosing expression.
+        A nested expression which is a statement(of a block, a branch of an `if`, or the whole expression) gets
+        the span from `expr_start`, the offset of its first token.
+        """
+        if self.trace:
+            logger.debug("parse_expression")
+        lex = self.lexer
+        NUMBER, IDENTIFIER, RETURN, VAR, IF, ELSE = g_expression_tokens
+        frames = []  # (kind, data, operands, operators, expr_prec, start offset, expr_start) of the enclosing expressions
+        expr_start = lex.token_start if lhs is None else None  # the start of `lhs` is not known
+        operands = []
+        operators = []  # (precedence, op)
+        if lhs is not None:
+            operands.append(lhs)
+        while True:
+            if len(operands) == len(operators):  # expecting an operand
+                token = lex.cur_token
+                start = lex.token_start
+                kind = None
+                if token == NUMBER:
+                    operand = self.parse_number_expr()
+                elif token == IDENTIFIER:
+                    id_name, is_call = self._identifier()
+                    if not is_call:
+                        if self.trace:
+                            logger.debug("Found variable expr AST, name=%s", id_name)
+                        operand = ast.VariableExprAST(name=id_name)
+                    else:
+                        lex.get_next_token() # eat '('
+                        if lex.cur_token == ")":
+                            lex.get_next_token() # eat ')'
+                            operand = ast.CallExprAST(callee=id_name, args=[])
+                        else:
+                            kind, data = "call", (id_name, [])
+                elif token == "(":
+                    if self.trace:
+                        logger.debug("parse_paren_expr")
+                    lex.get_next_token()  # eat '('
+                    kind, data = "paren", None
+                elif token == RETURN:
+                    if self.trace:
+                        logger.debug("parse_return_expr")
+                    lex.get_next_token()  # eat 'return'
+                    kind, data = "return", None
+                elif token == VAR:
+                    if self.trace:
+                        logger.debug("parse_variable_declaration_expr")
+                    lex.get_next_token()  # eat 'var'
+                    if lex.cur_token != IDENTIFIER:
+                        raise self._error("expected a variable name")
+                    name_start = lex.token_start
+                    id_name, is_call = self._identifier()
+                    if is_call:
+                        raise syntax_error("expected a variable name", lex.code, name_start, lex.prev_token_end)
+                    variable_expr = ast.VariableExprAST(name=id_name)
+                    # the declaration is the binary expression `name = rhs`, parsed from its lhs
+                    frames.append(("var", variable_expr, operands, operators, expr_prec, start, expr_start))
+                    operands, operators, expr_prec, expr_start = [variable_expr], [], 0, name_start
+                    continue
+                elif token == IF:
+                    if self.trace:
+                        logger.debug("parse_if_expr")
+                    lex.get_next_token()  # eat `if`
+                    if lex.cur_token != "(":
+                        raise self._error("expected '(' after 'if'")
+                    lex.get_next_token()  # eat `(`
+                    kind, data = "if", []  # [cond_expr, then_expr]
+                elif token == "{":
+                    if self.trace:
+                        logger.debug("parse_block_expr, block_level=%d", self.block_level)
+                    lex.get_next_token()  # eat '{'
+                    self.block_level += 1
+                    if self._is_block_end():
+                        operand = self._end_block([], start)
+                    else:
+                        kind, data = "block", []
+                else:
+                    if operators:
+                        raise self._error("unexpected %s, expected the rhs of '%s'" % (_token_name(token), operators[-1][1]))
+                    raise self._error("unexpected %s, expected an expression" % _token_name(token))
+
+                if kind is not None:  # parse the first nested expression of the construct
+                    frames.append((kind, data, operands, operators, expr_prec, start, expr_start))
+                    operands, operators, expr_prec, expr_start = [], [], 0, lex.token_start
+                    continue
+                operands.append(operand)
+
+            bin_op = lex.cur_token
+            token_prec = g_bin_op_precedence.get(bin_op, -1) if type(bin_op) is str else -1  # get_token_precedence()
+            if token_prec >= expr_prec:
+                lex.get_next_token()  # eat bin_op
+                while operators and operators[-1][0] >= token_prec:
+                    rhs = operands.pop()
+                    operands[-1] = ast.BinaryExprAST(lhs=operands[-1], op=operators.pop()[1], rhs=rhs)
+                operators.append((token_prec, bin_op))
+                continue
+
+            # the end of the expression
+            while operators:
+                rhs = operands.pop()
+                operands[-1] = ast.BinaryExprAST(lhs=operands[-1], op=operators.pop()[1], rhs=rhs)
+            value = operands[0]
+            end = value.span[1] if value.span is not None else lex.prev_token_end  # a block ends at its `}`
+            if not frames:
+                if value.span is None and expr_start is not None:
+                    value.span = (expr_start, end)
+                return value
+
+            statement_start = expr_start
+            kind, data, operands, operators, expr_prec, start, expr_start = frames.pop()
+            if kind == "paren":
+                if bin_op != ")":
+                    raise self._error("expected ')', got %s" % _token_name(bin_op))
+                lex.get_next_token() # eat ')'
+            elif kind == "call":
+                data[1].append(value)
+                if bin_op == ",":
+                    lex.get_next_token()
+                    value = None  # parse the next argument
+                elif bin_op == ")":
+                    lex.get_next_token() # eat ')'
+                    if self.trace:
+                        logger.debug("Found call expr AST: callee=%s, args=%s", data[0], data[1])
+                    value = ast.CallExprAST(callee=data[0], args=data[1])
+                else:
+                    raise self._error("expected ')' or ',' in argument list, got %s" % _token_name(bin_op))
+            elif kind == "return":
+                value = ast.ReturnExprAST(rhs=value, span=(start, end))
+            elif kind == "var":
+                if type(value) is not ast.BinaryExprAST:
+                    raise syntax_error("expected a bin op in variable declaration", lex.code, start, end)
+                value = ast.VariableDeclarationExprAST(variable_expr=data, rhs=value.rhs, span=(start, end))
+            elif kind == "if":
+                data.append(value)
+                if len(data) > 1 and value.span is None:  # a branch is a statement
+                    value.span = (statement_start, end)
+                if len(data) == 1:
+                    if bin_op != ")":
+                        raise self._error("expected ')' after if cond expr, got %s" % _token_name(bin_op))
+                    lex.get_next_token()  # eat `)`
+                    value = None  # parse the then expression
+                elif len(data) == 2 and self._at_else(value):
+                    lex.get_next_token()  # eat `else`
+                    value = None  # parse the else expression
+                else:
+                    value = ast.IfExprAST(cond_expr=data[0], then_expr=data[1],
+                                          else_expr=data[2] if len(data) == 3 else None, span=(start, end))
+            else:  # block
+                if self.trace:
+                    logger.debug("append block expr %s, block_level=%d", value, self.block_level)
+                if value.span is None:
+                    value.span = (statement_start, end)
+                data.append(value)
+                lex.get_next_token()
+                value = self._end_block(data, start) if self._is_block_end() else None
+
+            if value is None:  # the construct expects another nested expression
+                frames.append((kind, data, operands, operators, expr_prec, start, expr_start))
+                operands, operators, expr_prec, expr_start = [], [], 0, lex.token_start
+            else:
+                operands.append(value)
+
+    def _at_else(self, then_expr) -> bool:
+        """
+        Whether `else` follows the then expression, it is either the current token, or the next one after the
+        `}` of a then block or after the `;` of a then statement, then that token is eaten.
+        """
+        lex = self.lexer
+        if lex.cur_token == lexer.Token.ELSE:
+            return True
+        if (lex.cur_token == lexer.Token.NEW_LINE or (lex.cur_token == "}" and type(then_expr) is ast.BlockExprAST)) \
+                and lex.peek_token() == lexer.Token.ELSE:
+            lex.get_next_token()
+            return True
+        return False
+
+    def _is_block_end(self) -> bool:
+        return self.lexer.cur_token == lexer.Token.EOF or self.lexer.cur_token == lexer.Token.FUNCTION or self.lexer.cur_token == "}"
+
+    def _end_block(self, body_expr, start: int) -> ast.BlockExprAST:
+        """ the block is ended by `}`(not eaten, but in its span), the next function or EOF """
+        if self.trace:
+            logger.debug("/parse_block_expr")
+        lex = self.lexer
+        end = lex.token_end if lex.cur_token == "}" else lex.prev_token_end
+        block = ast.BlockExprAST(self.block_level, body_expr=body_expr, span=(start, end))
+        self.block_level -=1
+        return block
+
+    def parse_prototype(self) -> ast.PrototypeAST:
+        if self.lexer.cur_token != lexer.Token.IDENTIFIER:
+            raise self._error("expected function name in prototype")
+
+        start = self.lexer.token_start
+        func_name = self.lexer.identifier_str
+        self.lexer.get_next_token()  # eat func_name
+
+        if self.lexer.cur_token != "(":
+            raise self._error("expected '(' in prototype")
 
-    if is_call or lexer.g_cur_token == "(":
-        # Call
-        lexer.get_next_token(code) # eat '('
         args = []
-        if lexer.g_cur_token != ")":
-            while True:
-                arg = parse_expression(code, ctx)
-                if arg is None:
-                    print("Error: expected arg expression")
-                    return None
-                args.append(arg)
-
-                if lexer.g_cur_token == ")":
-                    break
-                if lexer.g_cur_token != ",":
-                    print("Error: expected ')' or ',' in argument list")
-                    return None
-                lexer.get_next_token(code)
-
-        lexer.get_next_token(code) # eat ')'
-        print("Found call expr AST: callee=%s, args=%s" % (id_name, args))
-        return ast.CallExprAST(callee=id_name, args=args)
-    else:
-        print("Found variable expr AST, name=%s" % id_name)
-        return ast.VariableExprAST(name=id_name)
-
-
-def map_symbol(symbol_name, ctx):
-    if "externals" in ctx and symbol_name in ctx['externals']:
-        return ctx['externals'][symbol_name]
-    return symbol_name
-
-
-def parse_number_expr(code, ctx) -> Optional[ast.NumberExprAST]:
-    number_expr = ast.NumberExprAST(lexer.g_number_val)
-    lexer.get_next_token(code)  # consume the number
-    return number_expr
-
-
-def parse_paren_expr(code, ctx) -> Optional[ast.ExprAST]:
-    print("parse_paren_expr")
-    lexer.get_next_token(code)  # eat '('
-    v: ast.ExprAST = parse_expression(code, ctx)
-    if v is None:
-        print("Error: expected expression after '('")
-        return None
-
-    if lexer.g_cur_token != ")":
-        print("Error: expected ')', got: %s, line: %s" % (lexer.g_cur_token, code.curline()))
-        return None
-    lexer.get_next_token(code) # eat ')'
-    return v
-
-
-def parse_return_expr(code, ctx) -> Optional[ast.ReturnExprAST]:
-    print("parse_return_expr")
-    lexer.get_next_token(code)  # eat 'return'
-    rhs: ast.ExprAST = parse_expression(code, ctx)
-    if rhs is None:
-        print("Error: expected expression after 'return'")
-        return None
-    return ast.ReturnExprAST(rhs=rhs)
-
-
-def parse_variable_declaration_expr(code, ctx) -> Optional[ast.VariableDeclarationExprAST]:
-    print("parse_variable_declaration_expr")
-    lexer.get_next_token(code)  # eat 'var'
-
-    lhs: ast.VariableExprAST = parse_identifier_expr(code, ctx)
-    if lhs is None or type(lhs) is not ast.VariableExprAST:
-        print("Error: expected a variable name")
-        return None
-
-    rhs: ast.BinaryExprAST = parse_bin_op_rhs(code, ctx, 0, lhs)
-    if rhs is None:
-        print("Error: expected a bin op in variable declaration")
-        return None
-    return ast.VariableDeclarationExprAST(variable_expr=lhs, rhs=rhs.rhs)
-
-
-def parse_primary(code, ctx) -> Optional[ast.ExprAST]:
-    if lexer.g_cur_token == lexer.Token.IDENTIFIER:
-        return parse_identifier_expr(code, ctx)
-    elif lexer.g_cur_token == lexer.Token.NUMBER:
-        return parse_number_expr(code, ctx)
-    elif lexer.g_cur_token == lexer.Token.RETURN:
-        return parse_return_expr(code, ctx)
-    elif lexer.g_cur_token == lexer.Token.VAR:
-        return parse_variable_declaration_expr(code, ctx)
-    elif lexer.g_cur_token == lexer.Token.IF:
-        return parse_if_expr(code, ctx)
-    elif lexer.g_cur_token == "(":
-        return parse_paren_expr(code, ctx)
-    elif lexer.g_cur_token == "{":
-        return parse_block_expr(code, ctx)
-    print("Error: unknown token(`%s`) when expecting an expression" % lexer.g_cur_token)
-    return None
-
-
-def get_token_precedence() -> int:
-    if type(lexer.g_cur_token) is not str:
-        return -1
-
-    if lexer.g_cur_token in g_bin_op_precedence:
-        token_prec = g_bin_op_precedence[lexer.g_cur_token]
-    else:
-        token_prec = -1
-    return token_prec
-
-
-def parse_bin_op_rhs(code, ctx, expr_prec: int, lhs: ast.ExprAST) -> Optional[ast.ExprAST]:
-    print("parse_bin_op_rhs")
-    while True:
-        token_prec = get_token_precedence()
-        if token_prec < expr_prec:
-            return lhs
-
-        bin_op = lexer.g_cur_token
-        lexer.get_next_token(code)  # eat bin_op
-
-        rhs: ast.ExprAST = parse_primary(code, ctx)
-        if rhs is None:
-            print("Error: expected rhs of '%s'" % lexer.g_cur_token)
-            return None
-
-        next_prec = get_token_precedence()
-        if token_prec < next_prec:
-            rhs = parse_bin_op_rhs(code, ctx, token_prec + 1, rhs)
-            if rhs is None:
-                print("Error: expected rhs of '%s'" % lexer.g_cur_token)
-                return None
-
-        lhs = ast.BinaryExprAST(lhs=lhs, op=bin_op, rhs=rhs)
-
-
-def parse_expression(code, ctx) -> Optional[ast.ExprAST]:
-    print("parse_expression")
-    lhs: ast.ExprAST = parse_primary(code, ctx)
-    if lhs is None:
-        print("Error: expected a expression on left hand side")
-        return None
-    rhs = parse_bin_op_rhs(code, ctx, 0, lhs)
-    if rhs is None:  # e.g.: a()
-        return lhs
-    return rhs  # e.g.: a * 2
-
-
-def parse_if_expr(code, ctx) -> Optional[ast.ExprAST]:
-    print("parse_if_expr")
-    lexer.get_next_token(code)  # eat `if`
-
-    if lexer.g_cur_token != "(":
-        print("Error: expected '(' after 'if'")
-        return None
-    lexer.get_next_token(code)  # eat `(`
-
-    cond_expr: ast.ExprAST = parse_expression(code, ctx)
-    if cond_expr is None:
-        print("Error: expected a expression after 'if'")
-        return None
-
-    if lexer.g_cur_token != ")":
-        print("Error: expected ')' after if cond expr")
-        return None
-    lexer.get_next_token(code)  # eat `)`
-
-    then_expr: ast.ExprAST = parse_expression(code, ctx)
-    if then_expr is None:
-        print("Error: expected then expression after 'if'")
-        return None
-
-    if lexer.g_cur_token == lexer.Token.ELSE:
-        lexer.get_next_token(code)  # eat `else`
-        else_expr: ast.ExprAST = parse_expression(code, ctx)
-        if else_expr is None:
-            print("Error: expected else expression after 'if'")
-            return None
-    else:
-        else_expr = None
-
-    return ast.IfExprAST(cond_expr=cond_expr, then_expr=then_expr, else_expr=else_expr)
-
-
-def parse_prototype(code, ctx) -> Optional[ast.PrototypeAST]:
-    if lexer.g_cur_token != lexer.Token.IDENTIFIER:
-        print("Error: expected function name in prototype")
-        return None
-
-    func_name = lexer.g_identifier_str
-    lexer.get_next_token(code)  # eat func_name
-
-    if lexer.g_cur_token != "(":
-        print("Error: expected '(' in prototype")
-        return None
-
-    args = []
-    lexer.get_next_token(code)
-    while lexer.g_cur_token == lexer.Token.IDENTIFIER or lexer.g_cur_token == ",":
-        if lexer.g_cur_token == lexer.Token.IDENTIFIER:
-            args.append(lexer.g_identifier_str)
-        lexer.get_next_token(code)
-
-    if lexer.g_cur_token != ")":
-        print("Error: expected ')' in prototype")
-        return None
-
-    lexer.get_next_token(code)  # eat ")"
-    return ast.PrototypeAST(name=func_name, args=args)
-
-
-def parse_block_expr(code, ctx) -> Optional[ast.BlockExprAST]:
-    global g_block_level
-    print("parse_block_expr", g_block_level)
-    body_expr = []
-    lexer.get_next_token(code)  # eat '{'
-
-    g_block_level += 1
-    while lexer.g_cur_token != lexer.Token.EOF and lexer.g_cur_token != lexer.Token.FUNCTION and lexer.g_cur_token != "}":
-        expr: ast.ExprAST = parse_expression(code, ctx)
-        if expr is None:
-            print("Error: expected expression in block")
-            return None
-        print("\tappend block expr", expr, g_block_level)
-        body_expr.append(expr)
-        lexer.get_next_token(code)
-
-    print("/parse_block_expr")
-    block = ast.BlockExprAST(g_block_level, body_expr=body_expr)
-    g_block_level -=1
-    return block
-
-
-def parse_function(code, ctx) -> Optional[ast.FunctionAST]:
-    lexer.get_next_token(code)  # eat `function`
-    proto: ast.PrototypeAST = parse_prototype(code, ctx)
-    print("Parsed function prototype", proto)
-    if proto is None:
-        return None
-
-    if lexer.g_cur_token != "{":
-        print("Error: expected '{' in function, got: %s" % lexer.g_last_char)
-
-    body: ast.ExprAST = parse_block_expr(code, ctx)
-    if body is not None:
-        if lexer.g_cur_token != lexer.Token.FUNCTION:  # in case missing ";" end of line
-            lexer.get_next_token(code)
-        return ast.FunctionAST(proto=proto, body=body)
-    else:
-        return None
-
-
-def parse_top_level_expr(code, ctx) -> Optional[ast.ExprAST]:
-    expr: ast.ExprAST = parse_expression(code, ctx)
-    if expr is None:
-        print("expected top-level expression")
-        return None
-    global g_top_level_function_proto
-    if g_top_level_function_proto is None:
-        g_top_level_function_proto = ast.PrototypeAST("__global", [])
-    return ast.FunctionAST(g_top_level_function_proto, expr)
-
-
-def handle_function(code, ctx):
-    print("\nhandle_function")
-    func_expr: ast.FunctionAST = parse_function(code, ctx)
-    if func_expr is not None:
-        ctx['functions'].append(func_expr)
-        print("parsed a function definition", func_expr)
-    else:
-        lexer.get_next_token(code)
-
-
-def handle_top_level_expression(code, ctx):
-    print("\nhandle_top_level_expression, lexer.g_cur_token=", lexer.g_cur_token)
-    top_level_expr: ast.ExprAST = parse_top_level_expr(code, ctx)
-    if top_level_expr is not None:
-        ctx['globals'].append(top_level_expr)
-        print("parsed a top-level expr", top_level_expr)
-    else:
-        lexer.get_next_token(code)
-
-
-def parse_code_to_ast(code, ctx):
-    code = lexer.StringBuffer(code)
-    lexer.get_next_token(code)
-    while True:
-        if lexer.g_cur_token == lexer.Token.EOF:
-            break
-        elif lexer.g_cur_token == lexer.Token.NEW_LINE:
-            lexer.get_next_token(code)
-        elif lexer.g_cur_token == lexer.Token.FUNCTION:
-            handle_function(code, ctx)
-        else:
-            handle_top_level_expression(code, ctx)
-    reset()
-    lexer.reset()
+        self.lexer.get_next_token()
+        while self.lexer.cur_token == lexer.Token.IDENTIFIER or self.lexer.cur_token == ",":
+            if self.lexer.cur_token == lexer.Token.IDENTIFIER:
+                args.append(self.lexer.identifier_str)
+            self.lexer.get_next_token()
+
+        if self.lexer.cur_token != ")":
+            raise self._error("expected ')' in prototype")
+
+        self.lexer.get_next_token()  # eat ")"
+        return ast.PrototypeAST(name=func_name, args=args, span=(start, self.lexer.prev_token_end))
+
+    def parse_function(self) -> ast.FunctionAST:
+        start = self.lexer.token_start
+        self.lexer.get_next_token()  # eat `function`
+        proto: ast.PrototypeAST = self.parse_prototype()
+        if self.trace:
+            logger.debug("parsed function prototype %s", proto)
+
+        if self.lexer.cur_token != "{":
+            raise self._error("expected '{' in function, got %s" % _token_name(self.lexer.cur_token))
+
+        body: ast.ExprAST = self.parse_block_expr()
+        if self.lexer.cur_token == "}":  # the body doesn't eat its `}`, like any block
+            self.lexer.get_next_token()
+        return ast.FunctionAST(proto=proto, body=body, span=(start, self.lexer.prev_token_end))
+
+    def parse_top_level_expr(self) -> ast.ExprAST:
+        expr: ast.ExprAST = self.parse_expression()
+        if self.top_level_function_proto is None:
+            self.top_level_function_proto = ast.PrototypeAST("__global", [])
+        if self.lexer.cur_token == "}" and _ends_with_block(expr):
+            self.lexer.get_next_token()  # the `}` of the block, like at the end of a function
+        return ast.FunctionAST(self.top_level_function_proto, expr, span=expr.span)
+
+    def handle_function(self) -> ast.FunctionAST:
+        if self.trace:
+            logger.debug("handle_function")
+        func_expr: ast.FunctionAST = self.parse_function()
+        if self.trace:
+            logger.debug("parsed a function definition %s", func_expr.proto)
+        return func_expr
+
+    def handle_top_level_expression(self) -> ast.FunctionAST:
+        if self.trace:
+            logger.debug("handle_top_level_expression, cur_token=%s", self.lexer.cur_token)
+        top_level_expr: ast.FunctionAST = self.parse_top_level_expr()
+        if self.trace:
+            logger.debug("parsed a top-level expr %s", top_level_expr.body)
+        return top_level_expr
+
+    def iter_parse(self):
+        """
+        Yield ("functions", FunctionAST) or ("globals", FunctionAST) for every top-level definition,
+        as soon as it is parsed. The keys are the ones of `ctx`.
+        """
+        self.lexer.get_next_token()
+        while True:
+            if self.lexer.cur_token == lexer.Token.EOF:
+                break
+            elif self.lexer.cur_token == lexer.Token.NEW_LINE:
+                self.lexer.get_next_token()
+            elif self.lexer.cur_token == lexer.Token.FUNCTION:
+                yield "functions", self.handle_function()
+            else:
+                yield "globals", self.handle_top_level_expression()
+
+    def parse(self):
+        for key, node in self.iter_parse():
+            self.ctx[key].append(node)
+        return self.ctx
+
+
+def _token_name(token) -> str:
+    """ the token as written in an error message """
+    if isinstance(token, lexer.Token):
+        if token == lexer.Token.EOF:
+            return "end of input"
+        return "end of statement" if token == lexer.Token.NEW_LINE else token.name.lower()
+    return "'%s'" % token
+
+
+def _ends_with_block(node: ast.ExprAST) -> bool:
+    """ whether the statement `node` ends with a block, i.e. with a `}` """
+    while type(node) is ast.IfExprAST:
+        node = node.else_expr if node.else_expr is not None else node.then_expr
+    return type(node) is ast.BlockExprAST
+
+
+def parse_code_to_ast(code, ctx, backend="char", profiler=None):
+    """
+    Parse `code` into `ctx`.
+    `backend` selects the tokenizer, one of `lexer.g_lexer_backends`: "char"(default), "regex" or
+              "buffer"(tokenize once into a `lexer.TokenBuffer`, then parse it)
+    `profiler` records the "lex" and "parse" phases, the tokens and the AST nodes, see `profiler.Profiler`
+    `ctx["lines"]` is set to the `lexer.LineIndex` of `code`, it maps the spans of the nodes to lines and columns
+    """
+    lexer_class = lexer.g_lexer_backends[backend]
+    buffer = lexer.StringBuffer(code)
+    ctx["lines"] = buffer.line_index
+    if profiler is None:
+        return Parser(lexer_class(buffer), ctx).parse()
+
+    start = time.perf_counter()
+    lex = lexer_class(buffer)  # the "buffer" backend tokenizes the whole source here
+    create_time = time.perf_counter() - start
+    lex_time = profiler.instrument_lexer(lex)
+    start = time.perf_counter()
+    Parser(lex, ctx).parse()
+    elapsed = time.perf_counter() - start
+    profiler.add_time("lex", create_time + lex_time[0])
+    profiler.add_time("parse", elapsed - lex_time[0])  # the lexer runs on demand of the parser
+    profiler.count_nodes(ctx)
     return ctx
+
+
+def parse_stream(source, externals=None, chunk_size=65536):
+    """
+    Streaming parser, `source` is a file-like object(text mode) or an iterable of str chunks.
+
+    Yield ("functions" | "globals", FunctionAST) for every top-level definition as soon as it is parsed,
+    the source is read in chunks of bounded size and nothing is accumulated(the line starts of the parsed
+    definitions are dropped), so the memory is proportional to the largest definition rather than to the
+    whole input.
+
+    e.g.:
+        emitter = codegen.PythonEmitter(out)
+        for key, node in parse_stream(f):
+            if key == "functions":
+                emitter.emit_function(node)
+            else:
+                emitter.emit_statement(node.body)
+    """
+    ctx = {"globals": [], "functions": [], "externals": externals or {}}
+    buffer = lexer.StreamBuffer(source, chunk_size)
+    stream_parser = Parser(lexer.Lexer(buffer), ctx)
+    for item in stream_parser.iter_parse():
+        yield item
+        buffer.forget_lines(stream_parser.lexer.token_start)  # the next definition starts at the current token
+
+
+def parse_bytes(data, externals=None):
+    """
+    Parser over the utf-8 bytes of a source, e.g. an `mmap` of a large file: the source is tokenized as bytes
+    (`lexer.BytesLexer`) instead of being decoded up front, the spans are byte offsets.
+
+    Yield ("functions" | "globals", FunctionAST) for every top-level definition as soon as it is parsed,
+    like `parse_stream`.
+    """
+    ctx = {"globals": [], "functions": [], "externals": externals or {}}
+    return Parser(lexer.BytesLexer(lexer.BytesBuffer(data)), ctx).iter_parse()
+
+
+def parse_many(sources, externals=None, max_workers=None, backend="char"):
+    """
+    Parse several sources concurrently with a thread pool.
+    Returns one ctx per source, in the same order as `sources`.
+    """
+    def parse_one(code):
+        ctx = {"globals": [], "functions": [], "externals": externals or {}}
+        return parse_code_to_ast(code, ctx, backend)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(parse_one, sources))
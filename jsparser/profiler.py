@@ -0,0 +1,121 @@
+"""
+Instrumentation of the lex/parse/codegen/exec pipeline.
+
+A Profiler records the wall time and the number of runs of every phase, counters(tokens, AST nodes,
+generated code size) and, optionally, the calls of every transpiled function. Nothing is instrumented
+unless a Profiler is passed in, e.g.: `JSEngine(profile=True)` then `engine.stats()`.
+"""
+import functools
+import time
+from . import ast
+
+
+class Phase(object):
+    """ context manager adding the time spent in the block to a phase """
+
+    __slots__ = ("_profiler", "_name", "_start")
+
+    def __init__(self, profiler, name: str):
+        self._profiler = profiler
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._profiler.add_time(self._name, time.perf_counter() - self._start)
+
+
+class NullPhase(object):
+    """ context manager doing nothing, stands for a Phase when nothing is profiled """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+g_null_phase = NullPhase()
+
+
+class Profiler(object):
+
+    def __init__(self):
+        self.phases = {}  # name -> [runs, seconds], in the order the phases ran first
+        self.counters = {}  # name -> int
+        self.functions = {}  # function name -> [calls, seconds], the time includes the nested calls
+
+    def phase(self, name: str) -> Phase:
+        return Phase(self, name)
+
+    def add_time(self, name: str, seconds: float, runs: int = 1):
+        phase = self.phases.setdefault(name, [0, 0.0])
+        phase[0] += runs
+        phase[1] += seconds
+
+    def count(self, name: str, n: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def instrument_lexer(self, lex):
+        """
+        count the tokens of `lex` and time them as the "lex" phase, returns the time spent in the lexer.
+        `get_token` is wrapped, which reads every token once, a token read ahead by `peek_token` is not counted
+        again when it is consumed. A lexer without `get_token`(TokenBufferLexer) tokenized the whole source
+        when it was created: its tokens are counted at once, the caller times its creation.
+        """
+        lex_time = [0.0]
+        if not hasattr(lex, "get_token"):
+            self.count("tokens", len(lex.tokens))
+            return lex_time
+        get_token = lex.get_token
+
+        def counted_get_token():
+            start = time.perf_counter()
+            token = get_token()
+            lex_time[0] += time.perf_counter() - start
+            self.counters["tokens"] = self.counters.get("tokens", 0) + 1
+            return token
+
+        lex.get_token = counted_get_token  # the instance attribute hides the method
+        return lex_time
+
+    def count_nodes(self, ctx):
+        self.count("nodes", sum(sum(1 for _ in ast.walk(node)) for key in ("globals", "functions") for node in ctx[key]))
+
+    def wrap_function(self, name: str, func):
+        """ `func` wrapped to count its calls and cumulative time """
+        stats = self.functions.setdefault(name, [0, 0.0])
+
+        @functools.wraps(func)
+        def profiled(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stats[0] += 1
+                stats[1] += time.perf_counter() - start
+
+        return profiled
+
+    def stats(self):
+        return {
+            "phases": {name: {"runs": runs, "seconds": seconds} for name, (runs, seconds) in self.phases.items()},
+            "counters": dict(self.counters),
+            "functions": {name: {"calls": calls, "seconds": seconds} for name, (calls, seconds) in self.functions.items()},
+        }
+
+    def format(self) -> str:
+        lines = ["%-16s %8s %12s" % ("phase", "runs", "total ms")]
+        for name, (runs, seconds) in self.phases.items():
+            lines.append("%-16s %8d %12.3f" % (name, runs, seconds * 1000))
+        for name, value in self.counters.items():
+            lines.append("%-16s %8d" % (name, value))
+        if self.functions:
+            lines.append("%-16s %8s %12s" % ("function", "calls", "total ms"))
+            for name, (calls, seconds) in sorted(self.functions.items(), key=lambda item: -item[1][1]):
+                lines.append("%-16s %8d %12.3f" % (name, calls, seconds * 1000))
+        return "\n".join(lines)
@@ -0,0 +1,370 @@
+"""
+Compact binary format of a parsed `ctx`, to parse a corpus once and reload the AST many times.
+
+    dump(ctx, fp) / load(fp), or dumps(ctx) / loads(data) for bytes
+
+Layout:
+    b"JSAST" magic, format version(1 byte)
+    sections, each one its size in bytes(a varint) followed by its items
+        ops     - the opcode of every node, in pre-order, with SPAN_FLAG for a node with a span
+        ints    - the operands: counts, flags, indexes in the string table and the integer numbers(zigzag)
+        starts  - the start offset of every span, zigzag encoded delta from the previous span
+        lengths - the length of every span
+        numbers - the value of every other number, little-endian doubles
+        lines   - the start offsets of the lines(`ctx["lines"]`), deltas
+        strings - the length of every string of the table
+    the string table, utf-8, all the strings joined
+
+The integers are unsigned LEB128 varints: 7 bits per byte, the high bit set on every byte but the last,
+so the usual small values take a single byte. The nodes are written and read with an explicit stack,
+so the depth of the AST is not bounded by the recursion limit.
+"""
+import io
+import math
+import sys
+from array import array
+from . import ast
+from . import lexer
+
+
+MAGIC = b"JSAST"
+FORMAT_VERSION = 2
+
+# opcodes
+OP_NUMBER = 1
+OP_VARIABLE = 2
+OP_BINARY = 3
+OP_VARIABLE_DECLARATION = 4
+OP_RETURN = 5
+OP_CALL = 6
+OP_PROTOTYPE = 7
+OP_FUNCTION = 8
+OP_GLOBAL = 9  # a global statement, the FunctionAST of the shared "__global" prototype
+OP_IF = 10
+OP_BLOCK = 11
+OP_INTEGER = 12  # a number which is an integer, in `ints` rather than a double
+SPAN_FLAG = 0x40  # set on the opcode of a node with a span, the opcodes stay below 0x80(a single byte)
+
+g_max_integer = 1 << 53  # the integers a double holds exactly
+
+
+class _Writer(object):
+
+    def __init__(self):
+        self.ops = []
+        self.ints = []
+        self.starts = []
+        self.lengths = []
+        self.numbers = array("d")
+        self.strings = []
+        self._interned = {}
+        self._prev_start = 0
+
+    def string(self, value: str):
+        index = self._interned.get(value)
+        if index is None:
+            index = self._interned[value] = len(self.strings)
+            self.strings.append(value)
+        self.ints.append(index)
+
+    def span(self, span):
+        if span is None:
+            return
+        self.ops[-1] |= SPAN_FLAG
+        delta = span[0] - self._prev_start
+        self._prev_start = span[0]
+        self.starts.append(_zigzag(delta))
+        self.lengths.append(span[1] - span[0])
+
+    def node(self, node, stack):
+        """ write the header of `node`, push its children on `stack` in reverse order """
+        node_type = type(node)
+        ints = self.ints
+        if node_type is ast.NumberExprAST:
+            value = node.value
+            if float(value).is_integer() and -g_max_integer < value < g_max_integer \
+                    and (value or math.copysign(1.0, value) > 0):  # -0.0 is a double
+                self.ops.append(OP_INTEGER)
+                ints.append(_zigzag(int(value)))
+            else:
+                self.ops.append(OP_NUMBER)
+                self.numbers.append(value)
+        elif node_type is ast.VariableExprAST:
+            self.ops.append(OP_VARIABLE)
+            self.string(node.name)
+        elif node_type is ast.BinaryExprAST:
+            self.ops.append(OP_BINARY)
+            self.string(node.op)
+            stack.append(node.rhs)
+            stack.append(node.lhs)
+        elif node_type is ast.VariableDeclarationExprAST:
+            self.ops.append(OP_VARIABLE_DECLARATION)
+            stack.append(node.rhs)
+            stack.append(node.lhs)
+        elif node_type is ast.ReturnExprAST:
+            self.ops.append(OP_RETURN)
+            stack.append(node.rhs)
+        elif node_type is ast.CallExprAST:
+            self.ops.append(OP_CALL)
+            self.string(node.callee)
+            ints.append(len(node.args))
+            stack.extend(reversed(node.args))
+        elif node_type is ast.PrototypeAST:
+            self.ops.append(OP_PROTOTYPE)
+            self.string(node.name)
+            ints.append(len(node.args))
+            for arg in node.args:
+                self.string(arg)
+        elif node_type is ast.FunctionAST:
+            self.ops.append(OP_FUNCTION)
+            stack.append(node.body)
+            stack.append(node.proto)
+        elif node_type is ast.IfExprAST:
+            self.ops.append(OP_IF)
+            ints.append(node.else_expr is not None)
+            if node.else_expr is not None:
+                stack.append(node.else_expr)
+            stack.append(node.then_expr)
+            stack.append(node.cond_expr)
+        elif node_type is ast.BlockExprAST:
+            self.ops.append(OP_BLOCK)
+            ints.append(node.indent)
+            ints.append(len(node.body_expr))
+            stack.extend(reversed(node.body_expr))
+        else:
+            raise TypeError("can not serialize %s" % node_type.__name__)
+        self.span(node.span)
+
+    def tree(self, root):
+        stack = [root]
+        while stack:
+            self.node(stack.pop(), stack)
+
+    def ctx(self, ctx):
+        externals = ctx.get("externals") or {}
+        self.ints.extend((len(ctx['globals']), len(ctx['functions']), len(externals)))
+        for name, value in externals.items():
+            self.string(name)
+            self.string(value)
+        for g in ctx['globals']:
+            self.ops.append(OP_GLOBAL)
+            self.span(g.span)
+            self.tree(g.body)
+        for function_ast in ctx['functions']:
+            self.tree(function_ast)
+
+
+def _zigzag(value: int) -> int:
+    """ a signed integer as an unsigned one, the small ones of both signs stay small """
+    return value << 1 if value >= 0 else (-value << 1) - 1
+
+
+def _unzigzag(value: int) -> int:
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+
+def _encode_varints(values) -> bytes:
+    if max(values, default=0) < 0x80:  # a single byte each
+        return bytes(values)
+    out = bytearray()
+    append = out.append
+    for value in values:
+        while value >= 0x80:
+            append(value & 0x7f | 0x80)
+            value >>= 7
+        append(value)
+    return bytes(out)
+
+
+def _decode_varints(data: bytes):
+    if max(data, default=0) < 0x80:
+        return data  # iterating bytes gives the ints
+    values = []
+    append = values.append
+    value = shift = 0
+    for byte in data:
+        if byte & 0x80:
+            value |= (byte & 0x7f) << shift
+            shift += 7
+        else:
+            append(value | byte << shift)
+            value = shift = 0
+    if shift:
+        raise ValueError("truncated AST data")
+    return values
+
+
+def _write_section(out, data: bytes):
+    out.write(_encode_varints([len(data)]))
+    out.write(data)
+
+
+def _read_section(data, offset: int):
+    size = shift = 0
+    while True:
+        if offset >= len(data):
+            raise ValueError("truncated AST data")
+        byte = data[offset]
+        offset += 1
+        size |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            break
+    end = offset + size
+    if end > len(data):
+        raise ValueError("truncated AST data")
+    return data[offset:end], end
+
+
+def _line_deltas(lines):
+    starts = lines.line_starts() if lines is not None else []
+    return [start - prev for prev, start in zip([0] + starts, starts)]
+
+
+def dump(ctx, fp):
+    """ write `ctx`({"globals", "functions", "externals", "lines"}) into the binary file-like object `fp` """
+    writer = _Writer()
+    writer.ctx(ctx)
+    fp.write(MAGIC)
+    fp.write(bytes((FORMAT_VERSION,)))
+    for values in (writer.ops, writer.ints, writer.starts, writer.lengths):
+        _write_section(fp, _encode_varints(values))
+    numbers = writer.numbers
+    if sys.byteorder == "big":
+        numbers.byteswap()
+    _write_section(fp, numbers.tobytes())
+    for values in (_line_deltas(ctx.get("lines")), [len(string) for string in writer.strings]):
+        _write_section(fp, _encode_varints(values))
+    fp.write("".join(writer.strings).encode("utf-8"))
+
+
+def dumps(ctx) -> bytes:
+    out = io.BytesIO()
+    dump(ctx, out)
+    return out.getvalue()
+
+
+def load(fp):
+    """ read a ctx written by `dump` from the binary file-like object `fp` """
+    return loads(fp.read())
+
+
+def loads(data: bytes):
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError("not a serialized AST")
+    version = data[len(MAGIC)]
+    if version != FORMAT_VERSION:
+        raise ValueError("unsupported AST format version %d, expected %d" % (version, FORMAT_VERSION))
+    offset = len(MAGIC) + 1
+    sections = []
+    for _ in range(7):
+        section, offset = _read_section(data, offset)
+        sections.append(section)
+    ops, ints, starts, lengths, number_bytes, line_deltas, string_lengths = sections
+    ops, ints, starts, lengths, line_deltas, string_lengths = map(
+        _decode_varints, (ops, ints, starts, lengths, line_deltas, string_lengths))
+    if len(number_bytes) % 8:
+        raise ValueError("truncated AST data")
+    numbers = array("d", number_bytes)
+    if sys.byteorder == "big":
+        numbers.byteswap()
+    text = data[offset:].decode("utf-8")
+    strings = []
+    position = 0
+    for length in string_lengths:
+        strings.append(text[position:position + length])
+        position += length
+
+    ints = iter(ints)
+    numbers = iter(numbers)
+    next_int = ints.__next__
+    num_globals, num_functions, num_externals = next_int(), next_int(), next_int()
+    externals = {}
+    for _ in range(num_externals):
+        name = strings[next_int()]
+        externals[name] = strings[next_int()]
+
+    global_proto = ast.PrototypeAST("__global", [])
+    roots = []
+    stack = []  # [opcode, fields, children, number of children, span] of the nodes missing children
+    starts = iter(starts)
+    lengths = iter(lengths)
+    prev_start = 0
+    for op in ops:
+        if op & SPAN_FLAG:
+            op ^= SPAN_FLAG
+            prev_start += _unzigzag(next(starts))
+            span = (prev_start, prev_start + next(lengths))
+        else:
+            span = None
+
+        # a leaf is complete at once, the other nodes wait on the stack for their children
+        if op == OP_INTEGER:
+            node = ast.NumberExprAST(float(_unzigzag(next_int())), span)
+        elif op == OP_NUMBER:
+            node = ast.NumberExprAST(next(numbers), span)
+        elif op == OP_VARIABLE:
+            node = ast.VariableExprAST(strings[next_int()], span)
+        elif op == OP_PROTOTYPE:
+            name = strings[next_int()]
+            node = ast.PrototypeAST(name, [strings[next_int()] for _ in range(next_int())], span)
+        else:
+            if op == OP_BINARY:
+                entry = [op, strings[next_int()], [], 2, span]
+            elif op == OP_CALL:
+                entry = [op, strings[next_int()], [], next_int(), span]
+            elif op == OP_IF:
+                entry = [op, None, [], 3 if next_int() else 2, span]
+            elif op == OP_BLOCK:
+                entry = [op, next_int(), [], next_int(), span]
+            elif op == OP_VARIABLE_DECLARATION or op == OP_FUNCTION:
+                entry = [op, None, [], 2, span]
+            elif op == OP_RETURN or op == OP_GLOBAL:
+                entry = [op, None, [], 1, span]
+            else:
+                raise ValueError("unknown AST opcode %d" % op)
+            if entry[3]:
+                stack.append(entry)
+                continue
+            node = _build(entry, global_proto)  # a call without arguments or an empty block
+
+        while stack:  # attach the complete node to its parent, which may be complete in turn
+            entry = stack[-1]
+            entry[2].append(node)
+            if len(entry[2]) < entry[3]:
+                break
+            stack.pop()
+            node = _build(entry, global_proto)
+        else:
+            roots.append(node)
+
+    if stack or len(roots) != num_globals + num_functions:
+        raise ValueError("truncated AST data")
+    ctx = {"globals": roots[:num_globals], "functions": roots[num_globals:], "externals": externals}
+    if line_deltas:
+        line_starts = []
+        start = 0
+        for delta in line_deltas:
+            start += delta
+            line_starts.append(start)
+        ctx["lines"] = lexer.LineIndex.from_line_starts(line_starts)
+    return ctx
+
+
+def _build(entry, global_proto) -> ast.ExprAST:
+    op, field, children, _, span = entry
+    if op == OP_BINARY:
+        return ast.BinaryExprAST(children[0], field, children[1], span)
+    if op == OP_CALL:
+        return ast.CallExprAST(field, children, span)
+    if op == OP_BLOCK:
+        return ast.BlockExprAST(field, children, span)
+    if op == OP_IF:
+        return ast.IfExprAST(children[0], children[1], children[2] if len(children) == 3 else None, span)
+    if op == OP_VARIABLE_DECLARATION:
+        return ast.VariableDeclarationExprAST(children[0], children[1], span)
+    if op == OP_FUNCTION:
+        return ast.FunctionAST(children[0], children[1], span)
+    if op == OP_RETURN:
+        return ast.ReturnExprAST(children[0], span)
+    return ast.FunctionAST(global_proto, children[0], span)  # OP_GLOBAL
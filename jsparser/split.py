@@ -0,0 +1,110 @@
+"""
+Split the statements whose expression is too deep for python, shared by the backends(`codegen`, `lowering`):
+CPython compiles the expressions recursively and its parser allows 200 nested parentheses. A backend raises
+TooDeep past `g_max_expr_depth` nested nodes, then emits the statements of `split_deep` instead.
+"""
+from . import ast  # ast imports codegen which imports split, the annotations name ast lazily
+
+
+g_max_expr_depth = 100
+
+
+class TooDeep(Exception):
+    """ the expression of a statement is deeper than `g_max_expr_depth` nodes """
+
+
+class TempNames(object):
+    """ the names of the temporary variables of the split statements, unique in a module """
+
+    def __init__(self):
+        self._count = 0
+
+    def __call__(self) -> str:
+        name = "_jstmp%d" % self._count
+        self._count += 1
+        return name
+
+
+def _operands(node: "ast.ExprAST"):
+    """ the operands of an expression, in the order they are evaluated """
+    if isinstance(node, ast.BinaryExprAST):
+        return [node.rhs] if node.op == "=" else [node.lhs, node.rhs]  # the lhs of an assignment is a target
+    if isinstance(node, ast.CallExprAST):
+        return node.args
+    return []
+
+
+def _with_operands(node: "ast.ExprAST", operands):
+    """ a copy of `node` with new operands, the AST is shared and must not change """
+    if isinstance(node, ast.VariableDeclarationExprAST):
+        return ast.VariableDeclarationExprAST(node.lhs, operands[0], node.span)
+    if isinstance(node, ast.BinaryExprAST):
+        if node.op == "=":
+            return ast.BinaryExprAST(node.lhs, "=", operands[0], node.span)
+        return ast.BinaryExprAST(operands[0], node.op, operands[1], node.span)
+    return ast.CallExprAST(node.callee, operands, node.span)
+
+
+def split_deep(statement: "ast.ExprAST", max_depth: int, new_name):
+    """
+    Split a statement whose expression is deeper than `max_depth` nodes into statements of at most
+    `max_depth` nodes: the deep subexpressions are assigned to temporary variables named by `new_name()`
+    first, e.g.:
+        return ((a + b) + c) + d;  ->  _t0 = (a + b) + c; return _t0 + d;   (max_depth 4)
+    The operands evaluated before a hoisted subexpression are hoisted too, so the evaluation order
+    is kept. Returns the list of statements, `statement` is left as it is.
+    """
+    if isinstance(statement, ast.IfExprAST):
+        root = statement.cond_expr
+    elif isinstance(statement, ast.ReturnExprAST):
+        root = statement.rhs
+    else:
+        root = statement
+    statements = []
+
+    def hoist(expr):
+        name = new_name()
+        statements.append(ast.BinaryExprAST(ast.VariableExprAST(name), "=", expr, statement.span))
+        return ast.VariableExprAST(name)
+
+    pending = []  # (frame, index) of the operands evaluated before the next one, and not hoisted yet
+    stack = [[root, _operands(root), [], []]]  # frames of [node, operands, new operands, their heights]
+    while True:
+        frame = stack[-1]
+        node, operands, results, heights = frame
+        if len(results) < len(operands):
+            child = operands[len(results)]
+            child_operands = _operands(child)
+            if child_operands:
+                stack.append([child, child_operands, [], []])
+                continue
+            expr, height, hoisted = child, 1, False
+        else:
+            stack.pop()
+            while pending and pending[-1][0] is frame:
+                pending.pop()  # consumed by `node`
+            changed = any(result is not operand for result, operand in zip(results, operands))
+            expr = _with_operands(node, results) if changed else node
+            height = 1 + max(heights, default=0)
+            if not stack:
+                break
+            frame = stack[-1]
+            hoisted = height >= max_depth - 1  # `temp = expr` is one node deeper
+            if hoisted:
+                for pending_frame, index in pending:
+                    pending_frame[2][index] = hoist(pending_frame[2][index])
+                    pending_frame[3][index] = 1
+                del pending[:]
+                expr, height = hoist(expr), 1
+        frame[2].append(expr)
+        frame[3].append(height)
+        if not hoisted and not isinstance(expr, ast.NumberExprAST):
+            pending.append((frame, len(frame[2]) - 1))
+
+    if isinstance(statement, ast.IfExprAST):
+        statements.append(ast.IfExprAST(expr, statement.then_expr, statement.else_expr, statement.span))
+    elif isinstance(statement, ast.ReturnExprAST):
+        statements.append(ast.ReturnExprAST(expr, statement.span))
+    else:
+        statements.append(expr)
+    return statements
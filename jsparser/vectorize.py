@@ -0,0 +1,211 @@
+"""
+Array backend, compile an arithmetic-only javascript function into numpy expressions,
+the function is then called once with whole arrays instead of once per row.
+
+    if (c) { return a; } return b;   ->  np.where(c, a, b)
+    if (c) { d = a; }                 ->  d = np.where(c, a, d), the statements after the if are lowered once
+    Math.max(a, b)                    ->  np.maximum(a, b)   (through the `max` external)
+    var d = a * b;                    ->  evaluated once into a temporary array
+
+Both sides of an `if` are evaluated for every row, this is only valid because the supported
+expressions(numbers, variables, + - * / < >, max and min) have no side effects. numpy is an
+optional dependency, it is imported when a function is vectorized.
+"""
+from . import ast
+from . import split
+
+
+g_np_functions = {
+    "max": "np.maximum",
+    "min": "np.minimum",
+}
+
+
+class VectorizeError(TypeError):
+    """ the function uses a construct which can not be vectorized """
+
+    def __init__(self, function_name: str, reason: str):
+        super().__init__("can not vectorize function %s: %s" % (function_name, reason))
+        self.function_name = function_name
+        self.reason = reason
+
+
+class Vectorizer(object):
+    """
+    Translate a FunctionAST into the python code of an equivalent function over numpy arrays.
+    Global variables are read from the mapping `g` when the function is called.
+    """
+
+    def __init__(self, function_ast: ast.FunctionAST):
+        self._function_ast = function_ast
+        self._lines = []
+        self._num_temps = 0
+
+    def _error(self, reason: str):
+        return VectorizeError(self._function_ast.proto.name, reason)
+
+    def vectorize(self) -> str:
+        params = {name: name for name in self._function_ast.proto.args}
+        result = self.lower_statements(_flatten(self._function_ast.body), params)
+        lines = ["def %s(%s):" % (self._function_ast.proto.name, ", ".join(self._function_ast.proto.args))]
+        lines.extend("    " + line for line in self._lines)
+        lines.append("    return %s" % result)
+        return "\n".join(lines) + "\n"
+
+    def lower_statements(self, statements, env) -> str:
+        """ the expression of the value returned by `statements`, `env` maps the variables to python names """
+        _, returns, closed = self._lower_block(statements, env)
+        if not closed:
+            raise self._error("not every path returns a value")
+        expr = returns[-1][1]
+        for mask, value in reversed(returns[:-1]):
+            expr = "np.where(%s, %s, %s)" % (mask, value, expr)
+        return expr
+
+    def _lower_block(self, statements, env):
+        """
+        (env after `statements`, returns, closed): `returns` is the list of (mask, value) of the rows which return,
+        in order, `closed` when every row returns(the mask of the last one is then "True").
+        The assignments of both sides of an `if` are merged, the statements after it are lowered once.
+        """
+        returns = []
+        for node in statements:
+            if isinstance(node, ast.ReturnExprAST):
+                returns.append(("True", self.lower_expr(node.rhs, env)))
+                return env, returns, True
+            if isinstance(node, ast.IfExprAST):
+                cond = self.lower_expr(node.cond_expr, env)
+                then_env, then_returns, then_closed = self._lower_block(_flatten(node.then_expr), env)
+                else_body = _flatten(node.else_expr) if node.else_expr is not None else []
+                else_env, else_returns, else_closed = self._lower_block(else_body, env)
+                if then_closed:
+                    merged = {}
+                    env = else_env  # the rows which go on took the else side
+                elif else_closed:
+                    merged = {}
+                    env = then_env
+                else:
+                    merged = {name: (self._variable(name, then_env), self._variable(name, else_env))
+                              for name in set(then_env) | set(else_env) if then_env.get(name) != else_env.get(name)}
+                if len(merged) + len(then_returns) + len(else_returns) > 1:
+                    cond = self._temp(cond)
+                if merged:
+                    env = dict(env)
+                    for name, (then_value, else_value) in sorted(merged.items()):
+                        env[name] = self._temp("np.where(%s, %s, %s)" % (cond, then_value, else_value))
+                not_cond = "np.logical_not(%s)" % cond
+                returns.extend((_and(cond, mask), value) for mask, value in then_returns)
+                returns.extend((_and(not_cond, mask), value) for mask, value in else_returns)
+                if then_closed and else_closed:
+                    returns[-1] = ("True", returns[-1][1])
+                    return env, returns, True
+                continue
+            if isinstance(node, ast.BinaryExprAST) and node.op == "=":
+                if not isinstance(node.lhs, ast.VariableExprAST) or "." in node.lhs.name:
+                    raise self._error("assignment to %s" % type(node.lhs).__name__)
+                env = dict(env)
+                env[node.lhs.name] = self._temp(self.lower_expr(node.rhs, env))
+                continue
+            raise self._error("unsupported statement %s" % type(node).__name__)
+        return env, returns, False
+
+    def _temp(self, expr: str) -> str:
+        """ evaluate `expr` once into a new temporary array """
+        temp = "_t%d" % self._num_temps
+        self._num_temps += 1
+        self._lines.append("%s = %s" % (temp, expr))
+        return temp
+
+    @staticmethod
+    def _variable(name: str, env) -> str:
+        if name in env:
+            return env[name]
+        parts = name.split(".")
+        return "".join(["g[%r]" % parts[0]] + [".%s" % attr for attr in parts[1:]])
+
+    def lower_expr(self, node, env) -> str:
+        """
+        the python expression of `node`, with an explicit stack so deep expressions don't hit the recursion limit.
+        A subexpression nested `split.g_max_expr_depth` deep is evaluated into a temporary array first, python's
+        parser allows 200 nested parentheses. The expressions have no side effects, so the order does not matter.
+        """
+        results = []  # (expr, nesting depth)
+        stack = [(node, False)]
+        while stack:
+            node, lowered_operands = stack.pop()
+            if isinstance(node, ast.NumberExprAST):
+                results.append((repr(node.value), 0))
+            elif isinstance(node, ast.VariableExprAST):
+                results.append((self._variable(node.name, env), 0))
+            elif isinstance(node, ast.BinaryExprAST):
+                if node.op not in ("+", "-", "*", "/", "<", ">"):
+                    raise self._error("unsupported operator %s" % node.op)
+                if lowered_operands:
+                    rhs, rhs_depth = results.pop()
+                    lhs, lhs_depth = results.pop()
+                    results.append(self._nested("(%s %s %s)" % (lhs, node.op, rhs), max(lhs_depth, rhs_depth) + 1))
+                else:
+                    stack.extend([(node, True), (node.rhs, False), (node.lhs, False)])
+            elif isinstance(node, ast.CallExprAST):
+                if node.callee not in g_np_functions:
+                    raise self._error("call of %s" % node.callee)
+                if not node.args:
+                    raise self._error("%s without arguments" % node.callee)
+                if lowered_operands:
+                    start = len(results) - len(node.args)
+                    args = results[start:]
+                    del results[start:]
+                    expr, depth = args[0]
+                    for arg, arg_depth in args[1:]:
+                        expr, depth = self._nested("%s(%s, %s)" % (g_np_functions[node.callee], expr, arg),
+                                                   max(depth, arg_depth) + 1)
+                    results.append((expr, depth))
+                else:
+                    stack.append((node, True))
+                    stack.extend((arg, False) for arg in reversed(node.args))
+            else:
+                raise self._error("unsupported expression %s" % type(node).__name__)
+        return results[0][0]
+
+    def _nested(self, expr: str, depth: int):
+        """ (expr, depth) of a subexpression nested `depth` deep, a temporary array once it is too deep """
+        if depth >= split.g_max_expr_depth:
+            return self._temp(expr), 0
+        return expr, depth
+
+
+def _and(cond: str, mask: str) -> str:
+    return cond if mask == "True" else "np.logical_and(%s, %s)" % (cond, mask)
+
+
+def _flatten(node):
+    """ the statements of a body, blocks are flattened """
+    statements = []
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, ast.BlockExprAST):
+            stack.extend(reversed(node.body_expr))
+        else:
+            statements.append(node)
+    return statements
+
+
+def vectorize_source(function_ast: ast.FunctionAST) -> str:
+    """ python code of the vectorized function, raises VectorizeError """
+    return Vectorizer(function_ast).vectorize()
+
+
+def vectorize_function(function_ast: ast.FunctionAST, g):
+    """
+    Compile the vectorized function, global variables are looked up in the mapping `g` on every call.
+    Raises VectorizeError, or ImportError when numpy is not installed.
+    """
+    source = vectorize_source(function_ast)
+    try:
+        import numpy as np
+    except ImportError:
+        raise ImportError("vectorize requires numpy, install it with `pip install jsparser[numpy]`")
+    namespace = {"np": np, "g": g}
+    exec(compile(source, "<jsparser.vectorize>", "exec"), namespace)
+    return namespace[function_ast.proto.name]
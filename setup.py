@@ -23,4 +23,7 @@ setup(
   },
   install_requires='''
 '''.split('\n'),
+  extras_require={
+    'numpy': ['numpy'],
+  },
   zip_safe=False)
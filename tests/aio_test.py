@@ -0,0 +1,166 @@
+import asyncio
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from ..jsparser import parser
+from ..jsparser.aio import AsyncJSEngine
+from ..jsparser.errors import JSSyntaxError
+
+
+JS_CODE = """
+var foo = 1.0;
+function add(a, b) {
+    return a + b;
+}
+"""
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+class AsyncEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.executor = ThreadPoolExecutor(8)
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()  # a failed test doesn't leave a worker blocked
+        self.executor.shutdown(wait=True)
+
+    def test_eval_call(self):
+        js_runtime = AsyncJSEngine({}, executor=self.executor)
+
+        async def main():
+            await js_runtime.eval(JS_CODE)
+            return await js_runtime.call("add", 1, 2)
+
+        self.assertEqual(3, run(main()))
+        self.assertEqual(1.0, js_runtime.get("foo"))
+        self.assertRaises(KeyError, run, js_runtime.call("sub", 1, 2))
+        self.assertRaises(JSSyntaxError, run, js_runtime.eval("var a = ;"))
+        self.assertRaises(ValueError, AsyncJSEngine, max_concurrency=0)
+
+    def test_event_loops(self):
+        js_runtime = AsyncJSEngine({}, executor=self.executor)
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(js_runtime.eval(JS_CODE))
+            with self.assertRaisesRegex(RuntimeError, "bound to another event loop"):
+                run(js_runtime.eval("var bar = 2;"))  # fails instead of waiting on the slots of the other loop
+        finally:
+            loop.close()
+        run(js_runtime.eval("var bar = 2;"))  # the previous loop is closed
+        self.assertEqual(2.0, js_runtime.get("bar"))
+
+    def test_coalesce(self):
+        js_runtime = AsyncJSEngine({}, executor=self.executor)
+        release = threading.Event()
+        parse_code_to_ast = parser.parse_code_to_ast
+
+        def slow_parse(*args, **kwargs):
+            release.wait()
+            return parse_code_to_ast(*args, **kwargs)
+
+        async def main():
+            evals = [asyncio.ensure_future(js_runtime.eval(JS_CODE)) for _ in range(10)]
+            await asyncio.sleep(0.01)
+            self.assertEqual(1, js_runtime.in_flight())
+            release.set()
+            await asyncio.gather(*evals)
+
+        with mock.patch.object(parser, "parse_code_to_ast", side_effect=slow_parse) as parse:
+            run(main())
+        self.assertEqual(1, parse.call_count)
+        self.assertEqual(0, js_runtime.in_flight())
+        self.assertEqual(3, js_runtime.get("add")(1, 2))
+
+    def test_max_concurrency(self):
+        js_runtime = AsyncJSEngine({}, executor=self.executor, max_concurrency=2)
+        lock = threading.Lock()
+        running = [0, 0]  # now, peak
+        compile = js_runtime.engine.compile
+
+        def slow_compile(js_code):
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            threading.Event().wait(0.01)
+            with lock:
+                running[0] -= 1
+            return compile(js_code)
+
+        js_runtime.engine.compile = slow_compile
+
+        async def main():
+            await asyncio.gather(*[js_runtime.eval("var v%d = %d;" % (i, i)) for i in range(8)])
+
+        run(main())
+        self.assertEqual(2, running[1])
+        self.assertEqual(7, js_runtime.get("v7"))
+
+    def test_cancel(self):
+        js_runtime = AsyncJSEngine({}, executor=self.executor, max_concurrency=1)
+        release, running = self.release, threading.Event()
+        js_runtime.set("block", lambda: running.set() or release.wait())
+
+        async def hold_slot():
+            running.clear()
+            blocked = asyncio.ensure_future(js_runtime.eval("block();"))
+            while not running.is_set():
+                await asyncio.sleep(0.001)
+            return blocked
+
+        async def main():
+            blocked = await hold_slot()  # the only slot
+            first = asyncio.ensure_future(js_runtime.eval(JS_CODE))
+            second = asyncio.ensure_future(js_runtime.eval(JS_CODE))
+            await asyncio.sleep(0.01)
+            first.cancel()  # the other waiter still gets the compile
+            await asyncio.sleep(0.01)
+            self.assertEqual(1, js_runtime.in_flight())
+            release.set()
+            await second
+            self.assertTrue(first.cancelled())
+
+            await blocked
+            release.clear()
+            blocked = await hold_slot()
+            third = asyncio.ensure_future(js_runtime.eval("var bar = 2;"))
+            await asyncio.sleep(0.01)
+            third.cancel()  # the last waiter, the compile is cancelled before it runs
+            await asyncio.sleep(0.01)
+            self.assertEqual(0, js_runtime.in_flight())
+            release.set()
+            await blocked
+
+            release.clear()
+            blocked = await hold_slot()
+            fourth = asyncio.ensure_future(js_runtime.eval("var baz = 3;"))
+            await asyncio.sleep(0.01)
+            fourth.cancel()
+            fifth = asyncio.ensure_future(js_runtime.eval("var baz = 3;"))  # right away, before the cancel is done
+            await asyncio.sleep(0.01)
+            release.set()
+            await fifth  # its own compile, not the cancelled one
+            self.assertTrue(fourth.cancelled())
+            self.assertEqual(0, js_runtime.in_flight())
+            await blocked
+
+        with mock.patch.object(parser, "parse_code_to_ast", wraps=parser.parse_code_to_ast) as parse:
+            run(main())
+        self.assertEqual(3, parse.call_count)  # block(), JS_CODE and baz
+        self.assertEqual(3, js_runtime.get("add")(1, 2))
+        self.assertIsNone(js_runtime.get("bar"))
+        self.assertEqual(3.0, js_runtime.get("baz"))
+
+
+if __name__ == '__main__':
+    unittest.main()
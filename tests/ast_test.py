@@ -0,0 +1,25 @@
+import unittest
+
+from ..jsparser import ast
+from ..jsparser import parser
+
+
+class AstTest(unittest.TestCase):
+
+    def test_slots(self):
+        node = ast.VariableDeclarationExprAST(ast.VariableExprAST("a"), ast.NumberExprAST(1.0))
+        self.assertFalse(hasattr(node, "__dict__"))
+        self.assertEqual("a = 1.0", str(node))
+        with self.assertRaises(AttributeError):
+            node.unknown = 1
+
+    def test_walk(self):
+        ctx = {"globals": [], "functions": []}
+        parser.parse_code_to_ast("function add(a, b) { return a + b; }", ctx)
+        nodes = [type(node).__name__ for node in ast.walk(ctx['functions'][0])]
+        self.assertEqual(["FunctionAST", "PrototypeAST", "BlockExprAST", "ReturnExprAST",
+                          "BinaryExprAST", "VariableExprAST", "VariableExprAST"], nodes)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from ..jsparser import cli
+from ..jsparser.errors import JSSyntaxError
+
+
+class CliTest(unittest.TestCase):
+
+    def test_batch(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            src_dir = os.path.join(tmp_dir, "src")
+            os.makedirs(os.path.join(src_dir, "lib"))
+            with open(os.path.join(src_dir, "add.js"), "w") as f:
+                f.write("function add(a, b) {\n    return a + b;\n}\n")
+            with open(os.path.join(src_dir, "lib", "sub.js"), "w") as f:
+                f.write("function sub(a, b) {\n    return a - b;\n}\n")
+            with open(os.path.join(src_dir, "broken.js"), "w") as f:
+                f.write("var a = 1.2.3;")  # not a number
+
+            out_dir = os.path.join(tmp_dir, "out")
+            jobs = cli.collect_jobs([src_dir], out_dir=out_dir)
+            self.assertEqual(3, len(jobs))
+
+            report = io.StringIO()
+            results = cli.run_batch(jobs, workers=2, report=report)
+            failed = [result[0] for result in results if result[3] is not None]
+            self.assertEqual([os.path.join(src_dir, "broken.js")], failed)
+            self.assertIn("3 files, 1 failed", report.getvalue())
+            self.assertIn("JSSyntaxError: invalid number 1.2.3 (broken.js, line 1)", report.getvalue())
+
+            g = {}
+            with open(os.path.join(out_dir, "lib", "sub.py")) as f:
+                exec(f.read(), g)
+            self.assertEqual(1, g['sub'](3, 2))
+            self.assertTrue(os.path.exists(os.path.join(out_dir, "add.py")))
+            self.assertEqual(["add.py", "lib"], sorted(os.listdir(out_dir)))  # no output for the broken file
+
+    def test_large(self):
+        js_code = """var foo = 1.0 + 2; // café
+function add(a, b) {
+    if (a > b) { return Math.max(a, foo * 1); }
+    return a + b;
+}
+var bar = 3;
+function sub(a, b) { return a - b; }
+"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            input_path = os.path.join(tmp_dir, "bundle.js")
+            output_path = os.path.join(tmp_dir, "bundle.py")
+            with open(input_path, "w", encoding="utf-8") as f:
+                f.write(js_code)
+            for opt_level in (0, 2):
+                size = cli.transpile_large(input_path, output_path, opt_level)
+                with open(output_path) as f:
+                    py_code = f.read()
+                self.assertEqual(cli.transpile(js_code, opt_level), py_code)
+                self.assertEqual(len(py_code), size)
+
+            with open(input_path, "w", encoding="utf-8") as f:
+                f.write("// é\nvar a = 1.2.3;")
+            with self.assertRaises(JSSyntaxError) as cm:
+                cli.transpile_large(input_path, output_path)
+            self.assertEqual((2, 9), (cm.exception.lineno, cm.exception.offset))
+            with open(output_path) as f:
+                self.assertEqual(py_code, f.read())  # the previous output is kept
+            self.assertEqual(["bundle.js", "bundle.py"], sorted(os.listdir(tmp_dir)))
+
+            open(input_path, "w").close()
+            self.assertEqual(1, cli.transpile_large(input_path, output_path))  # an empty source, can't be mapped
+
+    def test_main_syntax_error(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            input_path = os.path.join(tmp_dir, "broken.js")
+            output_path = os.path.join(tmp_dir, "broken.py")
+            with open(input_path, "w") as f:
+                f.write("var a = (1 +;")
+            with mock.patch("sys.argv", ["jsparser", input_path, output_path]), \
+                    mock.patch("sys.stderr", io.StringIO()) as stderr, self.assertRaises(SystemExit):
+                cli.main()
+            self.assertIn("JSSyntaxError", stderr.getvalue())
+            self.assertEqual(["broken.js"], os.listdir(tmp_dir))  # neither an empty output nor a temporary file
+
+    def test_collect_jobs_from_glob_and_manifest(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for name in ("a.js", "b.js", "c.txt"):
+                open(os.path.join(tmp_dir, name), "w").close()
+            manifest = os.path.join(tmp_dir, "manifest.txt")
+            with open(manifest, "w") as f:
+                f.write("# comment\n\na.js out/a_impl.py\nb.js\n")
+
+            jobs = cli.collect_jobs([os.path.join(tmp_dir, "*.js")], out_dir=os.path.join(tmp_dir, "out"))
+            self.assertEqual([(os.path.join(tmp_dir, "a.js"), os.path.join(tmp_dir, "out", "a.py")),
+                              (os.path.join(tmp_dir, "b.js"), os.path.join(tmp_dir, "out", "b.py"))], jobs)
+
+            jobs = cli.collect_jobs([], manifest=manifest)
+            self.assertEqual([(os.path.join(tmp_dir, "a.js"), os.path.join(tmp_dir, "out", "a_impl.py")),
+                              (os.path.join(tmp_dir, "b.js"), os.path.join(tmp_dir, "b.py"))], jobs)
+
+
+if __name__ == '__main__':
+    unittest.main()
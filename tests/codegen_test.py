@@ -0,0 +1,55 @@
+import io
+import unittest
+
+from ..jsparser import parser
+from ..jsparser import codegen
+
+
+class CodegenTest(unittest.TestCase):
+
+    def parse(self, js_code):
+        ctx = {"globals": [], "functions": [], "externals": {"Math.max": "max"}}
+        return parser.parse_code_to_ast(js_code, ctx)
+
+    def test_generate_python_code(self):
+        ctx = self.parse("""
+            var foo = 1.0;
+            function clamp(a, b) {
+                if (a > b) {
+                    return b;
+                }
+                return Math.max(a, foo);
+            }
+            function noop() {}
+        """)
+        expected = ("foo = 1.0\n"
+                    "\n"
+                    "def clamp(a, b):\n"
+                    "    if (a > b):\n"
+                    "        return b\n"
+                    "    return max(a, foo)\n"
+                    "\n"
+                    "\n"
+                    "def noop():\n"
+                    "    pass\n"
+                    "\n"
+                    "\n")
+        self.assertEqual(expected, codegen.generate_python_code(ctx))
+
+        out = io.StringIO()
+        codegen.write_python_code(ctx, out)
+        self.assertEqual(expected, out.getvalue())
+
+        g = {}
+        exec(expected, g)
+        self.assertEqual(2, g['clamp'](3, 2))
+        self.assertEqual(1, g['clamp'](0, 2))
+
+    def test_str(self):
+        ctx = self.parse("function add(a, b) { return a + b * 2; }")
+        self.assertEqual("return (a + (b * 2.0))", str(ctx['functions'][0].body.body_expr[0]))
+        self.assertEqual("(a + (b * 2.0))", str(ctx['functions'][0].body.body_expr[0].rhs))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from ..jsparser import diskcache
+from ..jsparser import parser
+from ..jsparser.engine import JSEngine
+
+
+JS_CODE = """
+var foo = 2;
+function add(a, b) {
+    return a + b + foo;
+}
+"""
+
+
+class DiskCacheTest(unittest.TestCase):
+
+    def test_engine_warm_start(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            JSEngine({}, cache_dir=cache_dir).eval(JS_CODE)
+            self.assertEqual(2, len(os.listdir(cache_dir)))  # *.py and *.jsc
+
+            js_runtime = JSEngine({}, cache_dir=cache_dir)
+            with mock.patch.object(parser, "parse_code_to_ast") as parse_code_to_ast:
+                js_runtime.eval(JS_CODE)
+                parse_code_to_ast.assert_not_called()
+            self.assertEqual(5, js_runtime.get("add")(1, 2))
+            self.assertEqual({"foo": "var", "add": "function"}, js_runtime.symbols())
+
+    def test_invalidation(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = diskcache.DiskCache(cache_dir)
+            cache.store_source(b"key", "a = 1\n")
+            self.assertEqual("a = 1\n", cache.load_source(b"key"))
+            self.assertIsNone(cache.load_source(b"other key"))
+
+            with mock.patch.object(diskcache, "__version__", "999.0.0"):
+                self.assertIsNone(cache.load_source(b"key"))
+            with mock.patch.object(diskcache, "g_format_version", diskcache.g_format_version + 1):
+                self.assertIsNone(cache.load_source(b"key"))
+
+            cache.store_code(b"key", {"a": "var"}, compile("a = 1\n", "<jsparser>", "exec"))
+            path = cache._path(b"key", ".jsc")
+            with open(path, "rb") as f:
+                data = f.read()
+            with open(path, "wb") as f:
+                f.write(data[:len(data) // 2])  # truncated
+            self.assertIsNone(cache.load_code(b"key"))
+            with open(path, "wb") as f:
+                f.write(b"\0\0\0\0" + data[4:])  # written by another python version
+            self.assertIsNone(cache.load_code(b"key"))
+
+    def test_concurrent_writers(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = diskcache.DiskCache(cache_dir)
+            sources = ["a = %d\n" % i * 1000 for i in range(8)]
+            threads = [threading.Thread(target=cache.store_source, args=(b"key", source)) for source in sources]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertIn(cache.load_source(b"key"), sources)  # never a partial file
+            self.assertEqual(1, len(os.listdir(cache_dir)))  # no leftover temporary files
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import random
+import unittest
+
+from ..jsparser import ast
+from ..jsparser import parser
+from ..jsparser.document import Document
+from ..jsparser.engine import JSEngine
+from ..jsparser.errors import JSSyntaxError
+from .parser_test import dump
+
+
+JS_CODE = """var counter = 1;
+function inc(a) {
+    return a + 1;
+}
+function twice(a) { return inc(a) * 2; }
+if (counter > 0) { counter = 2; }
+"""
+
+
+def full_parse(js_code):
+    return parser.parse_code_to_ast(js_code, {"globals": [], "functions": [], "externals": {"Math.max": "max", "Math.min": "min"}})
+
+
+def spans(ctx):
+    return [node.span for key in ("globals", "functions") for root in ctx[key] for node in ast.walk(root)]
+
+
+class DocumentTest(unittest.TestCase):
+
+    def assertSameAsFullParse(self, doc):
+        ctx = doc.ctx()
+        expected = full_parse(doc.text)
+        self.assertEqual(dump(expected['globals']), dump(ctx['globals']))
+        self.assertEqual(dump(expected['functions']), dump(ctx['functions']))
+        self.assertEqual(spans(expected), spans(ctx))
+
+    def edit(self, doc, old, new):
+        start = doc.text.index(old)
+        return doc.edit(start, start + len(old), new)
+
+    def test_edit(self):
+        js_runtime = JSEngine({})
+        doc = Document(js_runtime, JS_CODE)
+        self.assertEqual(4, len(doc))
+        self.assertEqual(2, js_runtime.get("counter"))
+        js_runtime.set("counter", 5)
+        twice = js_runtime.get("twice")
+
+        nodes = self.edit(doc, "a + 1", "a + 10")
+        self.assertEqual(["inc"], [node.proto.name for node in nodes])
+        self.assertEqual(11, js_runtime.get("inc")(1))
+        self.assertEqual(22, js_runtime.get("twice")(1))
+        self.assertIs(twice, js_runtime.get("twice"))  # not executed again
+        self.assertEqual(5, js_runtime.get("counter"))  # the global statements neither
+        self.assertSameAsFullParse(doc)
+
+        self.edit(doc, "if (counter > 0) { counter = 2; }", "if (counter > 0) { counter = 2; } else { counter = 3; }")
+        self.assertSameAsFullParse(doc)
+        self.edit(doc, "function twice", "function thrice(a) { return a * 3; }\nfunction twice")
+        self.assertEqual(9, js_runtime.get("thrice")(3))
+        self.assertSameAsFullParse(doc)
+        doc.edit(len(doc.text), len(doc.text), "var last = inc(0);\n")
+        self.assertEqual(10, js_runtime.get("last"))
+        self.assertSameAsFullParse(doc)
+        self.edit(doc, "function thrice(a) { return a * 3; }\n", "")
+        self.assertEqual(5, len(doc))
+        self.assertSameAsFullParse(doc)
+
+    def test_syntax_error(self):
+        doc = Document(JSEngine({}), JS_CODE)
+        with self.assertRaises(JSSyntaxError) as cm:
+            self.edit(doc, "return a + 1;", "return a + ;")
+        self.assertEqual(3, cm.exception.lineno)
+        self.assertEqual(JS_CODE, doc.text)
+        self.assertSameAsFullParse(doc)
+
+    def test_js_traceback(self):
+        js_runtime = JSEngine({})
+        doc = Document(js_runtime, JS_CODE)
+        self.edit(doc, "return a + 1;", "return a / 0;")
+        try:
+            js_runtime.get("twice")(1)
+        except ZeroDivisionError as e:
+            self.assertEqual([("twice", 5), ("inc", 3)], js_runtime.js_traceback(e))
+        else:
+            self.fail("ZeroDivisionError not raised")
+
+    def test_inlining(self):
+        js_runtime = JSEngine({}, opt_level=3)
+        doc = Document(js_runtime, JS_CODE)
+        self.assertEqual(4, js_runtime.get("twice")(1))
+        self.edit(doc, "a + 1", "a + 10")
+        self.assertEqual(22, js_runtime.get("twice")(1))  # `inc` was inlined into `twice`, which is compiled again
+
+    def test_random_edits(self):
+        rnd = random.Random(0)
+        js_code = "".join("""// function %d
+function f%d(a, b) {
+    var c = a * %d.5 + f%d(b, a);
+    if (c > 1) { c = Math.max(c, b); } else {
+        c = 0 - c;
+    }
+    return c;
+}
+var g%d = (%d + 1) * 2;
+""" % (i, i, i, (i + 1) % 6, i, i) for i in range(6))
+        doc = Document(JSEngine({}), js_code)
+        snippets = ["", " ", "\n", "}", "{", ";", "1", "else", "function g(a) { return a; }\n", "if (a) { b = 1; }"]
+        for _ in range(300):
+            start = rnd.randrange(len(doc.text) + 1)
+            end = min(len(doc.text), start + rnd.choice([0, 0, 1, 2, 10]))
+            text = rnd.choice(snippets)
+            new_text = doc.text[:start] + text + doc.text[end:]
+            try:
+                full_parse(new_text)
+            except JSSyntaxError:
+                old_text = doc.text
+                self.assertRaises(JSSyntaxError, doc.edit, start, end, text)
+                self.assertEqual(old_text, doc.text)
+                continue
+            try:
+                doc.edit(start, end, text)
+            except (NameError, SyntaxError, TypeError):  # code which parses but can not run(e.g. a global `return`)
+                pass
+            self.assertEqual(new_text, doc.text)
+            self.assertSameAsFullParse(doc)
+
+
+if __name__ == '__main__':
+    unittest.main()
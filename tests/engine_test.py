@@ -1,6 +1,9 @@
+import tempfile
 import unittest
+from unittest import mock
 
-from ..jsparser.engine import JSEngine
+from ..jsparser import parser
+from ..jsparser.engine import JSEngine, CompileCache, shared_builtins
 
 
 class EngineTest(unittest.TestCase):
@@ -39,6 +42,119 @@ class EngineTest(unittest.TestCase):
         self.assertEqual(3, result)
         self.assertEqual(1.0, foo)
 
+    def test_incremental_eval(self):
+        js_runtime = JSEngine({})
+        js_runtime.eval("""
+        var counter = 1.0;
+
+        function inc(a) {
+            return a + 1;
+        }
+        """)
+        js_runtime.set("counter", 5)
+
+        # only the new snippet is executed, `counter` must not be re-initialized
+        js_runtime.eval("""
+        function dec(a) {
+            return a - 1;
+        }
+        """)
+        self.assertEqual(5, js_runtime.get("counter"))
+        self.assertEqual(2, js_runtime.get("inc")(1))
+        self.assertEqual(0, js_runtime.get("dec")(1))
+        self.assertEqual({"counter": "var", "inc": "function", "dec": "function"}, js_runtime.symbols())
+
+    def test_compile_cache(self):
+        js_code = """
+        function add(a, b) {
+            return a + b;
+        }
+        """
+        cache = CompileCache(maxsize=2)
+        js_runtime = JSEngine({}, cache=cache)
+        js_runtime.eval(js_code)
+
+        other_runtime = JSEngine({}, cache=cache)
+        with mock.patch.object(parser, "parse_code_to_ast") as parse_code_to_ast:
+            other_runtime.eval(js_code)
+            parse_code_to_ast.assert_not_called()  # a hit skips the parser
+        self.assertEqual(3, other_runtime.get("add")(1, 2))
+        self.assertEqual({"add": "function"}, other_runtime.symbols())
+        self.assertEqual({"hits": 1, "misses": 1, "size": 1, "maxsize": 2}, cache.info())
+
+        # LRU eviction
+        js_runtime.eval("var a = 1;")
+        js_runtime.eval(js_code)
+        js_runtime.eval("var b = 2;")  # evicts `var a = 1;`
+        js_runtime.eval(js_code)
+        js_runtime.eval("var a = 1;")
+        self.assertEqual({"hits": 3, "misses": 4, "size": 2, "maxsize": 2}, cache.info())
+
+    def test_global_namespace(self):
+        first, second = JSEngine(), JSEngine()
+        first.eval("var a = 1;")
+        self.assertIsNone(second.get("a"))  # the default namespaces are not shared
+
+        first.eval("function get_a() { return a; }")
+        values = {"a": 2, "b": 3}
+        first.set_all(values)
+        self.assertEqual(2, first.get("get_a")())  # the function sees the new bindings
+        values["a"] = 4
+        self.assertEqual(2, first.get("a"))
+
+    def test_instantiate(self):
+        js_code = """
+        var base = 1;
+        function score(a) {
+            return Math.max(a * rate + base, limit);
+        }
+        """
+        js_runtime = JSEngine({})
+        shared = shared_builtins({"rate": 2, "limit": 0})
+
+        tenants = []
+        for i in range(100):
+            bindings = {"limit": i} if i % 2 else {}
+            namespace = js_runtime.instantiate(js_code, bindings, shared)
+            if bindings:
+                self.assertIs(bindings, namespace.globals)  # bound without a copy
+            tenants.append(namespace)
+        self.assertEqual(1, js_runtime.cache_info()["misses"])  # compiled once
+        self.assertIs(tenants[0].get("score").__code__, tenants[99].get("score").__code__)
+        self.assertNotIn("rate", tenants[0].globals)
+
+        self.assertEqual(7, tenants[0].get("score")(3))
+        self.assertEqual(99, tenants[99].get("score")(3))  # its own `limit` hides the shared one
+        tenants[0].set_all({"base": 0, "rate": 10})
+        self.assertEqual(30, tenants[0].get("score")(3))
+        self.assertEqual(7, tenants[2].get("score")(3))  # isolated from the other namespaces
+
+        namespace = js_runtime.compile(js_code).instantiate({"rate": 1, "limit": 0})
+        self.assertEqual(6, namespace.get("score")(5))
+        self.assertIsNone(js_runtime.get("base"))  # the engine's namespace is untouched
+
+    def test_js_traceback(self):
+        js_code = """var k = 2;
+function inner(a) {
+    var b = a * k;
+    return fail(b);
+}
+function outer(a) {
+    return inner(a) + 1;
+}
+"""
+        with tempfile.TemporaryDirectory() as cache_dir:
+            for compiler in ("source", "ast", "source"):  # the last one loads the script from the disk cache
+                js_runtime = JSEngine({}, cache_dir=cache_dir, compiler=compiler)
+                js_runtime.set("fail", lambda b: 1 / 0)
+                js_runtime.eval(js_code)
+                try:  # not assertRaises, it drops the traceback
+                    js_runtime.eval("var a = 1;\n\na = outer(a);")
+                except ZeroDivisionError as exc:
+                    self.assertEqual([("<module>", 3), ("outer", 7), ("inner", 4)], js_runtime.js_traceback(exc))
+                else:
+                    self.fail("ZeroDivisionError not raised")
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,151 @@
+import random
+import unittest
+
+from ..jsparser import lexer
+from ..jsparser import parser
+from ..jsparser import codegen
+from ..jsparser.errors import JSSyntaxError
+
+
+def tokenize(lexer_class, code):
+    lex = lexer_class(lexer.StringBuffer(code) if lexer_class is not lexer.BytesLexer else lexer.BytesBuffer(code.encode("utf-8")))
+    tokens = []
+    while True:
+        try:
+            if lex.get_next_token() == lexer.Token.EOF:
+                break
+        except JSSyntaxError:  # e.g.: a number like `1.2.3`
+            tokens.append(("error", None))
+            break
+        if lex.cur_token == lexer.Token.IDENTIFIER or lex.cur_token in lexer.g_keywords.values():
+            tokens.append((lex.cur_token, lex.identifier_str))
+        elif lex.cur_token == lexer.Token.NUMBER:
+            tokens.append((lex.cur_token, lex.number_val))
+        else:
+            tokens.append((lex.cur_token, None))
+    return tokens
+
+
+def token_spans(lex):
+    spans = []
+    while lex.get_next_token() != lexer.Token.EOF:
+        spans.append((lex.token_start, lex.token_end))
+    return spans
+
+
+class LexerTest(unittest.TestCase):
+
+    WORDS = ["var", "function", "return", "if", "else", "foo", "_bar1", "Math", "max", "héllo",
+             "0", "1.5", "42", "3.", "(", ")", "{", "}", ",", ".", ";", "=", "+", "-", "*", "/", "<", ">",
+             "// comment", "// /* } */", "//", " ", "  ", "\t", "\n", "\r\n", "\n\n"]
+
+    def test_regex_lexer_matches_char_lexer(self):
+        rnd = random.Random(1234)
+        for _ in range(500):
+            words = [rnd.choice(self.WORDS) for _ in range(rnd.randint(0, 40))]
+            code = "".join(word + rnd.choice(["", " ", "\n"]) for word in words)
+            expected = tokenize(lexer.Lexer, code)
+            self.assertEqual(expected, tokenize(lexer.RegexLexer, code), repr(code))
+            if expected and expected[-1][0] == "error":
+                self.assertRaises(JSSyntaxError, lexer.tokenize, lexer.StringBuffer(code))
+            else:
+                self.assertEqual(expected, tokenize(lexer.TokenBufferLexer, code), repr(code))
+
+    def test_bytes_lexer_matches_regex_lexer(self):
+        rnd = random.Random(4321)
+        words = self.WORDS + ["€", "é", "\xa0", "\u0661", "x\u00b2", "\x1c", "\x00"]  # non-ASCII letters, spaces, digits
+        for _ in range(500):
+            code = "".join(rnd.choice(words) + rnd.choice(["", " ", "\n"]) for _ in range(rnd.randint(0, 40)))
+            expected = tokenize(lexer.RegexLexer, code)
+            self.assertEqual(expected, tokenize(lexer.BytesLexer, code), repr(code))
+            if not expected or expected[-1][0] != "error":
+                spans = [(len(code[:start].encode("utf-8")), len(code[:end].encode("utf-8")))
+                         for start, end in token_spans(lexer.RegexLexer(lexer.StringBuffer(code)))]
+                self.assertEqual(spans, token_spans(lexer.BytesLexer(lexer.BytesBuffer(code.encode("utf-8")))))
+
+        buffer = lexer.BytesBuffer("var é = 1;\r\n// €\nvar b = 1.2.3;".encode("utf-8"))
+        with self.assertRaises(JSSyntaxError) as cm:
+            token_spans(lexer.BytesLexer(buffer))
+        self.assertEqual((3, 9, "var b = 1.2.3;"), (cm.exception.lineno, cm.exception.offset, cm.exception.text))
+        self.assertEqual("// €", buffer.line_at(18))
+        self.assertRaises(JSSyntaxError, token_spans, lexer.BytesLexer(lexer.BytesBuffer(b"var a\xff = 1;")))
+
+    def test_many_comment_lines(self):
+        code = "// comment\n" * 10000 + "var a = 1;\n" + "// comment\n" * 10000
+        expected = [(lexer.Token.VAR, "var"), (lexer.Token.IDENTIFIER, "a"), ("=", None),
+                    (lexer.Token.NUMBER, 1.0), (lexer.Token.NEW_LINE, None)]
+        self.assertEqual(expected, tokenize(lexer.Lexer, code))
+        self.assertEqual(expected, tokenize(lexer.RegexLexer, code))
+
+    def test_positions(self):
+        code = "var a = 1.5; // one\r\nfunction f(b) {\r  return b;\n}"
+        expected = [(0, 3), (4, 5), (6, 7), (8, 11), (11, 12), (21, 29), (30, 31), (31, 32), (32, 33), (33, 34),
+                    (35, 36), (39, 45), (46, 47), (47, 48), (49, 50)]
+        self.assertEqual(expected, token_spans(lexer.Lexer(lexer.StringBuffer(code))))
+        self.assertEqual(expected, token_spans(lexer.RegexLexer(lexer.StringBuffer(code))))
+        self.assertEqual(expected, token_spans(lexer.TokenBufferLexer(lexer.StringBuffer(code))))
+        chunks = [code[i:i + 4] for i in range(0, len(code), 4)]  # "\r\n" is split across two chunks
+        self.assertEqual(expected, token_spans(lexer.Lexer(lexer.StreamBuffer(chunks))))
+
+        for buffer in (lexer.StringBuffer(code), lexer.StreamBuffer(chunks)):
+            token_spans(lexer.Lexer(buffer))
+            self.assertEqual((1, 0), buffer.position(0))
+            self.assertEqual((1, 20), buffer.position(20))
+            self.assertEqual((2, 0), buffer.position(21))
+            self.assertEqual((3, 3), buffer.position(40))
+            self.assertEqual((4, 0), buffer.position(49))
+        buffer = lexer.StringBuffer(code)
+        self.assertEqual("var a = 1.5; // one", buffer.line_at(5))
+        self.assertEqual("function f(b) {", buffer.line_at(21))
+        self.assertEqual("  return b;", buffer.line_at(45))
+        self.assertEqual("}", buffer.line_at(49))
+
+    def test_token_buffer(self):
+        code = "var a = a * 2; a = 2 € a;"
+        tokens = lexer.tokenize(lexer.StringBuffer(code))
+        self.assertEqual(14, len(tokens))
+        self.assertEqual(("b", "i", "i", "i"), (tokens.kinds.typecode, tokens.starts.typecode,
+                                                tokens.ends.typecode, tokens.values.typecode))
+        self.assertEqual(["var", "a", 2.0, "€"], tokens.table)  # interned
+        self.assertEqual([lexer.Token.VAR, "=", "€", lexer.Token.EOF], [tokens.token(i) for i in (0, 2, 10, 13)])
+
+        for lexer_class in (lexer.Lexer, lexer.RegexLexer, lexer.TokenBufferLexer):
+            lex = lexer_class(lexer.StringBuffer(code))
+            lex.get_next_token()
+            self.assertEqual(lexer.Token.IDENTIFIER, lex.peek_token())
+            self.assertEqual((lexer.Token.VAR, 0, 3), (lex.cur_token, lex.token_start, lex.token_end))
+            self.assertEqual(lexer.Token.IDENTIFIER, lex.get_next_token())
+            self.assertEqual(("a", 4, 5, 3), (lex.identifier_str, lex.token_start, lex.token_end, lex.prev_token_end))
+
+        lex = lexer.TokenBufferLexer(None, tokens)  # reuses the tokens
+        self.assertEqual(["=", lexer.Token.EOF], [lex.peek_token(3), lex.peek_token(100)])
+        for _ in range(20):
+            lex.get_next_token()
+        self.assertEqual(lexer.Token.EOF, lex.cur_token)
+
+    def test_invalid_number(self):
+        for lexer_class in (lexer.Lexer, lexer.RegexLexer, lexer.TokenBufferLexer):
+            with self.assertRaises(JSSyntaxError) as cm:
+                lex = lexer_class(lexer.StringBuffer("var a = 1;\nvar b = 1.2.3;"))
+                while lex.get_next_token() != lexer.Token.EOF:
+                    pass
+            self.assertEqual("invalid number 1.2.3", cm.exception.msg)
+            self.assertEqual((2, 9, "var b = 1.2.3;"), (cm.exception.lineno, cm.exception.offset, cm.exception.text))
+            self.assertEqual((19, 24), cm.exception.span)
+
+    def test_parse_with_regex_backend(self):
+        js_code = """
+            var foo = 1.0; // foo
+            function add(arg0, arg1) {
+                return Math.max(arg0 + arg1, foo);
+            }
+        """
+        py_codes = []
+        for backend in ("char", "regex"):
+            ctx = {"globals": [], "functions": [], "externals": {"Math.max": "max"}}
+            py_codes.append(codegen.generate_python_code(parser.parse_code_to_ast(js_code, ctx, backend)))
+        self.assertEqual(py_codes[0], py_codes[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
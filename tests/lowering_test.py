@@ -0,0 +1,68 @@
+import math
+import unittest
+
+from ..jsparser import codegen
+from ..jsparser import lowering
+from ..jsparser import parser
+from ..jsparser.engine import JSEngine
+
+
+JS_CODE = """
+var scale = 2;
+var base = 1 + 2 * 3;
+
+function clamp(a, b) {
+    if (a > b) {
+        return b;
+    }
+    return Math.max(a, 0);
+}
+
+function norm(x, y) {
+    var d = x * x + y * y;
+    return Math.sqrt(d) / scale - base;
+}
+
+function noop() {}
+"""
+
+
+class MathModule(object):
+    sqrt = staticmethod(math.sqrt)
+
+
+class LoweringTest(unittest.TestCase):
+
+    def compile_both(self):
+        ctx = {"globals": [], "functions": [], "externals": {"Math.max": "max"}}
+        parser.parse_code_to_ast(JS_CODE, ctx)
+        source_g = {"Math": MathModule}
+        exec(compile(codegen.generate_python_code(ctx), "<jsparser>", "exec"), source_g)
+        ast_g = {"Math": MathModule}
+        exec(lowering.compile_ctx(ctx), ast_g)
+        return source_g, ast_g
+
+    def test_same_behavior_as_source(self):
+        source_g, ast_g = self.compile_both()
+        self.assertEqual(source_g['base'], ast_g['base'])
+        for args in [(1, 2), (3, 2), (-1, 2)]:
+            self.assertEqual(source_g['clamp'](*args), ast_g['clamp'](*args))
+            self.assertEqual(source_g['norm'](*args), ast_g['norm'](*args))
+        self.assertIsNone(ast_g['noop']())
+
+    def test_line_numbers(self):
+        _, ast_g = self.compile_both()
+        code = ast_g['clamp'].__code__
+        self.assertGreater(code.co_firstlineno, 0)
+        self.assertGreater(len(set(line for _, _, line in code.co_lines() if line is not None)), 1)
+
+    def test_engine(self):
+        js_runtime = JSEngine({}, compiler="ast")
+        js_runtime.eval("function add(a, b) { return a + b; }")
+        self.assertEqual(3, js_runtime.get("add")(1, 2))
+        with self.assertRaises(ValueError):
+            JSEngine({}, compiler="unknown")
+
+
+if __name__ == '__main__':
+    unittest.main()
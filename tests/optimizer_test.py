@@ -0,0 +1,133 @@
+import random
+import unittest
+
+from ..jsparser import codegen
+from ..jsparser import optimizer
+from ..jsparser import parser
+from ..jsparser.engine import JSEngine
+
+
+def random_expr(rnd, depth):
+    if depth == 0 or rnd.random() < 0.2:
+        return rnd.choice(["a", "b", "0", "1", "2", "3.5"])
+    op = rnd.choice(["+", "-", "*", "/", "<", ">"])
+    return "(%s %s %s)" % (random_expr(rnd, depth - 1), op, random_expr(rnd, depth - 1))
+
+
+class OptimizerTest(unittest.TestCase):
+
+    def parse(self, js_code, level):
+        ctx = {"globals": [], "functions": [], "externals": {}}
+        return optimizer.optimize(parser.parse_code_to_ast(js_code, ctx), level)
+
+    def compile(self, js_code, level):
+        g = {}
+        exec(codegen.generate_python_code(self.parse(js_code, level), minimal_parens=level >= 1), g)
+        return g
+
+    def call(self, f, *args):
+        try:
+            return f(*args)
+        except ZeroDivisionError as e:
+            return type(e)
+
+    def test_constant_folding(self):
+        ctx = self.parse("var k = 2 * 3.5 + 1; function f(a) { return a * (4 - 2); }", 1)
+        self.assertEqual("k = 8.0\n\ndef f(a):\n    return a * 2.0\n\n\n",
+                         codegen.generate_python_code(ctx, minimal_parens=True))
+        ctx = self.parse("var k = 1 / 0;", 1)
+        self.assertEqual("k = (1.0 / 0.0)", str(ctx['globals'][0].body))
+
+    def test_algebraic_simplification(self):
+        js_code = "function f(a, b) { return (a * 1 + 0) * (1 * b - 0) / 1; }"
+        self.assertEqual("return a * b",
+                         codegen.to_source(self.parse(js_code, 2)['functions'][0].body.body_expr[0], True))
+        self.assertEqual("return (a * 1.0 + 0.0) * (1.0 * b - 0.0) / 1.0",
+                         codegen.to_source(self.parse(js_code, 1)['functions'][0].body.body_expr[0], True))
+
+    def test_minimal_parens(self):
+        ctx = self.parse("function f(a, b) { return (a - (b - 1)) * (a + b) / (a * b) < (a < b); }", 1)
+        self.assertEqual("def f(a, b):\n    return (a - (b - 1.0)) * (a + b) / (a * b) < (a < b)\n\n\n",
+                         codegen.generate_python_code(ctx, minimal_parens=True)[1:])
+
+    def test_random_equivalence(self):
+        rnd = random.Random(12)
+        for _ in range(300):
+            js_code = "function f(a, b) { return %s; }" % random_expr(rnd, 4)
+            functions = [self.compile(js_code, level)['f'] for level in (0, 1, 2)]
+            for args in [(1.5, -2.0), (3.0, 0.5), (-1.0, 7.0)]:
+                expected = self.call(functions[0], *args)
+                for f in functions[1:]:
+                    self.assertEqual(expected, self.call(f, *args), js_code)
+
+    def test_inline(self):
+        ctx = self.parse("""
+            function add(a, b) { return a + b; }
+            function sq(a) { return a * a; }
+            function get_bar() { return bar; }
+            function f(x, y) { return add(sq(x), add(y, 1)) + get_bar(); }
+            function g(x) { return sq(x + 1); }
+            function h(bar) { return get_bar() + add(Math.max(bar, 1), 2); }
+        """, 3)
+        self.assertEqual("return x * x + (y + 1.0) + bar", codegen.to_source(ctx['functions'][3].body, True))
+        # `x + 1` would be evaluated twice, `bar` is hidden by the parameter, the arguments have a call
+        self.assertEqual("return sq(x + 1.0)", codegen.to_source(ctx['functions'][4].body, True))
+        self.assertEqual("return get_bar() + add(Math.max(bar, 1.0), 2.0)",
+                         codegen.to_source(ctx['functions'][5].body, True))
+        self.assertEqual(6, len(ctx['functions']))
+
+    def test_inline_equivalence(self):
+        js_code = """
+            function add(a, b) { return a + b; }
+            function scale(a) { return a * k; }
+            function f(x, y) { var k = 2; return add(x, y) - scale(add(x, 1)) / add(2, 3); }
+        """
+        for level in (0, 3):
+            js_runtime = JSEngine({}, opt_level=level)
+            js_runtime.set("k", 10)
+            js_runtime.eval(js_code)
+            self.assertEqual(3.0 - (2.0 * 10) / 5, js_runtime.get("f")(1.0, 2.0))
+
+    def test_shake(self):
+        js_code = """
+            var k = scale(2);
+            function scale(a) { return a * 2; }
+            function add(a, b) { return a + b; }
+            function sum3(a, b, c) { return add(add(a, b), c); }
+            function unused(a) { return sum3(a, a, a); }
+            function helper(a) { return a; }
+        """
+        ctx = optimizer.shake(self.parse(js_code, 0), ["sum3"])
+        self.assertEqual(["scale", "add", "sum3"], [function_ast.proto.name for function_ast in ctx['functions']])
+
+        js_runtime = JSEngine({}, exports=["sum3"])
+        js_runtime.set("scale", lambda a: a * 2)  # the globals run before the functions of the script are defined
+        js_runtime.eval(js_code)
+        self.assertEqual(6.0, js_runtime.get("sum3")(1, 2, 3))
+        self.assertIsNone(js_runtime.get("unused"))
+        self.assertNotIn("helper", js_runtime.symbols())
+
+    def test_shake_incremental(self):
+        for compiler in ("source", "ast"):
+            js_runtime = JSEngine({}, exports=["api"], compiler=compiler)
+            js_runtime.eval("function helper(x) { return x * 2; }\nfunction twice(x) { return helper(helper(x)); }")
+            self.assertNotIn("helper", js_runtime.symbols())  # nothing reaches it yet
+            js_runtime.eval("function api(x) { return twice(x) + 1; }")
+            self.assertEqual(13, js_runtime.get("api")(3))  # twice and helper are compiled once reached
+            self.assertEqual({"api", "twice", "helper"}, set(js_runtime.symbols()))
+
+            js_runtime = JSEngine({}, exports=["api"], compiler=compiler)
+            js_runtime.eval("function api(x) { return scale(x); }")
+            js_runtime.eval("function scale(x) { return x * 3; }\nfunction unused(x) { return x; }")
+            self.assertEqual(6, js_runtime.get("api")(2))  # reached by the code of an earlier script
+            self.assertIsNone(js_runtime.get("unused"))
+
+    def test_engine(self):
+        js_runtime = JSEngine({}, opt_level=2)
+        js_runtime.eval("var k = 2 * 3.5 + 1; function f(a) { return a * 1 + k; }")
+        self.assertEqual(8.0, js_runtime.get("k"))
+        self.assertEqual(10.0, js_runtime.get("f")(2.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
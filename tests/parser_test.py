@@ -1,7 +1,217 @@
+import ast as py_ast
+import io
+import itertools
+import logging
+import random
+import tracemalloc
 import unittest
 
+from ..jsparser import ast
+from ..jsparser import lexer
 from ..jsparser import parser
 from ..jsparser import codegen
+from ..jsparser import log
+from ..jsparser import lowering
+from ..jsparser.engine import JSEngine
+from ..jsparser.errors import JSSyntaxError
+
+
+class RecursiveParser(parser.Parser):
+    """ the original recursive descent parser, the reference of the iterative one """
+
+    def parse_identifier_expr(self):
+        id_name = self.lexer.identifier_str
+        self.lexer.get_next_token() # eat identifier
+
+        is_call = False
+        if self.lexer.cur_token == ".":
+            # MemberExpression
+            self.lexer.get_next_token() # eat '.'
+            id_name += "." + self.lexer.identifier_str # join MemberExpression, e.g.: class_name="Math", method_name="max", id_name="Math.max"
+            self.lexer.get_next_token() # eat identifier after  after `.`
+            is_call = True
+
+        id_name = self.map_symbol(id_name)
+
+        if is_call or self.lexer.cur_token == "(":
+            # Call
+            self.lexer.get_next_token() # eat '('
+            args = []
+            if self.lexer.cur_token != ")":
+                while True:
+                    arg = self.parse_expression()
+                    if arg is None:
+                        return None
+                    args.append(arg)
+
+                    if self.lexer.cur_token == ")":
+                        break
+                    if self.lexer.cur_token != ",":
+                        return None
+                    self.lexer.get_next_token()
+
+            self.lexer.get_next_token() # eat ')'
+            return ast.CallExprAST(callee=id_name, args=args)
+        else:
+            return ast.VariableExprAST(name=id_name)
+
+    def parse_paren_expr(self):
+        self.lexer.get_next_token()  # eat '('
+        v = self.parse_expression()
+        if v is None:
+            return None
+
+        if self.lexer.cur_token != ")":
+            return None
+        self.lexer.get_next_token() # eat ')'
+        return v
+
+    def parse_return_expr(self):
+        self.lexer.get_next_token()  # eat 'return'
+        rhs = self.parse_expression()
+        if rhs is None:
+            return None
+        return ast.ReturnExprAST(rhs=rhs)
+
+    def parse_variable_declaration_expr(self):
+        self.lexer.get_next_token()  # eat 'var'
+
+        lhs = self.parse_identifier_expr()
+        if lhs is None or type(lhs) is not ast.VariableExprAST:
+            return None
+
+        rhs = self.parse_bin_op_rhs(0, lhs)
+        if rhs is None:
+            return None
+        return ast.VariableDeclarationExprAST(variable_expr=lhs, rhs=rhs.rhs)
+
+    def parse_primary(self):
+        if self.lexer.cur_token == lexer.Token.IDENTIFIER:
+            return self.parse_identifier_expr()
+        elif self.lexer.cur_token == lexer.Token.NUMBER:
+            return self.parse_number_expr()
+        elif self.lexer.cur_token == lexer.Token.RETURN:
+            return self.parse_return_expr()
+        elif self.lexer.cur_token == lexer.Token.VAR:
+            return self.parse_variable_declaration_expr()
+        elif self.lexer.cur_token == lexer.Token.IF:
+            return self.parse_if_expr()
+        elif self.lexer.cur_token == "(":
+            return self.parse_paren_expr()
+        elif self.lexer.cur_token == "{":
+            return self.parse_block_expr()
+        return None
+
+    def parse_bin_op_rhs(self, expr_prec: int, lhs: ast.ExprAST):
+        while True:
+            token_prec = self.get_token_precedence()
+            if token_prec < expr_prec:
+                return lhs
+
+            bin_op = self.lexer.cur_token
+            self.lexer.get_next_token()  # eat bin_op
+
+            rhs = self.parse_primary()
+            if rhs is None:
+                return None
+
+            next_prec = self.get_token_precedence()
+            if token_prec < next_prec:
+                rhs = self.parse_bin_op_rhs(token_prec + 1, rhs)
+                if rhs is None:
+                    return None
+
+            lhs = ast.BinaryExprAST(lhs=lhs, op=bin_op, rhs=rhs)
+
+    def parse_expression(self):
+        lhs = self.parse_primary()
+        if lhs is None:
+            return None
+        rhs = self.parse_bin_op_rhs(0, lhs)
+        if rhs is None:  # e.g.: a()
+            return lhs
+        return rhs  # e.g.: a * 2
+
+    def parse_if_expr(self):
+        self.lexer.get_next_token()  # eat `if`
+
+        if self.lexer.cur_token != "(":
+            return None
+        self.lexer.get_next_token()  # eat `(`
+
+        cond_expr = self.parse_expression()
+        if cond_expr is None:
+            return None
+
+        if self.lexer.cur_token != ")":
+            return None
+        self.lexer.get_next_token()  # eat `)`
+
+        then_expr = self.parse_expression()
+        if then_expr is None:
+            return None
+
+        if self.lexer.cur_token == lexer.Token.ELSE:
+            self.lexer.get_next_token()  # eat `else`
+            else_expr = self.parse_expression()
+            if else_expr is None:
+                return None
+        else:
+            else_expr = None
+
+        return ast.IfExprAST(cond_expr=cond_expr, then_expr=then_expr, else_expr=else_expr)
+
+    def parse_block_expr(self):
+        body_expr = []
+        self.lexer.get_next_token()  # eat '{'
+
+        self.block_level += 1
+        while self.lexer.cur_token != lexer.Token.EOF and self.lexer.cur_token != lexer.Token.FUNCTION and self.lexer.cur_token != "}":
+            expr = self.parse_expression()
+            if expr is None:
+                return None
+            body_expr.append(expr)
+            self.lexer.get_next_token()
+
+        block = ast.BlockExprAST(self.block_level, body_expr=body_expr)
+        self.block_level -=1
+        return block
+
+
+def random_expr(rnd, depth):
+    if depth == 0 or rnd.random() < 0.15:
+        return rnd.choice(["a", "b", "1", "2.5", "f(a)", "Math.max(a, b)"])
+    if rnd.random() < 0.2:
+        return "(%s)" % random_expr(rnd, depth - 1)
+    if rnd.random() < 0.1:
+        return "g(%s, %s)" % (random_expr(rnd, depth - 1), random_expr(rnd, depth - 1))
+    op = rnd.choice(["+", "-", "*", "/", "<", ">", "="])
+    return "%s %s %s" % (random_expr(rnd, depth - 1), op, random_expr(rnd, depth - 1))
+
+
+def random_statement(rnd, depth):
+    kind = rnd.random()
+    if depth > 0 and kind < 0.2:
+        return "if (%s) { %s }" % (random_expr(rnd, 2), " ".join(random_statement(rnd, depth - 1) for _ in range(2)))
+    if kind < 0.4:
+        return "var v = %s;" % random_expr(rnd, 4)
+    if kind < 0.6:
+        return "return %s;" % random_expr(rnd, 4)
+    return "%s;" % random_expr(rnd, 4)
+
+
+def dump(node):
+    """ the whole tree as nested tuples, to compare trees, without the spans """
+    if isinstance(node, list):
+        return [dump(item) for item in node]
+    if not isinstance(node, ast.ExprAST):
+        return node
+    fields = []
+    for cls in type(node).__mro__:
+        for slot in getattr(cls, "__slots__", ()):
+            if slot != "span":
+                fields.append((slot, dump(getattr(node, slot))))
+    return (type(node).__name__, tuple(fields))
 
 
 class ParserTest(unittest.TestCase):
@@ -23,6 +233,221 @@ class ParserTest(unittest.TestCase):
         self.assertTrue("add" in g)
         self.assertEqual(3, g['add'](1, 2))  # invoke: add(1, 2) = 3
 
+    def test_parse_many(self):
+        sources = []
+        for i in range(64):
+            sources.append("""
+                var v%d = %d;
+                function f%d(a, b) {
+                    return a * %d + Math.max(b, v%d);
+                }
+            """ % (i, i, i, i, i))
+        externals = {"Math.max": "max"}
+
+        serial = []
+        for code in sources:
+            ctx = {"globals": [], "functions": [], "externals": externals}
+            serial.append(codegen.generate_python_code(parser.parse_code_to_ast(code, ctx)))
+
+        for _ in range(4):
+            ctxs = parser.parse_many(sources, externals=externals, max_workers=8)
+            self.assertEqual(serial, [codegen.generate_python_code(ctx) for ctx in ctxs])
+
+    def test_parse_stream(self):
+        js_code = "".join("""
+            var v%d = %d; // global
+            function f%d(a, b) {
+                return a * %d + b;
+            }
+        """ % (i, i, i, i) for i in range(100))
+        ctx = parser.parse_code_to_ast(js_code, {"globals": [], "functions": []})
+
+        consumed = []
+        def chunks(size=7):
+            for start in range(0, len(js_code), size):
+                consumed.append(start)
+                yield js_code[start:start + size]
+
+        streamed = {"globals": [], "functions": []}
+        for key, node in parser.parse_stream(chunks()):
+            if not streamed["functions"] and key == "functions":
+                self.assertLess(len(consumed), len(js_code) // 7 // 10)  # yielded long before the end of input
+            streamed[key].append(node)
+        self.assertEqual(codegen.generate_python_code(ctx), codegen.generate_python_code(streamed))
+
+        file_streamed = {"globals": [], "functions": []}
+        for key, node in parser.parse_stream(io.StringIO(js_code), chunk_size=64):
+            file_streamed[key].append(node)
+        self.assertEqual(codegen.generate_python_code(ctx), codegen.generate_python_code(file_streamed))
+
+    def test_parse_stream_memory(self):
+        function = "function f%d(a, b) {\n    var c = a * %d;\n    return c + b;\n}\n"
+
+        def chunks(num_functions):
+            for start in range(0, num_functions, 100):
+                yield "".join(function % (i, i) for i in range(start, start + 100))
+
+        tracemalloc.start()
+        try:
+            for num_functions in (300, 3000):
+                tracemalloc.reset_peak()
+                for _ in parser.parse_stream(chunks(num_functions), chunk_size=4096):
+                    pass
+                peak = tracemalloc.get_traced_memory()[1]
+                if num_functions == 300:
+                    small_peak = peak
+        finally:
+            tracemalloc.stop()
+        self.assertLess(peak, small_peak * 2)  # bounded by the largest definition, not by the input
+
+        with self.assertRaises(JSSyntaxError) as cm:  # the positions are still right after the dropped lines
+            list(parser.parse_stream(itertools.chain(chunks(1000), ["var x = (1 +;\n"])))
+        self.assertEqual((4001, 13), (cm.exception.lineno, cm.exception.offset))
+
+    def test_same_trees_as_recursive_parser(self):
+        rnd = random.Random(18)
+        for _ in range(200):
+            js_code = " ".join(random_statement(rnd, 3) for _ in range(3))
+            js_code += " function h(a, b) { %s }" % " ".join(random_statement(rnd, 3) for _ in range(3))
+            expected = RecursiveParser(lexer.Lexer(lexer.StringBuffer(js_code)),
+                                       {"globals": [], "functions": [], "externals": {"Math.max": "max"}}).parse()
+            for backend in ("char", "buffer"):
+                ctx = parser.parse_code_to_ast(js_code, {"globals": [], "functions": [], "externals": {"Math.max": "max"}},
+                                               backend)
+                self.assertEqual(dump(expected['globals']), dump(ctx['globals']), js_code)
+                self.assertEqual(dump(expected['functions']), dump(ctx['functions']), js_code)
+
+    def test_else(self):
+        js_code = """
+            function sign(a) {
+                if (a > 0) { return 1; } else if (a < 0) { return 0 - 1; } else { return 0; }
+            }
+            function clamp(a, b) {
+                if (a > b) return b; else return a;
+            }
+            if (1 > 2) { var c = 1; } else { var c = 2; }
+        """
+        for backend in ("char", "regex", "buffer"):
+            ctx = parser.parse_code_to_ast(js_code, {"globals": [], "functions": []}, backend)
+            g = {}
+            exec(codegen.generate_python_code(ctx), g)
+            self.assertEqual([1, -1, 0], [g['sign'](a) for a in (5, -5, 0)])
+            self.assertEqual([2, 1], [g['clamp'](a, 2) for a in (3, 1)])
+            self.assertEqual(2, g['c'])
+
+    def test_reuse_token_buffer(self):
+        js_code = "var foo = 1;\nfunction add(a, b) { return a + b * foo; }"
+        tokens = lexer.tokenize(lexer.StringBuffer(js_code))
+        dumps = []
+        for _ in range(2):
+            ctx = parser.Parser(lexer.TokenBufferLexer(None, tokens), {"globals": [], "functions": []}).parse()
+            dumps.append(dump(ctx['globals'] + ctx['functions']))
+        ctx = parser.parse_code_to_ast(js_code, {"globals": [], "functions": []})
+        self.assertEqual([dump(ctx['globals'] + ctx['functions'])] * 2, dumps)
+
+    def test_deep_nesting(self):
+        depth = 100000
+        cases = [
+            ("var a = " + "(" * depth + "b" + ")" * depth + ";", 3),
+            ("var a = " + "(1 + " * depth + "b" + ")" * depth + ";", 2 * depth + 3),
+            ("var a = " + "f(" * depth + "b" + ")" * depth + ";", depth + 3),
+            ("function f(a) { " + "if (a) { " * depth + "return a; " + "} " * depth + "}", 3 * depth + 3),
+        ]
+        for js_code, num_nodes in cases:
+            ctx = parser.parse_code_to_ast(js_code, {"globals": [], "functions": []})
+            node = (ctx['globals'] + ctx['functions'])[0]
+            self.assertEqual(num_nodes, sum(1 for _ in ast.walk(node.body)))
+
+    def test_deep_expressions(self):
+        js_code = "var x = " + " + ".join(["1"] * 3000) + ";"
+        for compiler in ("source", "ast"):
+            for opt_level in (0, 1, 3):
+                js_runtime = JSEngine({}, compiler=compiler, opt_level=opt_level)
+                js_runtime.eval(js_code)
+                self.assertEqual(3000, js_runtime.get("x"), (compiler, opt_level))
+
+        ctx = parser.parse_code_to_ast(js_code, {"globals": [], "functions": []})
+        g = {}
+        exec(codegen.generate_python_code(ctx), g)  # the CLI output
+        self.assertEqual(3000, g["x"])
+
+        js_code = ("function f(a) { if (log(0) + " + " * ".join("log(%d)" % i for i in range(1, 500)) + " > 1) {"
+                   " return a + " + "f(" * 1000 + "0" + ")" * 1000 + "; } return 2; }")
+        for compiler in ("source", "ast"):
+            calls = []
+            js_runtime = JSEngine({"log": lambda value: calls.append(value) or 0}, compiler=compiler)
+            js_runtime.eval(js_code)
+            self.assertEqual(2, js_runtime.get("f")(1))
+            self.assertEqual(list(range(500)), calls)  # the subexpressions split out still run in order
+
+    def test_deep_statements(self):
+        js_code = "function f(a) " + "{" * 5000 + "return a;" + "}" * 5000
+        for compiler in ("source", "ast"):
+            for opt_level in (0, 3):
+                js_runtime = JSEngine({}, compiler=compiler, opt_level=opt_level)
+                js_runtime.eval(js_code)
+                self.assertEqual(3, js_runtime.get("f")(3), (compiler, opt_level))
+
+        # python itself allows 100 nested indented suites, the backends walk deeper ones without recursing
+        js_code = "function f(a) { " + "if (a > 0) { " * 5000 + "return a;" + "}" * 5000 + " }"
+        ctx = parser.parse_code_to_ast(js_code, {"globals": [], "functions": []})
+        self.assertEqual(5000, codegen.generate_python_code(ctx).count("if "))
+        module = lowering.Lowering().lower_ctx(ctx)
+        self.assertEqual(5000, sum(isinstance(node, py_ast.If) for node in py_ast.walk(module)))
+
+    def test_spans(self):
+        js_code = "var foo = 1.0;\nfunction clamp(a, b) {\n    if (a > b) { log(a); return Math.max(b, foo); }\n    return a * (b + 2);\n}"
+        ctx = parser.parse_code_to_ast(js_code, {"globals": [], "functions": [], "externals": {"Math.max": "max"}})
+        self.assertEqual("var foo = 1.0", js_code[slice(*ctx['globals'][0].span)])
+        function_ast = ctx['functions'][0]
+        self.assertEqual(js_code[js_code.index("function"):], js_code[slice(*function_ast.span)])
+        self.assertEqual("clamp(a, b)", js_code[slice(*function_ast.proto.span)])
+        sources = [js_code[slice(*node.span)] if node.span is not None else None for node in ast.walk(function_ast.body)]
+        self.assertEqual([js_code[js_code.index("{"):],
+                          "if (a > b) { log(a); return Math.max(b, foo); }", None, None, None,
+                          "{ log(a); return Math.max(b, foo); }", "log(a)", None, "return Math.max(b, foo)", None, None, None,
+                          "return a * (b + 2)", None, None, None, None, None], sources)  # only the statements have a span
+        self.assertEqual((3, 15), ctx['lines'].position(function_ast.body.body_expr[0].then_expr.span[0]))
+
+    def test_syntax_error(self):
+        cases = [
+            ("var a = 1;\nfunction f(a) {\n    return a + ;\n}", "unexpected end of statement, expected the rhs of '+'", 3, 16),
+            ("var a = (1 + 2;", "expected ')', got end of statement", 1, 15),
+            ("f(a b);", "expected ')' or ',' in argument list, got identifier", 1, 5),
+            ("function (a) {}", "expected function name in prototype", 1, 10),
+            ("function f(a) return a;", "expected '{' in function, got return", 1, 15),
+            ("if a { }", "expected '(' after 'if'", 1, 4),
+            ("var f(a) = 1;", "expected a variable name", 1, 5),
+            ("var a + 1;\nvar b;", "expected a bin op in variable declaration", 2, 1),
+        ]
+        for js_code, msg, lineno, offset in cases:
+            for backend in ("char", "regex", "buffer"):
+                with self.assertRaises(JSSyntaxError) as cm:
+                    parser.parse_code_to_ast(js_code, {"globals": [], "functions": []}, backend)
+                self.assertEqual(msg, cm.exception.msg)
+                self.assertEqual((lineno, offset), (cm.exception.lineno, cm.exception.offset), js_code)
+                self.assertEqual(js_code.splitlines()[lineno - 1], cm.exception.text)
+
+        with self.assertRaises(SyntaxError):  # a JSSyntaxError is a SyntaxError
+            list(parser.parse_stream(["var a = ", "(1 +", " 2;"]))
+
+    def test_trace(self):
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        logging.getLogger("jsparser").addHandler(handler)
+        try:
+            parser.parse_code_to_ast("var a = 1;", {"globals": [], "functions": []})
+            self.assertEqual([], records)  # disabled by default
+
+            log.enable("parser", handler=handler)
+            parser.parse_code_to_ast("var a = 1;", {"globals": [], "functions": []})
+            self.assertTrue(records)
+            self.assertEqual({"jsparser.parser"}, {record.name for record in records})
+        finally:
+            log.disable()
+            logging.getLogger("jsparser").removeHandler(handler)
+
 
 if __name__ == '__main__':
     unittest.main()
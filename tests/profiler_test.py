@@ -0,0 +1,74 @@
+import time
+import unittest
+from unittest import mock
+
+from ..jsparser import lexer
+from ..jsparser import parser
+from ..jsparser.engine import JSEngine
+from ..jsparser.profiler import Profiler
+
+
+tokenize = lexer.tokenize
+
+
+JS_CODE = """
+var foo = 1.0;
+function add(a, b) {
+    return a + b;
+}
+function add3(a, b, c) {
+    return add(add(a, b), c);
+}
+"""
+
+
+class ProfilerTest(unittest.TestCase):
+
+    def test_parse(self):
+        lex = lexer.Lexer(lexer.StringBuffer(JS_CODE))
+        num_tokens = 0
+        while lex.get_next_token() != lexer.Token.EOF:
+            num_tokens += 1
+
+        profiler = Profiler()
+        parser.parse_code_to_ast(JS_CODE, {"globals": [], "functions": [], "externals": {}}, profiler=profiler)
+        stats = profiler.stats()
+        self.assertEqual(["lex", "parse"], list(stats["phases"]))
+        self.assertEqual(num_tokens + 1, stats["counters"]["tokens"])  # and EOF
+        self.assertGreater(stats["counters"]["nodes"], 10)
+
+    def test_backends(self):
+        js_code = "if (a > 1) b = 1; else b = 2;"  # the parser peeks the token after `;` for an `else`
+        for backend in lexer.g_lexer_backends:
+            profiler = Profiler()
+            parser.parse_code_to_ast(js_code, {"globals": [], "functions": [], "externals": {}}, backend, profiler)
+            self.assertEqual(16, profiler.stats()["counters"]["tokens"], backend)
+
+        with mock.patch.object(lexer, "tokenize", wraps=lambda code: (time.sleep(0.05), tokenize(code))[1]):
+            profiler = Profiler()
+            parser.parse_code_to_ast(JS_CODE, {"globals": [], "functions": [], "externals": {}}, "buffer", profiler)
+        self.assertGreaterEqual(profiler.stats()["phases"]["lex"]["seconds"], 0.05)  # tokenized when created
+
+    def test_engine(self):
+        js_runtime = JSEngine({}, profile_calls=True)
+        js_runtime.eval(JS_CODE)
+        js_runtime.eval(JS_CODE)
+        self.assertEqual(6, js_runtime.get("add3")(1, 2, 3))
+
+        stats = js_runtime.stats()
+        self.assertEqual(1, stats["phases"]["codegen"]["runs"])
+        self.assertEqual(2, stats["phases"]["exec"]["runs"])
+        self.assertEqual(1, stats["counters"]["cache_hits"])
+        self.assertGreater(stats["counters"]["code_size"], 0)
+        self.assertEqual({"calls": 1, "seconds": stats["functions"]["add3"]["seconds"]}, stats["functions"]["add3"])
+        self.assertEqual(2, stats["functions"]["add"]["calls"])
+
+    def test_disabled(self):
+        js_runtime = JSEngine({})
+        js_runtime.eval(JS_CODE)
+        self.assertIsNone(js_runtime.stats())
+        self.assertFalse(hasattr(js_runtime.get("add"), "__wrapped__"))
+
+
+if __name__ == '__main__':
+    unittest.main()
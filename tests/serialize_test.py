@@ -0,0 +1,94 @@
+import io
+import unittest
+
+from ..jsparser import ast
+from ..jsparser import codegen
+from ..jsparser import parser
+from ..jsparser import serialize
+from .parser_test import dump
+
+
+JS_CODE = """var foo = 1.5;
+// a comment
+function clamp(a, b) {
+    if (a > b) { return Math.max(b, foo); } else { return 0 - 1000; }
+    var c = (a + 2) * b / 3;
+    return c;
+}
+function none() {
+}
+print(clamp(1, 2));
+"""
+
+
+def parse(js_code):
+    return parser.parse_code_to_ast(js_code, {"globals": [], "functions": [], "externals": {"Math.max": "max"}})
+
+
+def spans(ctx):
+    return [node.span for key in ("globals", "functions") for root in ctx[key] for node in ast.walk(root)]
+
+
+class SerializeTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        ctx = parse(JS_CODE)
+        out = io.BytesIO()
+        serialize.dump(ctx, out)
+        out.seek(0)
+        loaded = serialize.load(out)
+        self.assertEqual(dump(ctx['globals']), dump(loaded['globals']))
+        self.assertEqual(dump(ctx['functions']), dump(loaded['functions']))
+        self.assertEqual(ctx['externals'], loaded['externals'])
+        self.assertEqual(spans(ctx), spans(loaded))
+        self.assertIs(loaded['globals'][0].proto, loaded['globals'][1].proto)
+        self.assertEqual(ctx['lines'].line_starts(), loaded['lines'].line_starts())
+        self.assertEqual(codegen.generate_python_code(ctx), codegen.generate_python_code(loaded))
+
+    def test_no_spans(self):
+        ctx = {"globals": [], "functions": [ast.FunctionAST(ast.PrototypeAST("f", ["a"]), ast.BlockExprAST(0, [
+            ast.ReturnExprAST(ast.BinaryExprAST(ast.VariableExprAST("a"), "-", ast.NumberExprAST(-0.5)))]))]}
+        loaded = serialize.loads(serialize.dumps(ctx))
+        self.assertEqual(dump(ctx['functions']), dump(loaded['functions']))
+        self.assertEqual({None}, set(spans(loaded)))
+        self.assertNotIn("lines", loaded)
+
+    def test_numbers(self):
+        values = [0.0, 1.0, 1000.0, -3.0, -0.0, 0.5, -2.25, 1e300, 2.0 ** 60, float("inf"), 12345678901.0]
+        body = ast.BlockExprAST(0, [ast.ReturnExprAST(ast.CallExprAST("f", [ast.NumberExprAST(v) for v in values]))])
+        ctx = {"globals": [], "functions": [ast.FunctionAST(ast.PrototypeAST("g", []), body)]}
+        loaded = serialize.loads(serialize.dumps(ctx))
+        loaded_values = [arg.value for arg in loaded['functions'][0].body.body_expr[0].rhs.args]
+        self.assertEqual([repr(v) for v in values], [repr(v) for v in loaded_values])  # -0.0 stays negative
+
+    def test_size(self):
+        js_code = "".join("function f%d(a, b) {\n    var c = a * %d + b / 2.5;\n    return c - 1;\n}\n" % (i, i)
+                          for i in range(200))
+        data = serialize.dumps(parse(js_code))
+        self.assertLess(len(data), len(js_code))  # varints, the spans of the statements only
+
+    def test_deep_tree(self):
+        depth = 20000  # deeper than the recursion limit
+        expr = ast.NumberExprAST(1.0)
+        for _ in range(depth):
+            expr = ast.BinaryExprAST(ast.NumberExprAST(2.0), "+", expr)
+        function_ast = ast.FunctionAST(ast.PrototypeAST("f", []), ast.BlockExprAST(0, [ast.ReturnExprAST(expr)]))
+        loaded = serialize.loads(serialize.dumps({"globals": [], "functions": [function_ast]}))
+        expr = loaded['functions'][0].body.body_expr[0].rhs
+        for _ in range(depth):
+            self.assertEqual("+", expr.op)
+            expr = expr.rhs
+        self.assertEqual(1.0, expr.value)
+
+    def test_invalid_data(self):
+        data = serialize.dumps(parse(JS_CODE))
+        with self.assertRaisesRegex(ValueError, "not a serialized AST"):
+            serialize.loads(b"var foo = 1;")
+        with self.assertRaisesRegex(ValueError, "unsupported AST format version"):
+            serialize.loads(serialize.MAGIC + bytes((serialize.FORMAT_VERSION + 1,)) + data[len(serialize.MAGIC) + 1:])
+        with self.assertRaisesRegex(ValueError, "truncated"):
+            serialize.loads(data[:len(data) // 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
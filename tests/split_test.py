@@ -0,0 +1,26 @@
+import unittest
+
+from ..jsparser import parser
+from ..jsparser import split
+
+
+class SplitTest(unittest.TestCase):
+
+    def test_split_deep(self):
+        ctx = {"globals": [], "functions": []}
+        parser.parse_code_to_ast("function f(a, b) { if (g(a) + (b + (b + (b + 1)))) { return a; } }", ctx)
+        statement = ctx['functions'][0].body.body_expr[0]
+        names = iter(["_t0", "_t1", "_t2"])
+        statements = split.split_deep(statement, 4, lambda: next(names))
+        # the operands evaluated before the deep one are assigned first, the deep one could change `b`
+        self.assertEqual(["_t0 = g(a)", "_t1 = b", "_t2 = (b + (b + 1.0))", "if (_t0 + (_t1 + _t2)):\n    return a"],
+                         [str(node) for node in statements])
+        self.assertEqual("(g(a) + (b + (b + (b + 1.0))))", str(statement.cond_expr))  # not changed
+
+    def test_temp_names(self):
+        new_temp = split.TempNames()
+        self.assertEqual(["_jstmp0", "_jstmp1"], [new_temp(), new_temp()])
+
+
+if __name__ == '__main__':
+    unittest.main()
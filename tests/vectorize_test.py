@@ -0,0 +1,126 @@
+import unittest
+
+from ..jsparser import parser
+from ..jsparser import vectorize
+from ..jsparser.engine import JSEngine
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+JS_CODE = """
+function clamp(a, b) {
+    var d = a * 2;
+    if (d > b) {
+        return b;
+    }
+    return Math.max(d, Math.min(a, b, 0)) + bar;
+}
+
+function log_all(a) {
+    log(a);
+    return a;
+}
+"""
+
+
+class VectorizeTest(unittest.TestCase):
+
+    def parse(self, js_code):
+        ctx = {"globals": [], "functions": [], "externals": {"Math.max": "max", "Math.min": "min"}}
+        return parser.parse_code_to_ast(js_code, ctx)
+
+    def test_vectorize_source(self):
+        ctx = self.parse(JS_CODE)
+        self.assertEqual("def clamp(a, b):\n"
+                         "    _t0 = (a * 2.0)\n"
+                         "    return np.where((_t0 > b), b, (np.maximum(_t0, np.minimum(np.minimum(a, b), 0.0)) + g['bar']))\n",
+                         vectorize.vectorize_source(ctx['functions'][0]))
+
+    def test_error(self):
+        ctx = self.parse(JS_CODE)
+        with self.assertRaises(vectorize.VectorizeError) as cm:
+            vectorize.vectorize_source(ctx['functions'][1])
+        self.assertEqual("can not vectorize function log_all: unsupported statement CallExprAST", str(cm.exception))
+
+        ctx = self.parse("function f(a) { if (a > 0) { return a; } }")
+        with self.assertRaisesRegex(vectorize.VectorizeError, "not every path returns a value"):
+            vectorize.vectorize_source(ctx['functions'][0])
+
+        js_runtime = JSEngine({})
+        js_runtime.eval(JS_CODE)
+        with self.assertRaises(vectorize.VectorizeError):
+            js_runtime.vectorize("log_all")
+        with self.assertRaises(KeyError):
+            js_runtime.vectorize("bar")
+
+    def test_sequential_ifs(self):
+        js_code = "function f(a, b) {\n    var d = 0;\n%s    return d;\n}\n" % "".join(
+            "    if (a > %d) { d = d + b; }\n" % k for k in range(40))
+        source = vectorize.vectorize_source(self.parse(js_code)['functions'][0])
+        self.assertLess(len(source), 4000)  # linear in the number of ifs
+        self.assertIn("    _t2 = np.where((a > 0.0), _t1, _t0)\n", source)
+
+        ctx = self.parse("""
+function g(a, b) {
+    var d = a;
+    if (a > 1) { d = d * 2; if (b > 1) { return d; } } else { d = b; }
+    if (d > 3) { return 0; }
+    return d + 1;
+}
+""")
+        self.assertEqual("def g(a, b):\n"
+                         "    _t0 = a\n"
+                         "    _t1 = (_t0 * 2.0)\n"
+                         "    _t2 = b\n"
+                         "    _t3 = (a > 1.0)\n"
+                         "    _t4 = np.where(_t3, _t1, _t2)\n"
+                         "    return np.where(np.logical_and(_t3, (b > 1.0)), _t1, np.where((_t4 > 3.0), 0.0, (_t4 + 1.0)))\n",
+                         vectorize.vectorize_source(ctx['functions'][0]))
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_engine_ifs(self):
+        js_code = """
+function f(a, b) {
+    var d = 0;
+    if (a > 0) { d = d + b; } else { d = d - 1; }
+    if (a > 1) { d = d * 2; if (b > 1) { return d; } } else { d = b; }
+    if (d > 3) { return 0; }
+    if (a > 2) { return 1; } else { d = d + 5; }
+    return d + a;
+}
+"""
+        js_runtime = JSEngine({})
+        js_runtime.eval(js_code)
+        f = js_runtime.get("f")
+        a = np.array([-1.0, 0.5, 1.5, 2.5, 3.0, 1.5])
+        b = np.array([0.5, 2.0, 0.5, 0.5, 3.0, 3.0])
+        self.assertEqual([f(x, y) for x, y in zip(a, b)], list(js_runtime.vectorize("f")(a, b)))
+
+    def test_deep_expressions(self):
+        ctx = self.parse("function f(a) { return " + " + ".join(["a"] * 3000) + "; }")
+        source = vectorize.vectorize_source(ctx['functions'][0])
+        self.assertLess(max(line.count("(") for line in source.splitlines()), 200)  # python's parser limit
+        if np is not None:
+            f = vectorize.vectorize_function(ctx['functions'][0], {})
+            self.assertEqual([3000.0, 6000.0], list(f(np.array([1.0, 2.0]))))
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_engine(self):
+        js_runtime = JSEngine({})
+        js_runtime.set("bar", 10)
+        js_runtime.eval(JS_CODE)
+        clamp = js_runtime.get("clamp")
+        vectorized = js_runtime.vectorize("clamp")
+        self.assertIs(vectorized, js_runtime.vectorize("clamp"))
+
+        a = np.array([-3.0, -1.0, 0.5, 2.0, 4.0])
+        b = np.array([1.0, -5.0, 2.0, 3.0, 9.0])
+        expected = [clamp(x, y) for x, y in zip(a, b)]
+        self.assertEqual(expected, list(vectorized(a, b)))
+
+
+if __name__ == '__main__':
+    unittest.main()